@@ -12,6 +12,8 @@ from aws_cdk import (
     aws_cognito as cognito,
     aws_sqs as sqs,
     aws_lambda_event_sources as lambda_event_sources,
+    aws_events as events,
+    aws_events_targets as targets,
     RemovalPolicy,
     Duration,
     CfnOutput
@@ -111,7 +113,13 @@ class BedrockDiyStack(Stack):
         # 8. SQS 큐 및 배치 처리 시스템 생성
         self.create_batch_processing_system()
         
-        # 9. CDK 출력값 생성
+        # 9. 보관 기사 백필 (Bedrock 배치 추론)
+        self.create_backfill_system()
+        
+        # 10. 프롬프트 카드 오프라인 평가
+        self.create_evaluation_system()
+        
+        # 11. CDK 출력값 생성
         self.create_outputs()
 
 
@@ -171,6 +179,24 @@ class BedrockDiyStack(Stack):
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             removal_policy=RemovalPolicy.DESTROY
         )
+        
+        # 활성 카드 sparse 인덱스 (activeFlag는 활성 카드에만 존재, 정렬 키는 {projectId|GLOBAL}#{createdAt})
+        self.prompt_meta_table.add_global_secondary_index(
+            index_name="active-index",
+            partition_key=dynamodb.Attribute(
+                name="activeFlag",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="activeSortKey",
+                type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.INCLUDE,
+            non_key_attributes=[
+                "title", "content", "threshold", "isActive", "s3Key", "tags",
+                "projectId", "createdAt", "updatedAt", "version", "selectionMode"
+            ]
+        )
 
 
         # =============================================================================
@@ -189,6 +215,22 @@ class BedrockDiyStack(Stack):
             removal_policy=RemovalPolicy.DESTROY
         )
         
+        # 프롬프트 카드 버전 이력 (추가 전용, 메타 테이블 카드 항목의 version이 활성 버전 포인터)
+        self.prompt_versions_table = dynamodb.Table(
+            self, "PromptVersionsTable",
+            table_name=f"{self.project_prefix}-prompt-versions-{self.env_suffix}",
+            partition_key=dynamodb.Attribute(
+                name="promptId",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="version",
+                type=dynamodb.AttributeType.NUMBER
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        
         # 사용자 관리 테이블 (인증을 위해 필요)
         self.users_table = dynamodb.Table(
             self, "UsersTable",
@@ -250,6 +292,23 @@ class BedrockDiyStack(Stack):
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             removal_policy=RemovalPolicy.DESTROY
         )
+        
+        # 에이전트 사고 로그 테이블 (PK=SESSION#{sessionId}, SK=THOUGHT#{timestamp}#{순번}, 30일 TTL)
+        self.agent_thoughts_table = dynamodb.Table(
+            self, "AgentThoughtsTable",
+            table_name=f"{self.project_prefix}-agent-thoughts-{self.env_suffix}",
+            partition_key=dynamodb.Attribute(
+                name="PK",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="SK",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="ttl"
+        )
 
 
     def create_lambda_functions(self):
@@ -275,8 +334,10 @@ class BedrockDiyStack(Stack):
                     "dynamodb:PutItem",
                     "dynamodb:UpdateItem",
                     "dynamodb:GetItem",
+                    "dynamodb:BatchGetItem",
                     "dynamodb:DeleteItem",
                     "dynamodb:Scan",
+                    "dynamodb:BatchWriteItem",
                     "bedrock:InvokeModel",
                     "bedrock:InvokeModelWithResponseStream",
                     # Cognito 권한 추가
@@ -295,7 +356,10 @@ class BedrockDiyStack(Stack):
                     self.article_bucket.bucket_arn,
                     self.article_bucket.bucket_arn + "/*",
                     self.prompt_meta_table.table_arn,
+                    self.prompt_meta_table.table_arn + "/index/active-index",
                     self.prompt_instance_table.table_arn,
+                    self.prompt_versions_table.table_arn,
+                    self.agent_thoughts_table.table_arn,
                     self.users_table.table_arn,
                     self.users_table.table_arn + "/index/email-index",
                     # Cognito
@@ -305,18 +369,30 @@ class BedrockDiyStack(Stack):
             )
         )
 
+        # 0. 공유 Lambda 레이어 (Bedrock 제공자 추상화 등, /opt/python으로 배포)
+        self.shared_layer = lambda_.LayerVersion(
+            self, "SharedLayer",
+            layer_version_name=f"{self.project_prefix}-shared-{self.env_suffix}",
+            code=lambda_.Code.from_asset("../lambda/shared"),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_11],
+            description="Lambda 함수 간 공유 모듈"
+        )
+
         # 1. 제목 생성 Lambda (핵심 기능) - 대용량 처리를 위해 메모리 증가
         self.generate_lambda = lambda_.Function(
             self, "GenerateFunction",
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="generate.handler",
             code=lambda_.Code.from_asset("../lambda/generate"),
+            layers=[self.shared_layer],
             timeout=Duration.minutes(15),
             memory_size=10240,  # 10GB로 증가 (최대 허용치)
             role=lambda_role,
             environment={
                 "PROMPT_META_TABLE": self.prompt_meta_table.table_name,
                 "PROMPT_BUCKET": self.prompt_bucket.bucket_name,
+                "PROMPT_INSTANCE_TABLE": self.prompt_instance_table.table_name,
+                "PROMPT_VERSIONS_TABLE": self.prompt_versions_table.table_name,
                 "REGION": self.region,
             }
         )
@@ -333,12 +409,15 @@ class BedrockDiyStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="save_prompt.handler",
             code=lambda_.Code.from_asset("../lambda/save_prompt"),
+            layers=[self.shared_layer],
             timeout=Duration.minutes(2),
             memory_size=512,
             role=lambda_role,
             environment={
                 "PROMPT_META_TABLE": self.prompt_meta_table.table_name,
                 "PROMPT_BUCKET": self.prompt_bucket.bucket_name,
+                "AGENT_THOUGHTS_TABLE": self.agent_thoughts_table.table_name,
+                "PROMPT_VERSIONS_TABLE": self.prompt_versions_table.table_name,
                 "REGION": self.region,
             }
         )
@@ -418,7 +497,7 @@ class BedrockDiyStack(Stack):
                 integration_responses=[{
                     'statusCode': '200',
                     'responseParameters': {
-                        'method.response.header.Access-Control-Allow-Headers': "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'",
+                        'method.response.header.Access-Control-Allow-Headers': "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match'",
                         'method.response.header.Access-Control-Allow-Origin': "'*'",
                         'method.response.header.Access-Control-Allow-Methods': f"'{allowed_methods}'"
                     }
@@ -514,6 +593,15 @@ class BedrockDiyStack(Stack):
         
         # CORS 옵션 추가
         self._create_cors_options_method(generate_resource, "POST,OPTIONS")
+        
+        # GET /generate/jobs/{id} (배치 작업 진행 상황 및 결과)
+        job_resource = generate_resource.add_resource("jobs").add_resource("{id}")
+        job_resource.add_method(
+            "GET",
+            apigateway.LambdaIntegration(self.generate_lambda, proxy=True),
+            authorization_type=apigateway.AuthorizationType.NONE
+        )
+        self._create_cors_options_method(job_resource, "GET,OPTIONS")
 
     def create_prompt_routes(self):
         """프롬프트 관리 API 경로 생성"""
@@ -563,6 +651,42 @@ class BedrockDiyStack(Stack):
         # CORS 옵션 추가
         self._create_cors_options_method(prompt_card_resource, "GET,PUT,DELETE,OPTIONS")
         
+        # POST /prompts/{promptId}/evaluate (골든 코퍼스 오프라인 평가 시작)
+        evaluate_resource = prompt_card_resource.add_resource("evaluate")
+        evaluate_resource.add_method(
+            "POST",
+            apigateway.LambdaIntegration(self.save_prompt_lambda, proxy=True),
+            authorization_type=apigateway.AuthorizationType.NONE
+        )
+        self._create_cors_options_method(evaluate_resource, "POST,OPTIONS")
+        
+        # GET /prompts/{promptId}/versions (카드 버전 이력 조회)
+        versions_resource = prompt_card_resource.add_resource("versions")
+        versions_resource.add_method(
+            "GET",
+            apigateway.LambdaIntegration(self.save_prompt_lambda, proxy=True),
+            authorization_type=apigateway.AuthorizationType.NONE
+        )
+        self._create_cors_options_method(versions_resource, "GET,OPTIONS")
+        
+        # POST /prompts/{promptId}/activate (이력의 버전을 활성 버전으로 전환)
+        activate_resource = prompt_card_resource.add_resource("activate")
+        activate_resource.add_method(
+            "POST",
+            apigateway.LambdaIntegration(self.save_prompt_lambda, proxy=True),
+            authorization_type=apigateway.AuthorizationType.NONE
+        )
+        self._create_cors_options_method(activate_resource, "POST,OPTIONS")
+        
+        # GET /thoughts/{sessionId} (평가 세션 사고 로그 페이지 조회)
+        thoughts_resource = self.api.root.add_resource("thoughts").add_resource("{sessionId}")
+        thoughts_resource.add_method(
+            "GET",
+            apigateway.LambdaIntegration(self.save_prompt_lambda, proxy=True),
+            authorization_type=apigateway.AuthorizationType.NONE
+        )
+        self._create_cors_options_method(thoughts_resource, "GET,OPTIONS")
+        
         # 대화 관리 API 경로 추가
         self.create_conversation_routes()
 
@@ -715,6 +839,23 @@ class BedrockDiyStack(Stack):
             time_to_live_attribute="ttl"
         )
         
+        # 스트림 델타 버퍼 테이블 (재연결 시 누락 구간 재전송용, TTL로 자동 정리)
+        self.stream_buffer_table = dynamodb.Table(
+            self, "StreamBufferTable",
+            table_name=f"{self.project_prefix}-stream-buffer-{self.env_suffix}",
+            partition_key=dynamodb.Attribute(
+                name="streamId",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="seq",
+                type=dynamodb.AttributeType.NUMBER
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="ttl"
+        )
+        
         # WebSocket Lambda 함수들용 공통 역할
         websocket_lambda_role = iam.Role(
             self, "WebSocketLambdaRole",
@@ -733,17 +874,28 @@ class BedrockDiyStack(Stack):
                     "dynamodb:PutItem",
                     "dynamodb:DeleteItem",
                     "dynamodb:GetItem",
+                    "dynamodb:BatchGetItem",
+                    "dynamodb:UpdateItem",
+                    "dynamodb:BatchWriteItem",
                     "dynamodb:Query",
                     "dynamodb:Scan",
                     "s3:GetObject",
+                    "s3:PutObject",
                     "bedrock:InvokeModel",
                     "bedrock:InvokeModelWithResponseStream"
                 ],
                 resources=[
                     f"arn:aws:execute-api:{self.region}:{self.account}:*/*/*",
                     self.websocket_connections_table.table_arn,
+                    self.stream_buffer_table.table_arn,
                     self.prompt_meta_table.table_arn,
-                    self.prompt_bucket.bucket_arn + "/*"
+                    self.prompt_meta_table.table_arn + "/index/active-index",
+                    self.prompt_instance_table.table_arn,
+                    self.prompt_versions_table.table_arn,
+                    self.conversations_table.table_arn,
+                    self.messages_table.table_arn,
+                    self.prompt_bucket.bucket_arn + "/*",
+                    self.article_bucket.bucket_arn + "/messages/*"
                 ]
             )
         )
@@ -754,11 +906,19 @@ class BedrockDiyStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="connect.handler",
             code=lambda_.Code.from_asset("../lambda/websocket"),
+            layers=[self.shared_layer],
             timeout=Duration.minutes(1),
             memory_size=256,
             role=websocket_lambda_role,
             environment={
                 "CONNECTIONS_TABLE": self.websocket_connections_table.table_name,
+                "PROMPT_META_TABLE": self.prompt_meta_table.table_name,
+                "PROMPT_BUCKET": self.prompt_bucket.bucket_name,
+                "MESSAGES_TABLE": self.messages_table.table_name,
+                "CONVERSATIONS_TABLE": self.conversations_table.table_name,
+                "MESSAGE_BUCKET": self.article_bucket.bucket_name,
+                "USER_POOL_ID": self.user_pool.user_pool_id,
+                "USER_POOL_CLIENT_ID": self.user_pool_client.user_pool_client_id,
                 "REGION": self.region
             }
         )
@@ -769,6 +929,7 @@ class BedrockDiyStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="disconnect.handler",
             code=lambda_.Code.from_asset("../lambda/websocket"),
+            layers=[self.shared_layer],
             timeout=Duration.minutes(1),
             memory_size=256,
             role=websocket_lambda_role,
@@ -784,6 +945,7 @@ class BedrockDiyStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="stream.handler",
             code=lambda_.Code.from_asset("../lambda/websocket"),
+            layers=[self.shared_layer],
             timeout=Duration.minutes(15),
             memory_size=10240,  # 10GB로 증가 (최대 허용치)
             role=websocket_lambda_role,
@@ -791,10 +953,14 @@ class BedrockDiyStack(Stack):
                 "CONNECTIONS_TABLE": self.websocket_connections_table.table_name,
                 "PROMPT_META_TABLE": self.prompt_meta_table.table_name,
                 "PROMPT_BUCKET": self.prompt_bucket.bucket_name,
+                "PROMPT_INSTANCE_TABLE": self.prompt_instance_table.table_name,
+                "PROMPT_VERSIONS_TABLE": self.prompt_versions_table.table_name,
                 "REGION": self.region,
                 "USE_LANGGRAPH": "false",  # LangGraph 기능 비활성화 (우선 기본 스트리밍 테스트)
                 "CONVERSATIONS_TABLE": self.conversations_table.table_name,
                 "MESSAGES_TABLE": self.messages_table.table_name,
+                "STREAM_BUFFER_TABLE": self.stream_buffer_table.table_name,
+                "MESSAGE_BUCKET": self.article_bucket.bucket_name,
             }
         )
         
@@ -826,6 +992,24 @@ class BedrockDiyStack(Stack):
             )
         )
         
+        # 대용량 입력 후속 프레임 라우트
+        self.websocket_api.add_route(
+            "stream_chunk",
+            integration=integrations.WebSocketLambdaIntegration(
+                "StreamChunkIntegration",
+                self.websocket_stream_lambda
+            )
+        )
+        
+        # 끊긴 스트림 재개 라우트
+        self.websocket_api.add_route(
+            "resume",
+            integration=integrations.WebSocketLambdaIntegration(
+                "ResumeIntegration",
+                self.websocket_stream_lambda
+            )
+        )
+        
         # WebSocket API Stage 생성
         self.websocket_stage = apigatewayv2.WebSocketStage(
             self, "WebSocketStage",
@@ -846,25 +1030,53 @@ class BedrockDiyStack(Stack):
     def create_batch_processing_system(self):
         """대용량 문서 처리를 위한 SQS 및 배치 시스템 생성"""
         
-        # 배치 작업 상태 추적 테이블
+        # 배치 작업 상태 추적 테이블 (매니페스트 + 청크 항목, 키 구조 변경으로 테이블명 변경)
         self.batch_jobs_table = dynamodb.Table(
             self, "BatchJobsTable",
-            table_name=f"{self.project_prefix}-batch-jobs-{self.env_suffix}",
+            table_name=f"{self.project_prefix}-batch-job-chunks-{self.env_suffix}",
             partition_key=dynamodb.Attribute(
                 name="job_id",
                 type=dynamodb.AttributeType.STRING
             ),
+            sort_key=dynamodb.Attribute(
+                name="chunk_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="ttl"
+        )
+        
+        # Bedrock 호출 속도 제어 상태 (모델별 AIMD 동시성 한도, TPM 예산, 사용자별 스트림 lease)
+        self.rate_control_table = dynamodb.Table(
+            self, "RateControlTable",
+            table_name=f"{self.project_prefix}-rate-control-{self.env_suffix}",
+            partition_key=dynamodb.Attribute(
+                name="pk",
+                type=dynamodb.AttributeType.STRING
+            ),
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             removal_policy=RemovalPolicy.DESTROY,
             time_to_live_attribute="ttl"
         )
         
-        # 대용량 처리용 SQS 큐
+        # 재시도 한도를 넘긴 청크 메시지 (소비 Lambda가 청크/작업을 최종 실패로 기록)
+        self.batch_dead_letter_queue = sqs.Queue(
+            self, "BatchDeadLetterQueue",
+            queue_name=f"{self.project_prefix}-batch-dlq-{self.env_suffix}",
+            retention_period=Duration.days(14)
+        )
+        
+        # 대용량 처리용 SQS 큐 (항상 실패하는 청크는 4회 수신 후 DLQ로 이동)
         self.batch_queue = sqs.Queue(
             self, "BatchQueue",
             queue_name=f"{self.project_prefix}-batch-queue-{self.env_suffix}",
             visibility_timeout=Duration.minutes(15),
-            receive_message_wait_time=Duration.seconds(20)
+            receive_message_wait_time=Duration.seconds(20),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=4,
+                queue=self.batch_dead_letter_queue
+            )
         )
         
         # 배치 처리 Lambda 역할
@@ -884,16 +1096,24 @@ class BedrockDiyStack(Stack):
                     "sqs:ReceiveMessage",
                     "sqs:DeleteMessage",
                     "sqs:GetQueueAttributes",
+                    "sqs:ChangeMessageVisibility",
+                    "sqs:SendMessage",
                     "dynamodb:PutItem",
                     "dynamodb:UpdateItem",
                     "dynamodb:GetItem",
+                    "dynamodb:DeleteItem",
+                    "dynamodb:Query",
                     "s3:GetObject",
                     "bedrock:InvokeModel",
+                    "bedrock:InvokeModelWithResponseStream",
                     "execute-api:ManageConnections"
                 ],
                 resources=[
                     self.batch_queue.queue_arn,
+                    self.batch_dead_letter_queue.queue_arn,
                     self.batch_jobs_table.table_arn,
+                    self.rate_control_table.table_arn,
+                    self.websocket_connections_table.table_arn,
                     self.prompt_meta_table.table_arn,
                     self.prompt_bucket.bucket_arn + "/*",
                     f"arn:aws:execute-api:{self.region}:{self.account}:*/*/*"
@@ -901,16 +1121,203 @@ class BedrockDiyStack(Stack):
             )
         )
         
+        # 배치 처리 Lambda (SQS 트리거, 실패한 레코드만 재시도)
+        self.batch_processor_lambda = lambda_.Function(
+            self, "BatchProcessorFunction",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="batch_processor.handler",
+            code=lambda_.Code.from_asset("../lambda/batch"),
+            layers=[self.shared_layer],
+            timeout=Duration.minutes(15),
+            memory_size=1024,
+            role=batch_lambda_role,
+            environment={
+                "BATCH_JOBS_TABLE": self.batch_jobs_table.table_name,
+                "CONNECTIONS_TABLE": self.websocket_connections_table.table_name,
+                "RATE_CONTROL_TABLE": self.rate_control_table.table_name,
+                "REGION": self.region,
+                "BATCH_MAX_WORKERS": "10"
+            }
+        )
+        
+        self.batch_processor_lambda.add_event_source(
+            lambda_event_sources.SqsEventSource(
+                self.batch_queue,
+                batch_size=10,
+                max_batching_window=Duration.seconds(5),
+                report_batch_item_failures=True
+            )
+        )
+        
+        # DLQ 소비 Lambda (청크와 작업을 최종 실패로 기록하여 상태 조회 API에 반영)
+        self.batch_dead_letter_lambda = lambda_.Function(
+            self, "BatchDeadLetterFunction",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="batch_processor.dead_letter_handler",
+            code=lambda_.Code.from_asset("../lambda/batch"),
+            layers=[self.shared_layer],
+            timeout=Duration.minutes(1),
+            memory_size=256,
+            role=batch_lambda_role,
+            environment={
+                "BATCH_JOBS_TABLE": self.batch_jobs_table.table_name,
+                "CONNECTIONS_TABLE": self.websocket_connections_table.table_name,
+                "RATE_CONTROL_TABLE": self.rate_control_table.table_name,
+                "REGION": self.region
+            }
+        )
+        self.batch_dead_letter_lambda.add_event_source(
+            lambda_event_sources.SqsEventSource(self.batch_dead_letter_queue, batch_size=10)
+        )
+        
         # 기존 generate Lambda에 SQS 권한 추가
         self.generate_lambda.role.add_to_policy(
             iam.PolicyStatement(
-                actions=["sqs:SendMessage", "dynamodb:PutItem"],
+                actions=["sqs:SendMessage", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:BatchWriteItem", "dynamodb:Query"],
                 resources=[self.batch_queue.queue_arn, self.batch_jobs_table.table_arn]
             )
         )
         
+        # 대화형 Lambda도 같은 TPM 예산을 공유 (배치보다 우선), 사용자별 동시 스트림 제한 적용
+        for interactive_lambda in (self.generate_lambda, self.websocket_stream_lambda):
+            interactive_lambda.add_environment("RATE_CONTROL_TABLE", self.rate_control_table.table_name)
+            interactive_lambda.add_environment("MAX_STREAMS_PER_USER", "3")
+            interactive_lambda.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=["dynamodb:GetItem", "dynamodb:UpdateItem"],
+                    resources=[self.rate_control_table.table_arn]
+                )
+            )
+        
         # 환경 변수 추가
         self.generate_lambda.add_environment("BATCH_QUEUE_URL", self.batch_queue.queue_url)
         self.generate_lambda.add_environment("BATCH_JOBS_TABLE", self.batch_jobs_table.table_name)
 
- 
\ No newline at end of file
+    def create_backfill_system(self):
+        """Bedrock 배치 추론 기반 보관 기사 제목 백필 (제출 Lambda + 예약 상태 확인)"""
+        
+        # Bedrock이 배치 입력/출력 JSONL을 읽고 쓰는 서비스 역할
+        backfill_service_role = iam.Role(
+            self, "BackfillBedrockServiceRole",
+            assumed_by=iam.ServicePrincipal("bedrock.amazonaws.com")
+        )
+        backfill_service_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject", "s3:PutObject", "s3:ListBucket"],
+                resources=[
+                    self.article_bucket.bucket_arn,
+                    self.article_bucket.bucket_arn + "/backfill/*"
+                ]
+            )
+        )
+        
+        self.backfill_lambda = lambda_.Function(
+            self, "BackfillFunction",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="backfill.handler",
+            code=lambda_.Code.from_asset("../lambda/backfill"),
+            layers=[self.shared_layer],
+            timeout=Duration.minutes(15),
+            memory_size=1024,
+            environment={
+                "BATCH_JOBS_TABLE": self.batch_jobs_table.table_name,
+                "BACKFILL_BUCKET": self.article_bucket.bucket_name,
+                "BACKFILL_ROLE_ARN": backfill_service_role.role_arn,
+                "REGION": self.region
+            }
+        )
+        self.backfill_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "dynamodb:PutItem",
+                    "dynamodb:UpdateItem",
+                    "dynamodb:GetItem",
+                    "dynamodb:DeleteItem",
+                    "dynamodb:Query",
+                    "dynamodb:BatchWriteItem",
+                    "s3:GetObject",
+                    "s3:PutObject",
+                    "s3:ListBucket"
+                ],
+                resources=[
+                    self.batch_jobs_table.table_arn,
+                    self.article_bucket.bucket_arn,
+                    self.article_bucket.bucket_arn + "/*"
+                ]
+            )
+        )
+        self.backfill_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["bedrock:CreateModelInvocationJob", "bedrock:GetModelInvocationJob"],
+                resources=["*"]
+            )
+        )
+        self.backfill_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["iam:PassRole"],
+                resources=[backfill_service_role.role_arn]
+            )
+        )
+        
+        # 진행 중인 배치 추론 작업 상태 확인 (완료 시 결과를 배치 작업 테이블에 반영)
+        events.Rule(
+            self, "BackfillPollSchedule",
+            schedule=events.Schedule.rate(Duration.minutes(10)),
+            targets=[targets.LambdaFunction(
+                self.backfill_lambda,
+                event=events.RuleTargetInput.from_object({"action": "poll"})
+            )]
+        )
+
+    def create_evaluation_system(self):
+        """프롬프트 카드 오프라인 평가 (골든 코퍼스 실행, 지연 시간/토큰 보고서)"""
+        self.evaluation_lambda = lambda_.Function(
+            self, "PromptEvaluationFunction",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="evaluation.handler",
+            code=lambda_.Code.from_asset("../lambda/evaluation"),
+            layers=[self.shared_layer],
+            timeout=Duration.minutes(15),
+            memory_size=1024,
+            environment={
+                "PROMPT_META_TABLE": self.prompt_meta_table.table_name,
+                "PROMPT_BUCKET": self.prompt_bucket.bucket_name,
+                # 골든 코퍼스(evaluation/golden/)와 보고서(evaluation/reports/)는 프롬프트 버킷에 저장
+                "EVALUATION_BUCKET": self.prompt_bucket.bucket_name,
+                "AGENT_THOUGHTS_TABLE": self.agent_thoughts_table.table_name,
+                "PROMPT_VERSIONS_TABLE": self.prompt_versions_table.table_name,
+                "RATE_CONTROL_TABLE": self.rate_control_table.table_name,
+                "REGION": self.region
+            }
+        )
+        self.evaluation_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "dynamodb:GetItem",
+                    "dynamodb:BatchGetItem",
+                    "dynamodb:UpdateItem",
+                    "dynamodb:BatchWriteItem",
+                    "s3:GetObject",
+                    "s3:PutObject",
+                    "s3:ListBucket"
+                ],
+                resources=[
+                    self.prompt_meta_table.table_arn,
+                    self.prompt_versions_table.table_arn,
+                    self.agent_thoughts_table.table_arn,
+                    self.rate_control_table.table_arn,
+                    self.prompt_bucket.bucket_arn,
+                    self.prompt_bucket.bucket_arn + "/*"
+                ]
+            )
+        )
+        self.evaluation_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["bedrock:InvokeModelWithResponseStream"],
+                resources=["*"]
+            )
+        )
+        
+        # 카드 저장 Lambda가 평가를 비동기로 시작
+        self.evaluation_lambda.grant_invoke(self.save_prompt_lambda)
+        self.save_prompt_lambda.add_environment("PROMPT_EVALUATION_FUNCTION", self.evaluation_lambda.function_name)
@@ -19,7 +19,7 @@ const AdminView = ({ projectId: propProjectId, projectName: propProjectName }) =
     try {
       setLoading(true);
       console.log("🔄 AdminView - 프롬프트 카드 로드 시작");
-      const response = await promptCardAPI.getPromptCards(projectId, true);
+      const response = await promptCardAPI.getPromptCards(true);
       setPromptCards(response.promptCards || []);
       console.log("✅ AdminView - 프롬프트 카드 로드 완료:", response.promptCards?.length || 0);
     } catch (error) {
@@ -12,7 +12,7 @@ const UserView = ({ projectId, projectName }) => {
       try {
         setLoading(true);
         // AdminView와 동일하게 includeContent=true로 설정하여 프롬프트 내용을 포함하여 로드
-        const response = await promptCardAPI.getPromptCards(projectId, true);
+        const response = await promptCardAPI.getPromptCards(true);
         // 응답 구조가 AdminView와 동일하게 처리
         setPromptCards(response.promptCards || []);
       } catch (error) {
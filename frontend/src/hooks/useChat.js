@@ -152,6 +152,7 @@ export const useChat = (
     "apac.anthropic.claude-sonnet-4-20250514-v1:0"  // Claude 4.0 기본 모델
   );
   const streamingMessageIdRef = useRef(null);
+  const lastStreamSeqRef = useRef(0); // 재연결 재전송 시 중복 청크 무시
   const currentWebSocketRef = useRef(null);
   const currentExecutionIdRef = useRef(null);
 
@@ -178,7 +179,7 @@ export const useChat = (
     startStreaming: wsStartStreaming,
     addMessageListener,
     removeMessageListener,
-  } = useWebSocket();
+  } = useWebSocket({ conversationId });
 
   // 초기 메시지 설정 - conversationId 변경시 초기화
   useEffect(() => {
@@ -232,6 +233,7 @@ export const useChat = (
         switch (data.type) {
           case "stream_start":
             console.log("WebSocket 스트리밍 시작");
+            lastStreamSeqRef.current = 0;
             break;
 
           case "progress":
@@ -275,6 +277,12 @@ export const useChat = (
             break;
 
           case "stream_chunk":
+            if (data.seq) {
+              if (data.seq <= lastStreamSeqRef.current) {
+                break;
+              }
+              lastStreamSeqRef.current = data.seq;
+            }
             if (currentStreamingId) {
               setMessages((prev) => {
                 const updatedMessages = [...prev];
@@ -1,9 +1,44 @@
 import { useState, useEffect, useRef, useCallback } from "react";
 
+// 이 크기(UTF-8 바이트)를 넘는 입력은 압축 후 프레임으로 나누어 전송
+const FRAMED_UPLOAD_THRESHOLD = 64000;
+// 프레임당 바이트 수 (base64 인코딩 후 약 87KB, WebSocket 128KB 메시지 제한 고려)
+const FRAME_BYTES = 64 * 1024;
+// 한 메시지(JSON 직렬화 후 UTF-8 바이트)의 상한, 128KB 제한에서 여유를 둠
+const MAX_MESSAGE_BYTES = 120 * 1024;
+const FRAME_INTERVAL_MS = 50;
+
+const textEncoder = new TextEncoder();
+
+// 브라우저가 CompressionStream을 지원하면 gzip, 아니면 원본 그대로 전송
+const compressBytes = async (bytes) => {
+  if (typeof CompressionStream === "undefined") {
+    return { bytes, encoding: "identity" };
+  }
+  const stream = new Blob([bytes]).stream().pipeThrough(new CompressionStream("gzip"));
+  const compressed = new Uint8Array(await new Response(stream).arrayBuffer());
+  return { bytes: compressed, encoding: "gzip" };
+};
+
+const sha256Hex = async (bytes) => {
+  const digest = await crypto.subtle.digest("SHA-256", bytes);
+  return Array.from(new Uint8Array(digest))
+    .map((b) => b.toString(16).padStart(2, "0"))
+    .join("");
+};
+
+const bytesToBase64 = (bytes) => {
+  let binary = "";
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+  }
+  return btoa(binary);
+};
+
 /**
  * WebSocket 실시간 스트리밍을 위한 커스텀 훅
  */
-export const useWebSocket = () => {
+export const useWebSocket = ({ conversationId = null } = {}) => {
   const [isConnected, setIsConnected] = useState(false);
   const [isConnecting, setIsConnecting] = useState(false);
   const [error, setError] = useState(null);
@@ -11,6 +46,11 @@ export const useWebSocket = () => {
   const reconnectTimeoutRef = useRef(null);
   const reconnectAttempts = useRef(0);
   const maxReconnectAttempts = 5;
+  // 진행 중인 스트림 (재연결 시 누락된 구간을 resume으로 재요청)
+  const activeStreamRef = useRef(null);
+  // 연결 시 서버가 최근 대화를 미리 준비하도록 전달할 대화 ID (변경되어도 재연결하지 않음)
+  const conversationIdRef = useRef(conversationId);
+  conversationIdRef.current = conversationId;
 
   // WebSocket URL (환경변수나 실제 배포된 URL로 설정)
   const getWebSocketUrl = useCallback(async () => {
@@ -50,6 +90,12 @@ export const useWebSocket = () => {
       }
     }
 
+    if (conversationIdRef.current) {
+      normalizedUrl +=
+        (normalizedUrl.includes("?") ? "&" : "?") +
+        `conversationId=${encodeURIComponent(conversationIdRef.current)}`;
+    }
+
     console.log(
       "WebSocket URL 확인:",
       normalizedUrl.replace(/token=[^&]+/, "token=***")
@@ -100,6 +146,29 @@ export const useWebSocket = () => {
 
       wsRef.current = new WebSocket(wsUrl);
 
+      // 스트림 ID와 마지막 수신 seq 추적
+      wsRef.current.addEventListener("message", (event) => {
+        try {
+          const data = JSON.parse(event.data);
+          if (data.type === "stream_start" && data.streamId) {
+            activeStreamRef.current = { streamId: data.streamId, lastSeq: 0 };
+          } else if (
+            data.type === "stream_chunk" &&
+            data.seq &&
+            activeStreamRef.current?.streamId === data.streamId
+          ) {
+            activeStreamRef.current.lastSeq = Math.max(
+              activeStreamRef.current.lastSeq,
+              data.seq
+            );
+          } else if (data.type === "stream_complete" || data.type === "error") {
+            activeStreamRef.current = null;
+          }
+        } catch (parseError) {
+          // JSON이 아닌 메시지는 무시
+        }
+      });
+
       // 연결 상태 모니터링
       const connectionTimeout = setTimeout(() => {
         if (wsRef.current?.readyState === WebSocket.CONNECTING) {
@@ -121,6 +190,15 @@ export const useWebSocket = () => {
         setIsConnecting(false);
         setError(null);
         reconnectAttempts.current = 0;
+
+        // 스트리밍 중 연결이 끊겼던 경우 누락된 구간부터 재개
+        if (activeStreamRef.current) {
+          const { streamId, lastSeq } = activeStreamRef.current;
+          console.log(`🔄 스트림 재개 요청: ${streamId} (seq ${lastSeq} 이후)`);
+          wsRef.current.send(
+            JSON.stringify({ action: "resume", streamId, fromSeq: lastSeq })
+          );
+        }
       };
 
       wsRef.current.onclose = (event) => {
@@ -244,6 +322,67 @@ export const useWebSocket = () => {
     }
   }, []);
 
+  // 대용량 입력 프레임 업로드 (압축 → SHA-256 → base64 프레임)
+  const sendFramedUpload = useCallback(
+    async (inputBytes, metadata) => {
+      const { bytes, encoding } = await compressBytes(inputBytes);
+      const checksum = await sha256Hex(bytes);
+      const uploadId = "upload-" + Date.now() + "-" + Math.random().toString(36).slice(2, 8);
+
+      const firstMessage = (totalFrames, frame) => ({
+        action: "stream",
+        ...metadata,
+        upload: {
+          uploadId,
+          encoding,
+          totalFrames,
+          byteLength: bytes.length,
+          originalLength: inputBytes.length,
+          checksum,
+        },
+        ...frame,
+      });
+
+      // 첫 프레임은 요청 메타데이터(히스토리, 카드 본문 포함 가능)와 함께 가므로
+      // 메타데이터 크기만큼 데이터를 줄이고, 공간이 없으면 데이터 없이 메타데이터만 전송
+      const headerBytes = textEncoder.encode(
+        JSON.stringify(firstMessage(bytes.length, { frameIndex: 0, frameData: "", frameLength: bytes.length }))
+      ).length;
+      if (headerBytes > MAX_MESSAGE_BYTES) {
+        throw new Error(`요청 메타데이터가 너무 큽니다 (${headerBytes}바이트)`);
+      }
+      // base64는 3바이트를 4문자로 인코딩
+      const firstFrameBytes = Math.min(
+        bytes.length,
+        FRAME_BYTES,
+        Math.floor((MAX_MESSAGE_BYTES - headerBytes) / 4) * 3
+      );
+      const totalFrames = 1 + Math.ceil((bytes.length - firstFrameBytes) / FRAME_BYTES);
+
+      const frameAt = (index) => {
+        const start = index === 0 ? 0 : firstFrameBytes + (index - 1) * FRAME_BYTES;
+        const end = index === 0 ? firstFrameBytes : start + FRAME_BYTES;
+        const frame = bytes.subarray(start, end);
+        return { frameIndex: index, frameData: bytesToBase64(frame), frameLength: frame.length };
+      };
+
+      sendMessage(firstMessage(totalFrames, frameAt(0)));
+
+      for (let i = 1; i < totalFrames; i++) {
+        await new Promise((resolve) => setTimeout(resolve, FRAME_INTERVAL_MS));
+        if (wsRef.current?.readyState !== WebSocket.OPEN) {
+          throw new Error("프레임 전송 중 연결이 끊어졌습니다");
+        }
+        sendMessage({ action: "stream_chunk", uploadId, ...frameAt(i) });
+      }
+
+      console.log(
+        `🔍 [DEBUG] ${inputBytes.length}바이트 → ${encoding} ${bytes.length}바이트, ${totalFrames}개 프레임 전송 완료`
+      );
+    },
+    [sendMessage]
+  );
+
   // 스트리밍 요청
   const startStreaming = useCallback(
     (
@@ -261,61 +400,28 @@ export const useWebSocket = () => {
       }
 
       try {
-        // 대용량 텍스트 처리를 위한 청크 분할
-        const MAX_CHUNK_SIZE = 100000; // 100KB 청크 (WebSocket 128KB 제한 고려)
-        
-        // 입력 텍스트가 큰 경우 청크로 분할
-        if (userInput.length > MAX_CHUNK_SIZE) {
-          console.log(`🔍 [DEBUG] 대용량 텍스트 감지: ${userInput.length}자, 청크 분할 필요`);
-          
-          // 첫 번째 청크는 메타데이터와 함께 전송
-          const firstChunk = userInput.substring(0, MAX_CHUNK_SIZE);
-          const totalChunks = Math.ceil(userInput.length / MAX_CHUNK_SIZE);
-          const chunkId = 'chunk-' + Date.now();
-          
-          // 첫 번째 청크 전송
-          const firstMessage = {
-            action: 'stream',
-            userInput: firstChunk,
-            chat_history: chatHistory,
-            prompt_cards: promptCards,
+        // 모든 카드에 ID가 있으면 본문 대신 ID만 전송 (서버에서 캐시로 해석)
+        const cardPayload = promptCards.every((card) => card.promptId)
+          ? { promptCardIds: promptCards.map((card) => card.promptId) }
+          : { prompt_cards: promptCards };
+        // 저장된 대화는 서버에서 히스토리를 불러오므로 새 대화일 때만 전송
+        const historyPayload = conversationId ? {} : { chat_history: chatHistory };
+
+        // 대용량 텍스트는 UTF-8 바이트 기준으로 압축 후 프레임 분할
+        const inputBytes = textEncoder.encode(userInput);
+        if (inputBytes.length > FRAMED_UPLOAD_THRESHOLD) {
+          console.log(`🔍 [DEBUG] 대용량 텍스트 감지: ${userInput.length}자 (${inputBytes.length}바이트), 프레임 업로드`);
+          sendFramedUpload(inputBytes, {
+            ...historyPayload,
+            ...cardPayload,
             modelId: modelId,
             conversationId: conversationId,
             userSub: userSub,
             enableStepwise: enableStepwise,
-            chunked: true,
-            chunkId: chunkId,
-            chunkIndex: 0,
-            totalChunks: totalChunks,
-            isComplete: totalChunks === 1
-          };
-          
-          sendMessage(firstMessage);
-          
-          // 나머지 청크들 순차적으로 전송
-          for (let i = 1; i < totalChunks; i++) {
-            const start = i * MAX_CHUNK_SIZE;
-            const end = Math.min((i + 1) * MAX_CHUNK_SIZE, userInput.length);
-            const chunk = userInput.substring(start, end);
-            
-            setTimeout(() => {
-              const chunkMessage = {
-                action: 'stream_chunk',
-                chunkId: chunkId,
-                chunkIndex: i,
-                totalChunks: totalChunks,
-                chunkData: chunk,
-                isComplete: i === totalChunks - 1
-              };
-              
-              if (wsRef.current?.readyState === WebSocket.OPEN) {
-                sendMessage(chunkMessage);
-                console.log(`🔍 [DEBUG] 청크 ${i + 1}/${totalChunks} 전송 완료`);
-              }
-            }, i * 100); // 각 청크 간 100ms 지연
-          }
-          
-          console.log(`🔍 [DEBUG] 총 ${totalChunks}개 청크로 분할하여 전송`);
+          }).catch((uploadError) => {
+            console.error("프레임 업로드 실패:", uploadError);
+            setError("대용량 메시지 전송에 실패했습니다");
+          });
           return true;
         }
         
@@ -323,8 +429,8 @@ export const useWebSocket = () => {
         const message = {
           action: "stream",
           userInput,
-          chat_history: chatHistory,
-          prompt_cards: promptCards,
+          ...historyPayload,
+          ...cardPayload,
           modelId: modelId,
           conversationId: conversationId,
           userSub: userSub,
@@ -364,7 +470,7 @@ export const useWebSocket = () => {
         return false;
       }
     },
-    [isConnected, sendMessage]
+    [isConnected, sendMessage, sendFramedUpload]
   );
 
   // 메시지 리스너 등록
@@ -0,0 +1,469 @@
+"""
+보관 기사 제목 백필 Lambda 함수 (Bedrock 배치 추론)
+- 기사별 요청을 JSONL로 S3에 기록하고 모델 배치 추론 작업으로 제출 (온디맨드 호출보다 저렴)
+- 예약 실행으로 진행 중인 작업 상태를 확인하고 완료되면 결과를 배치 작업 테이블의 청크 항목으로 기록
+- 로컬 실행(--local)은 같은 JSONL을 스텁 모델로 처리하여 제출부터 결과 반영까지 검증
+  PYTHONPATH=../shared/python python backfill.py --local articles.jsonl --prompt "제목을 생성해주세요"
+"""
+import argparse
+import json
+import os
+import time
+import traceback
+import uuid
+import boto3
+from boto3.dynamodb.conditions import Key
+from datetime import datetime
+
+from bedrock_provider import build_request_body, get_provider, parse_response
+
+# 환경 변수
+BATCH_JOBS_TABLE = os.environ.get("BATCH_JOBS_TABLE")
+BACKFILL_BUCKET = os.environ.get("BACKFILL_BUCKET")
+BACKFILL_ROLE_ARN = os.environ.get("BACKFILL_ROLE_ARN")
+REGION = os.environ.get("REGION")
+
+DEFAULT_MODEL_ID = "apac.anthropic.claude-sonnet-4-20250514-v1:0"
+# 배치 추론 작업 하나에 넣을 수 있는 레코드 수 (Bedrock 할당량)
+MIN_BATCH_RECORDS = 100
+MAX_BATCH_RECORDS = 50000
+# 기사 하나에 포함할 최대 본문 길이와 출력 토큰 수 (제목 생성용)
+MAX_ARTICLE_CHARS = 50000
+BACKFILL_MAX_TOKENS = 1024
+# 배치 추론은 수 시간~수일 걸리므로 작업 항목을 일반 배치보다 오래 보관
+BACKFILL_TTL_SECONDS = 7 * 86400
+
+MANIFEST_ID = "MANIFEST"
+CHUNK_PREFIX = "chunk_"
+JOB_TYPE = "backfill"
+# 진행 중인 백필 작업 목록 (PK 하나에 작업 ID를 SK로 기록하여 예약 실행이 Query 한 번으로 조회)
+ACTIVE_JOBS_KEY = "backfill#active"
+
+# Bedrock 배치 작업 상태 분류
+RUNNING_STATUSES = {"Submitted", "Validating", "Scheduled", "InProgress", "Stopping"}
+DONE_STATUSES = {"Completed", "PartiallyCompleted"}
+
+# AWS 클라이언트는 처음 사용할 때 생성 (--local 실행은 리전 설정 없이도 모듈을 불러올 수 있어야 함)
+_clients = {}
+
+
+def _client(service):
+    if service not in _clients:
+        _clients[service] = boto3.client(service, region_name=REGION)
+    return _clients[service]
+
+
+def _dynamodb():
+    if "dynamodb" not in _clients:
+        _clients["dynamodb"] = boto3.resource("dynamodb", region_name=REGION)
+    return _clients["dynamodb"]
+
+
+def handler(event, context):
+    """
+    action=submit: 기사 목록(articles 또는 S3 JSONL input_key)으로 배치 추론 작업 제출
+    예약 이벤트(action=poll): 진행 중인 작업 상태 확인 및 완료된 작업 결과 반영
+    """
+    try:
+        print(f"이벤트 수신: {json.dumps(event, ensure_ascii=False)[:2000]}")
+        action = event.get("action") or ("poll" if event.get("source") == "aws.events" else None)
+
+        if action == "submit":
+            articles = event.get("articles")
+            if articles is None and event.get("input_key"):
+                articles = load_articles_from_s3(event.get("input_bucket") or BACKFILL_BUCKET, event["input_key"])
+            if not articles or not event.get("prompt"):
+                return {"statusCode": 400, "body": json.dumps({"error": "articles(또는 input_key)와 prompt가 필요합니다"})}
+            job = submit_backfill(articles, event["prompt"], event.get("model_id") or DEFAULT_MODEL_ID)
+            return {"statusCode": 202, "body": json.dumps(job, ensure_ascii=False)}
+
+        if action == "poll":
+            return {"statusCode": 200, "body": json.dumps(poll_backfills(), ensure_ascii=False)}
+
+        return {"statusCode": 400, "body": json.dumps({"error": f"지원하지 않는 action: {action}"})}
+
+    except ValueError as e:
+        print(f"백필 요청 오류: {e}")
+        return {"statusCode": 400, "body": json.dumps({"error": str(e)}, ensure_ascii=False)}
+    except Exception as e:
+        print(f"백필 처리 오류: {traceback.format_exc()}")
+        return {"statusCode": 500, "body": json.dumps({"error": str(e)}, ensure_ascii=False)}
+
+
+def load_articles_from_s3(bucket, key):
+    """S3 JSONL({"id": ..., "content": ...} 한 줄에 한 기사)에서 기사 목록 로드"""
+    body = _client("s3").get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+
+def _record_id(index):
+    """배치 추론 레코드 ID (11자리 영숫자)"""
+    return f"{index:011d}"
+
+
+def _chunk_id(index):
+    return f"{CHUNK_PREFIX}{index:06d}"
+
+
+def build_batch_records(articles, prompt, model_id):
+    """기사별 배치 추론 입력 레코드 생성 (요청 본문은 온디맨드 호출과 같은 공유 형식)"""
+    records = []
+    for index, article in enumerate(articles):
+        content = (article.get("content") or "")[:MAX_ARTICLE_CHARS]
+        records.append({
+            "recordId": _record_id(index),
+            "modelInput": build_request_body(
+                model_id,
+                [{"role": "user", "content": f"{prompt}\n\n{content}"}],
+                max_tokens=BACKFILL_MAX_TOKENS,
+                temperature=0.1
+            )
+        })
+    return records
+
+
+def parse_batch_output(lines, model_id):
+    """
+    배치 추론 결과 JSONL에서 레코드별 (결과, 오류) 추출
+    반환: {record_id: {'result': str} 또는 {'error': str}}
+    """
+    outcomes = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        record_id = record.get("recordId")
+        if record.get("error"):
+            error = record["error"]
+            outcomes[record_id] = {"error": error.get("errorMessage") if isinstance(error, dict) else str(error)}
+            continue
+        try:
+            text, _ = parse_response(model_id, record.get("modelOutput") or {})
+            outcomes[record_id] = {"result": text.strip()}
+        except Exception as e:
+            outcomes[record_id] = {"error": f"응답 파싱 실패: {e}"}
+    return outcomes
+
+
+def _jsonl(records):
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+
+def submit_backfill(articles, prompt, model_id):
+    """입력 JSONL 업로드 → 작업 항목 기록 → Bedrock 배치 추론 작업 생성"""
+    get_provider(model_id)
+    if not MIN_BATCH_RECORDS <= len(articles) <= MAX_BATCH_RECORDS:
+        raise ValueError(
+            f"배치 추론은 기사 {MIN_BATCH_RECORDS}~{MAX_BATCH_RECORDS}개가 필요합니다 (요청: {len(articles)}개). "
+            "적은 수의 기사는 /generate 배치 처리를 사용하세요."
+        )
+    if not BACKFILL_BUCKET or not BACKFILL_ROLE_ARN:
+        raise RuntimeError("백필 버킷 또는 Bedrock 서비스 역할이 설정되지 않았습니다")
+
+    job_id = str(uuid.uuid4())
+    input_key = f"backfill/{job_id}/input.jsonl"
+    output_prefix = f"backfill/{job_id}/output/"
+
+    records = build_batch_records(articles, prompt, model_id)
+    _client("s3").put_object(
+        Bucket=BACKFILL_BUCKET,
+        Key=input_key,
+        Body=_jsonl(records).encode("utf-8"),
+        ContentType="application/jsonl"
+    )
+    write_job_items(job_id, articles, model_id, {
+        "input_uri": f"s3://{BACKFILL_BUCKET}/{input_key}",
+        "output_uri": f"s3://{BACKFILL_BUCKET}/{output_prefix}"
+    })
+
+    try:
+        response = _client("bedrock").create_model_invocation_job(
+            jobName=f"backfill-{job_id}",
+            roleArn=BACKFILL_ROLE_ARN,
+            modelId=model_id,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{BACKFILL_BUCKET}/{input_key}", "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{BACKFILL_BUCKET}/{output_prefix}"}}
+        )
+    except Exception as e:
+        _mark_job_failed(job_id, "SubmitFailed", str(e))
+        raise
+    invocation_job_arn = response["jobArn"]
+
+    table = _dynamodb().Table(BATCH_JOBS_TABLE)
+    table.update_item(
+        Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+        UpdateExpression="SET invocation_job_arn = :arn, updated_at = :updated_at",
+        ExpressionAttributeValues={":arn": invocation_job_arn, ":updated_at": datetime.utcnow().isoformat()}
+    )
+    table.put_item(Item={
+        "job_id": ACTIVE_JOBS_KEY,
+        "chunk_id": job_id,
+        "invocation_job_arn": invocation_job_arn,
+        "ttl": int(time.time()) + BACKFILL_TTL_SECONDS
+    })
+
+    print(f"백필 작업 제출: job_id={job_id}, 기사 {len(articles)}개, arn={invocation_job_arn}")
+    return {"job_id": job_id, "total_chunks": len(articles), "invocation_job_arn": invocation_job_arn}
+
+
+def write_job_items(job_id, articles, model_id, extra=None):
+    """매니페스트와 기사별 청크 항목 기록 (GET /generate/jobs/{id}로 진행 상황 조회 가능)"""
+    created_at = datetime.utcnow().isoformat()
+    ttl = int(time.time()) + BACKFILL_TTL_SECONDS
+    with _dynamodb().Table(BATCH_JOBS_TABLE).batch_writer() as batch:
+        batch.put_item(Item={
+            "job_id": job_id,
+            "chunk_id": MANIFEST_ID,
+            "job_type": JOB_TYPE,
+            "status": "submitted",
+            "total_chunks": len(articles),
+            "completed_chunks": 0,
+            "model_id": model_id,
+            "created_at": created_at,
+            "ttl": ttl,
+            **(extra or {})
+        })
+        for index, article in enumerate(articles):
+            batch.put_item(Item={
+                "job_id": job_id,
+                "chunk_id": _chunk_id(index),
+                "article_id": str(article.get("id", index)),
+                "status": "queued",
+                "created_at": created_at,
+                "ttl": ttl
+            })
+
+
+def poll_backfills():
+    """진행 중인 백필 작업의 Bedrock 상태를 확인하고 끝난 작업을 정리"""
+    table = _dynamodb().Table(BATCH_JOBS_TABLE)
+    active = table.query(KeyConditionExpression=Key("job_id").eq(ACTIVE_JOBS_KEY)).get("Items", [])
+    summary = {"active": len(active), "completed": [], "failed": []}
+
+    for entry in active:
+        job_id = entry["chunk_id"]
+        try:
+            job = _client("bedrock").get_model_invocation_job(jobIdentifier=entry["invocation_job_arn"])
+        except Exception as e:
+            print(f"백필 작업 상태 조회 오류: job_id={job_id}, {e}")
+            continue
+        status = job["status"]
+
+        if status in RUNNING_STATUSES:
+            try:
+                table.update_item(
+                    Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+                    UpdateExpression="SET #status = :in_progress, invocation_status = :status, updated_at = :updated_at",
+                    ConditionExpression="#status IN (:submitted, :in_progress)",
+                    ExpressionAttributeNames={"#status": "status"},
+                    ExpressionAttributeValues={
+                        ":in_progress": "in_progress",
+                        ":submitted": "submitted",
+                        ":status": status,
+                        ":updated_at": datetime.utcnow().isoformat()
+                    }
+                )
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                # 매니페스트가 이미 완료/실패로 바뀐 작업 - 다른 작업의 상태 확인은 계속
+                print(f"백필 작업 상태가 이미 변경됨: job_id={job_id}")
+            continue
+
+        if status in DONE_STATUSES:
+            try:
+                manifest = table.get_item(Key={"job_id": job_id, "chunk_id": MANIFEST_ID}).get("Item") or {}
+                bucket, prefix = _split_s3_uri(job["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"])
+                outcomes = parse_batch_output(_read_output_lines(bucket, prefix), manifest.get("model_id", DEFAULT_MODEL_ID))
+                fan_out_results(job_id, outcomes, invocation_status=status)
+            except Exception as e:
+                # 활성 목록에 남겨 다음 예약 실행에서 다시 반영 (다른 작업의 정리는 계속)
+                print(f"백필 결과 반영 오류: job_id={job_id}, {e}")
+                continue
+            summary["completed"].append(job_id)
+        else:
+            try:
+                _mark_job_failed(job_id, status, job.get("message"))
+            except Exception as e:
+                print(f"백필 실패 기록 오류: job_id={job_id}, {e}")
+                continue
+            summary["failed"].append(job_id)
+        table.delete_item(Key={"job_id": ACTIVE_JOBS_KEY, "chunk_id": job_id})
+
+    print(f"백필 상태 확인: {summary}")
+    return summary
+
+
+def _split_s3_uri(uri):
+    bucket, _, prefix = uri[len("s3://"):].partition("/")
+    return bucket, prefix
+
+
+def _read_output_lines(bucket, prefix):
+    """출력 경로 아래의 *.jsonl.out 파일을 모두 읽음 (manifest.json.out 제외)"""
+    paginator = _client("s3").get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith(".jsonl.out"):
+                continue
+            body = _client("s3").get_object(Bucket=bucket, Key=obj["Key"])["Body"]
+            for line in body.iter_lines():
+                yield line.decode("utf-8")
+
+
+def fan_out_results(job_id, outcomes, invocation_status="Completed"):
+    """
+    레코드별 결과를 청크 항목에 기록하고 매니페스트를 완료 처리
+    청크 항목을 한 번 Query한 뒤 BatchWriteItem으로 덮어쓰므로 다시 실행해도 결과가 같음
+    """
+    table = _dynamodb().Table(BATCH_JOBS_TABLE)
+    items = []
+    query_kwargs = {"KeyConditionExpression": Key("job_id").eq(job_id) & Key("chunk_id").begins_with(CHUNK_PREFIX)}
+    while True:
+        response = table.query(**query_kwargs)
+        items.extend(response.get("Items", []))
+        if not response.get("LastEvaluatedKey"):
+            break
+        query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    updated_at = datetime.utcnow().isoformat()
+    completed = failed = 0
+    with table.batch_writer() as batch:
+        for item in items:
+            outcome = outcomes.get(_record_id(int(item["chunk_id"][len(CHUNK_PREFIX):])))
+            item = dict(item, updated_at=updated_at)
+            if outcome and "result" in outcome:
+                item.update(status="completed", result=outcome["result"])
+                item.pop("error", None)
+                completed += 1
+            else:
+                item.update(status="failed", error=(outcome or {}).get("error", "배치 추론 결과에 레코드가 없습니다"))
+                failed += 1
+            batch.put_item(Item=item)
+
+    table.update_item(
+        Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+        UpdateExpression=(
+            "SET #status = :completed, completed_chunks = :completed_chunks, failed_chunks = :failed_chunks, "
+            "invocation_status = :invocation_status, completed_at = :completed_at, updated_at = :completed_at"
+        ),
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={
+            ":completed": "completed",
+            ":completed_chunks": completed,
+            ":failed_chunks": failed,
+            ":invocation_status": invocation_status,
+            ":completed_at": updated_at
+        }
+    )
+    print(f"백필 결과 반영: job_id={job_id}, 성공 {completed}개, 실패 {failed}개")
+    return {"completed": completed, "failed": failed}
+
+
+def _mark_job_failed(job_id, invocation_status, message=None):
+    _dynamodb().Table(BATCH_JOBS_TABLE).update_item(
+        Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+        UpdateExpression="SET #status = :failed, invocation_status = :status, #error = :error, updated_at = :updated_at",
+        ExpressionAttributeNames={"#status": "status", "#error": "error"},
+        ExpressionAttributeValues={
+            ":failed": "failed",
+            ":status": invocation_status,
+            ":error": message or f"배치 추론 작업 종료: {invocation_status}",
+            ":updated_at": datetime.utcnow().isoformat()
+        }
+    )
+    print(f"백필 작업 실패: job_id={job_id}, status={invocation_status}, {message}")
+
+
+# --- 로컬 실행 (스텁 모델) ---
+
+def stub_model_output(model_id, model_input):
+    """
+    스텁 모델: 입력 본문 마지막 줄로 만든 고정 제목을 제공자별 응답 형식으로 반환
+    Bedrock 배치 추론 출력의 modelOutput과 같은 구조
+    """
+    provider = get_provider(model_id)
+    if provider == "anthropic":
+        text = model_input["messages"][-1]["content"]
+    elif provider == "meta":
+        # Llama 채팅 템플릿에서 마지막 사용자 메시지만 추출
+        text = model_input["prompt"].rsplit("<|start_header_id|>user<|end_header_id|>", 1)[-1].split("<|eot_id|>")[0]
+    else:
+        text = model_input["messages"][-1]["content"][0]["text"]
+
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    title = f"[stub] {(lines[-1] if lines else '')[:60]}"
+    input_tokens, output_tokens = max(1, len(text) // 4), max(1, len(title) // 4)
+
+    if provider == "anthropic":
+        return {
+            "content": [{"type": "text", "text": title}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        }
+    if provider == "meta":
+        return {"generation": title, "prompt_token_count": input_tokens, "generation_token_count": output_tokens}
+    return {
+        "output": {"message": {"role": "assistant", "content": [{"text": title}]}},
+        "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens}
+    }
+
+
+def run_stub_batch(input_lines, model_id, model=stub_model_output):
+    """배치 추론 작업 대체: 입력 JSONL 레코드마다 model을 호출하여 출력 JSONL 줄 생성"""
+    for line in input_lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        output = dict(record)
+        try:
+            output["modelOutput"] = model(model_id, record["modelInput"])
+        except Exception as e:
+            output["error"] = {"errorCode": 500, "errorMessage": str(e)}
+        yield json.dumps(output, ensure_ascii=False)
+
+
+def run_local(articles_path, prompt, model_id, out_dir):
+    """
+    로컬 종단 간 실행: 입력 JSONL 작성 → 스텁 배치 처리 → 결과 파싱
+    BATCH_JOBS_TABLE이 설정되어 있으면 (예: DynamoDB Local) 작업 항목 기록과 결과 반영까지 수행
+    """
+    with open(articles_path, encoding="utf-8") as f:
+        articles = [json.loads(line) for line in f if line.strip()]
+    os.makedirs(out_dir, exist_ok=True)
+
+    input_path = os.path.join(out_dir, "input.jsonl")
+    output_path = os.path.join(out_dir, "input.jsonl.out")
+    with open(input_path, "w", encoding="utf-8") as f:
+        f.write(_jsonl(build_batch_records(articles, prompt, model_id)))
+    with open(input_path, encoding="utf-8") as source, open(output_path, "w", encoding="utf-8") as target:
+        for line in run_stub_batch(source, model_id):
+            target.write(line + "\n")
+    with open(output_path, encoding="utf-8") as f:
+        outcomes = parse_batch_output(f, model_id)
+
+    results_path = os.path.join(out_dir, "results.jsonl")
+    with open(results_path, "w", encoding="utf-8") as f:
+        for index, article in enumerate(articles):
+            outcome = outcomes.get(_record_id(index), {"error": "결과 없음"})
+            f.write(json.dumps({"id": article.get("id", index), **outcome}, ensure_ascii=False) + "\n")
+
+    summary = {
+        "articles": len(articles),
+        "completed": sum(1 for outcome in outcomes.values() if "result" in outcome),
+        "results": results_path
+    }
+    if BATCH_JOBS_TABLE:
+        job_id = f"local-{uuid.uuid4()}"
+        write_job_items(job_id, articles, model_id, {"input_uri": input_path, "output_uri": output_path})
+        fan_out_results(job_id, outcomes, invocation_status="Local")
+        summary["job_id"] = job_id
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="보관 기사 제목 백필 (로컬 스텁 실행)")
+    parser.add_argument("--local", required=True, help="기사 JSONL 경로 ({\"id\": ..., \"content\": ...} 한 줄에 한 기사)")
+    parser.add_argument("--prompt", required=True, help="기사 본문 앞에 붙일 프롬프트")
+    parser.add_argument("--model", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--out", default="backfill-local")
+    args = parser.parse_args()
+    print(json.dumps(run_local(args.local, args.prompt, args.model, args.out), ensure_ascii=False, indent=2))
@@ -2,148 +2,673 @@
 대용량 문서 배치 처리 Lambda 함수
 SQS에서 청크를 받아 AI 처리 후 결과를 WebSocket으로 전송
 """
+import hashlib
 import json
 import os
+import random
+import time
+import threading
+import uuid
 import boto3
 import traceback
+import zlib
+from boto3.dynamodb.conditions import Key
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from bedrock_provider import invoke_stream
+from concurrency_control import AimdController
+from token_budget import TokenBudget, BudgetExhausted, estimate_tokens, PRIORITY_BATCH
+import ws_delivery
+
 # AWS 클라이언트 초기화
 bedrock_client = boto3.client("bedrock-runtime", region_name=os.environ.get("REGION"))
-dynamodb = boto3.resource("dynamodb", region_name=os.environ.get("REGION"))
-apigateway_client = boto3.client("apigatewaymanagementapi")
 
 # 환경 변수
 BATCH_JOBS_TABLE = os.environ.get("BATCH_JOBS_TABLE")
 CONNECTIONS_TABLE = os.environ.get("CONNECTIONS_TABLE")
 REGION = os.environ.get("REGION")
 
+# 메시지에 model_id가 없을 때 사용할 기본 모델 (generate Lambda와 동일)
+DEFAULT_MODEL_ID = "apac.anthropic.claude-sonnet-4-20250514-v1:0"
+# 예산 차감 시 가정하는 출력 토큰 수
+EXPECTED_OUTPUT_TOKENS = 2048
+# 예산 부족으로 미룬 메시지의 최대 지연 시간 (SQS DelaySeconds 최대값 15분)
+MAX_DEFER_SECONDS = 900
+
+# 동시성 허가 대기 최대 시간 (초과 시 실패로 보고하여 SQS가 나중에 재전달)
+PERMIT_TIMEOUT_SECONDS = 120
+# 청크 부분 결과를 WebSocket으로 보내는 간격
+STREAM_FLUSH_SECONDS = 0.5
+
+# 한 배치에서 동시에 처리할 최대 레코드 수 (Bedrock 동시 호출 수 상한)
+MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "10"))
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "BedrockDiy/Batch")
+
+# 작업 매니페스트/최종 결과 항목의 정렬 키 (청크 항목은 chunk_0000 형식)
+MANIFEST_ID = "MANIFEST"
+RESULT_ID = "RESULT"
+CHUNK_PREFIX = "chunk_"
+# 청크 처리 임대 시간 (Lambda 최대 실행 시간과 동일, 만료되면 다른 작업자가 재획득)
+CHUNK_LEASE_SECONDS = int(os.environ.get("CHUNK_LEASE_SECONDS", "900"))
+CLAIM_ACQUIRED = "acquired"
+CLAIM_DUPLICATE = "duplicate"
+CLAIM_BUSY = "busy"
+# 최종 결과 압축본을 항목에 저장할 최대 크기 (400KB 항목 제한 여유 포함)
+RESULT_MAX_BYTES = 350 * 1024
+RESULT_TTL_SECONDS = 86400
+# chunk_result 메시지에 결과를 그대로 담는 최대 크기 (넘으면 결과 없이 보내고 클라이언트가 작업 상태 API로 조회)
+MAX_INLINE_RESULT_BYTES = 32 * 1024
+# 리듀스 임대 시간 (리듀스 도중 실패하면 만료 후 다른 작업자가 이어받음)
+REDUCE_LEASE_SECONDS = int(os.environ.get("REDUCE_LEASE_SECONDS", "300"))
+
+# 해시로 조회한 프롬프트 캐시 (컨테이너 수명 동안 유지, 오래된 항목부터 제거)
+PROMPT_CACHE_SIZE = 32
+_prompt_cache = {}
+_prompt_cache_lock = threading.Lock()
+
+# 모델별 Bedrock 동시 호출 수 제어 (RATE_CONTROL_TABLE이 없으면 제한 없음)
+concurrency_controller = AimdController()
+# 계정 TPM 예산 (배치는 대화형 예약분을 남기고 사용, 부족하면 작업을 미룸)
+token_budget = TokenBudget()
+sqs_client = boto3.client("sqs", region_name=REGION)
+
+# boto3 resource는 스레드 간 공유가 안전하지 않으므로 스레드별로 생성
+_thread_local = threading.local()
+
+def _jobs_table():
+    if not hasattr(_thread_local, "jobs_table"):
+        _thread_local.jobs_table = boto3.session.Session().resource(
+            "dynamodb", region_name=REGION
+        ).Table(BATCH_JOBS_TABLE)
+    return _thread_local.jobs_table
+
 def handler(event, context):
-    """SQS 이벤트 처리"""
+    """
+    SQS 이벤트 처리
+    레코드를 병렬로 처리하고 실패한 레코드만 batchItemFailures로 보고하여 재시도
+    """
+    records = event.get('Records', [])
+    started = time.time()
+    failures = []
+    # 예산 부족 연기: 지연 메시지로 다시 넣은 수 / 다시 넣지 못해 실패로 보고한 수 (후자는 failures에도 포함)
+    requeued = 0
+    budget_failures = 0
+    
+    if records:
+        with ThreadPoolExecutor(max_workers=min(len(records), MAX_WORKERS)) as executor:
+            futures = [(record['messageId'], executor.submit(_process_record, record)) for record in records]
+            for message_id, future in futures:
+                try:
+                    future.result()
+                except RecordDeferred:
+                    # 지연 메시지로 다시 넣었으므로 원본은 성공으로 처리 (수신 횟수가 DLQ 한도에 누적되지 않음)
+                    requeued += 1
+                except BudgetExhausted:
+                    # 다시 넣지 못한 레코드는 가시성 타임아웃을 늘린 뒤 실패로 보고
+                    budget_failures += 1
+                    failures.append({"itemIdentifier": message_id})
+                except Exception:
+                    print(f"레코드 처리 실패: messageId={message_id}, {traceback.format_exc()}")
+                    failures.append({"itemIdentifier": message_id})
+    
+    # 연결별로 모아둔 남은 메시지 전송
+    ws_delivery.flush_all()
+    
+    wall_time_ms = (time.time() - started) * 1000
+    # 예산 부족으로 실패 보고한 레코드는 연기로만 집계
+    failure_count = len(failures) - budget_failures
+    deferred = requeued + budget_failures
+    print(f"배치 처리 완료: {len(records)}개 중 실패 {failure_count}개, "
+          f"연기 {deferred}개 (재전송 {requeued}개, 가시성 연장 {budget_failures}개), {wall_time_ms:.0f}ms")
+    emit_batch_metrics(context, len(records), failure_count, wall_time_ms, deferred)
+    
+    return {"batchItemFailures": failures}
+
+class RecordDeferred(Exception):
+    """예산 부족으로 메시지를 지연 메시지로 다시 넣음 (원본은 삭제해도 됨)"""
+    pass
+
+def _process_record(record):
+    """SQS 레코드 하나 처리 (실패 시 예외 전파)"""
     try:
-        for record in event['Records']:
-            message_body = json.loads(record['body'])
-            process_chunk(message_body)
-        
-        return {"statusCode": 200}
-        
-    except Exception as e:
-        print(f"배치 처리 오류: {traceback.format_exc()}")
-        return {"statusCode": 500, "body": str(e)}
+        process_chunk(json.loads(record['body']))
+    except BudgetExhausted as e:
+        if defer_record(record, e.retry_after):
+            raise RecordDeferred() from e
+        raise
 
-def process_chunk(message):
-    """개별 청크 처리"""
+def defer_record(record, retry_after):
+    """
+    예산이 회복될 때까지 메시지 처리를 미룸
+    같은 본문을 DelaySeconds로 다시 넣고 True 반환 (실패로 보고하면 연기도 DLQ 수신 횟수에 누적됨)
+    다시 넣지 못하면 가시성 타임아웃만 연장하고 False 반환
+    """
+    delay = int(min(MAX_DEFER_SECONDS, max(30, retry_after + random.uniform(0, 30))))
+    # arn:aws:sqs:{region}:{account}:{queue} → 큐 URL
+    _, _, _, region, account, queue_name = record['eventSourceARN'].split(':')
+    queue_url = f"https://sqs.{region}.amazonaws.com/{account}/{queue_name}"
+    try:
+        sqs_client.send_message(QueueUrl=queue_url, MessageBody=record['body'], DelaySeconds=delay)
+        print(f"TPM 예산 부족으로 {delay}초 연기: messageId={record['messageId']}")
+        return True
+    except Exception as e:
+        print(f"지연 메시지 전송 오류: messageId={record['messageId']}, {e}")
     try:
+        sqs_client.change_message_visibility(
+            QueueUrl=queue_url,
+            ReceiptHandle=record['receiptHandle'],
+            VisibilityTimeout=delay
+        )
+    except Exception as e:
+        print(f"메시지 연기 오류: messageId={record['messageId']}, {e}")
+    return False
+
+def dead_letter_handler(event, context):
+    """
+    배치 큐 DLQ 처리: 재시도 한도를 넘긴 청크와 작업을 최종 실패로 기록
+    (작업 상태 조회 API가 failed와 원인을 반환하고, 연결이 있으면 job_failed 전송)
+    """
+    for record in event.get('Records', []):
+        message = json.loads(record['body'])
         job_id = message['job_id']
         chunk_id = message['chunk_id']
+        error = mark_chunk_dead(job_id, chunk_id)
+        print(f"재시도 한도 초과로 청크 실패 처리: job_id={job_id}, chunk_id={chunk_id}, {error}")
+        ws_delivery.enqueue(job_id, message.get('connection_id'), {
+            "type": "job_failed",
+            "job_id": job_id,
+            "chunk_id": chunk_id,
+            "error": error
+        }, force=True)
+    ws_delivery.flush_all()
+    return {"statusCode": 200}
+
+def mark_chunk_dead(job_id, chunk_id):
+    """
+    청크를 dead_letter, 매니페스트를 failed로 전환 (이미 완료된 청크/작업은 그대로 둠)
+    claim_chunk는 dead_letter 청크를 다시 획득하지 않음
+    반환: 기록된 실패 원인
+    """
+    table = _jobs_table()
+    updated_at = datetime.utcnow().isoformat()
+    error = "재시도 한도를 초과했습니다"
+    try:
+        response = table.update_item(
+            Key={"job_id": job_id, "chunk_id": chunk_id},
+            UpdateExpression=(
+                "SET #status = :dead, updated_at = :updated_at, #error = if_not_exists(#error, :error) "
+                "REMOVE lease_owner, lease_expires_at"
+            ),
+            ConditionExpression="attribute_not_exists(#status) OR #status <> :completed",
+            ExpressionAttributeNames={"#status": "status", "#error": "error"},
+            ExpressionAttributeValues={
+                ":dead": "dead_letter",
+                ":completed": "completed",
+                ":error": error,
+                ":updated_at": updated_at
+            },
+            ReturnValues="ALL_NEW"
+        )
+        error = response.get("Attributes", {}).get("error", error)
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"이미 완료된 청크라 실패로 기록하지 않음: job_id={job_id}, chunk_id={chunk_id}")
+        return error
+    
+    try:
+        table.update_item(
+            Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+            UpdateExpression="SET #status = :failed, failed_at = :updated_at, #error = :error",
+            ConditionExpression="#status <> :completed",
+            ExpressionAttributeNames={"#status": "status", "#error": "error"},
+            ExpressionAttributeValues={
+                ":failed": "failed",
+                ":completed": "completed",
+                ":error": f"{chunk_id}: {error}",
+                ":updated_at": updated_at
+            }
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"이미 완료된 작업이라 실패로 기록하지 않음: job_id={job_id}")
+    return error
+
+def emit_batch_metrics(context, record_count, failure_count, wall_time_ms, deferred_count=0):
+    """CloudWatch Embedded Metric Format으로 배치 처리 지표 기록"""
+    function_name = getattr(context, "function_name", "batch-processor")
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["FunctionName"]],
+                "Metrics": [
+                    {"Name": "BatchWallTime", "Unit": "Milliseconds"},
+                    {"Name": "BatchRecords", "Unit": "Count"},
+                    {"Name": "BatchFailures", "Unit": "Count"},
+                    {"Name": "BatchDeferred", "Unit": "Count"}
+                ]
+            }]
+        },
+        "FunctionName": function_name,
+        "BatchWallTime": round(wall_time_ms, 1),
+        "BatchRecords": record_count,
+        "BatchFailures": failure_count,
+        "BatchDeferred": deferred_count
+    }))
+
+class ChunkLeaseHeld(Exception):
+    """다른 작업자가 유효한 임대(lease)로 청크를 처리 중"""
+    pass
+
+def process_chunk(message):
+    """
+    개별 청크 처리 (실패 시 상태 기록 후 예외를 다시 발생시켜 재시도 대상으로 보고)
+    queued → processing(임대) → completed 조건부 전환으로 청크당 Bedrock 호출을 한 번으로 제한
+    """
+    job_id = message['job_id']
+    chunk_id = message['chunk_id']
+    connection_id = message.get('connection_id')
+    lease_owner = uuid.uuid4().hex
+    
+    # 이미 완료된 청크의 중복 전달은 Bedrock 호출 없이 종료
+    # (청크 완료 후 리듀스가 실패해 재전달된 경우 여기서 리듀스를 다시 시도)
+    claim = claim_chunk(job_id, chunk_id, lease_owner)
+    if claim == CLAIM_DUPLICATE:
+        print(f"이미 완료된 청크 중복 수신: job_id={job_id}, chunk_id={chunk_id}")
+        _notify_job_complete(job_id, connection_id, finish_job_if_complete(job_id))
+        return
+    if claim == CLAIM_BUSY:
+        # 실패로 보고하여 가시성 타임아웃 후 다시 확인 (그 사이 완료되면 위에서 종료)
+        raise ChunkLeaseHeld(f"다른 작업자가 처리 중: job_id={job_id}, chunk_id={chunk_id}")
+    
+    try:
         content = message['content']
-        prompt = message['prompt']
-        connection_id = message.get('connection_id')
+        prompt = resolve_prompt(message)
         
         print(f"청크 처리 시작: job_id={job_id}, chunk_id={chunk_id}")
         
-        # 작업 상태 업데이트
-        update_job_status(job_id, chunk_id, "processing")
+        # TPM 예산 차감 (대화형 예약분을 침범하지 않도록, 부족하면 BudgetExhausted로 연기)
+        reserved_tokens = estimate_tokens(prompt + content, EXPECTED_OUTPUT_TOKENS)
+        token_budget.take(reserved_tokens, PRIORITY_BATCH)
         
-        # AI 처리
-        result = process_with_bedrock(content, prompt)
+        # AI 처리 (연결이 있으면 부분 결과를 스트리밍)
+        model_id = message.get('model_id') or DEFAULT_MODEL_ID
+        streamer = ChunkStreamer(connection_id, job_id, chunk_id) if connection_id else None
+        usage = {}
+        result = process_with_bedrock(content, prompt, model_id, on_delta=streamer, usage=usage)
+        if streamer:
+            streamer.flush()
+        if usage:
+            token_budget.settle(
+                reserved_tokens,
+                usage.get('input_tokens', 0) + usage.get('output_tokens', 0),
+                PRIORITY_BATCH
+            )
         
-        # 결과 저장
-        update_job_status(job_id, chunk_id, "completed", result)
+        # 결과 저장과 작업 진행 상황 반영을 한 트랜잭션으로 처리
+        complete_chunk(job_id, chunk_id, result)
         
-        # WebSocket으로 실시간 결과 전송
-        if connection_id:
-            send_websocket_message(connection_id, {
-                "type": "chunk_result",
-                "job_id": job_id,
-                "chunk_id": chunk_id,
-                "result": result
-            })
+        # WebSocket으로 실시간 결과 전송 (연결별로 모아서 전송)
+        ws_delivery.enqueue(job_id, connection_id, _chunk_result_message(job_id, chunk_id, result))
         
         print(f"청크 처리 완료: job_id={job_id}, chunk_id={chunk_id}")
         
+    except BudgetExhausted:
+        # 실패가 아니라 연기이므로 queued로 되돌림
+        release_chunk(job_id, chunk_id, lease_owner, status="queued")
+        raise
     except Exception as e:
         print(f"청크 처리 오류: {e}")
-        update_job_status(job_id, chunk_id, "failed", str(e))
-        
-        if connection_id:
-            send_websocket_message(connection_id, {
-                "type": "chunk_error",
-                "job_id": job_id,
-                "chunk_id": chunk_id,
-                "error": str(e)
-            })
-
-def process_with_bedrock(content, prompt):
-    """Bedrock으로 AI 처리"""
-    try:
-        final_prompt = f"{prompt}\n\n{content}"
-        
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "messages": [{"role": "user", "content": final_prompt}],
-            "temperature": 0.1
-        }
-        
-        response = bedrock_client.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            body=json.dumps(request_body)
-        )
+        release_chunk(job_id, chunk_id, lease_owner, str(e))
         
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
-        
-    except Exception as e:
-        print(f"Bedrock 처리 오류: {e}")
+        ws_delivery.enqueue(job_id, connection_id, {
+            "type": "chunk_error",
+            "job_id": job_id,
+            "chunk_id": chunk_id,
+            "error": str(e)
+        }, force=True)
         raise
+    
+    # 청크는 이미 completed로 기록됨 - 리듀스가 실패하면 예외를 전파하여 재전달 시 중복 경로에서 다시 시도
+    _notify_job_complete(job_id, connection_id, finish_job_if_complete(job_id))
+
+def _chunk_result_message(job_id, chunk_id, result):
+    """
+    청크 결과 메시지 구성
+    결과가 MAX_INLINE_RESULT_BYTES를 넘으면 본문 대신 truncated/result_length만 보냄 (GET /generate/jobs/{id}로 조회)
+    """
+    message = {
+        "type": "chunk_result",
+        "job_id": job_id,
+        "chunk_id": chunk_id,
+        "result_length": len(result)
+    }
+    if len(result.encode('utf-8')) > MAX_INLINE_RESULT_BYTES:
+        message["truncated"] = True
+    else:
+        message["result"] = result
+    return message
+
+def _notify_job_complete(job_id, connection_id, final_result):
+    """
+    리듀스를 마친 작업이면 완료 메시지 전송
+    최종 결과는 프레임 크기 제한을 넘을 수 있어 길이만 보냄 (클라이언트가 GET /generate/jobs/{id}로 조회)
+    """
+    if final_result is None:
+        return
+    ws_delivery.enqueue(job_id, connection_id, {
+        "type": "job_complete",
+        "job_id": job_id,
+        "status": "completed",
+        "result_length": len(final_result)
+    }, force=True)
+
+def resolve_prompt(message):
+    """
+    청크 메시지의 프롬프트 해석
+    prompt_hash로 저장된 프롬프트를 컨테이너 캐시 또는 작업 테이블에서 조회 (이전 형식은 본문 그대로 사용)
+    """
+    if 'prompt' in message:
+        return message['prompt']
+    
+    prompt_hash = message['prompt_hash']
+    with _prompt_cache_lock:
+        cached = _prompt_cache.get(prompt_hash)
+    if cached is not None:
+        return cached
+    
+    item = _jobs_table().get_item(
+        Key={"job_id": f"prompt#{prompt_hash}", "chunk_id": "PROMPT"}
+    ).get("Item")
+    if not item:
+        raise ValueError(f"저장된 프롬프트를 찾을 수 없습니다: {prompt_hash}")
+    
+    compressed = item["prompt_z"]
+    prompt = zlib.decompress(getattr(compressed, "value", compressed)).decode("utf-8")
+    if hashlib.sha256(prompt.encode("utf-8")).hexdigest() != prompt_hash:
+        raise ValueError(f"프롬프트 해시가 일치하지 않습니다: {prompt_hash}")
+    
+    with _prompt_cache_lock:
+        if len(_prompt_cache) >= PROMPT_CACHE_SIZE:
+            _prompt_cache.pop(next(iter(_prompt_cache)))
+        _prompt_cache[prompt_hash] = prompt
+    return prompt
 
-def update_job_status(job_id, chunk_id, status, result=None):
-    """작업 상태 업데이트"""
+def claim_chunk(job_id, chunk_id, lease_owner):
+    """
+    청크 처리 권한 획득
+    queued/failed 상태이거나 processing 임대가 만료된 경우에만 processing으로 전환 (dead_letter는 다시 처리하지 않음)
+    """
+    table = _jobs_table()
+    now = int(time.time())
     try:
-        table = dynamodb.Table(BATCH_JOBS_TABLE)
-        
-        update_data = {
-            "status": status,
-            "updated_at": datetime.utcnow().isoformat()
-        }
-        
-        if result:
-            update_data["result"] = result
-        
         table.update_item(
-            Key={"job_id": f"{job_id}#{chunk_id}"},
-            UpdateExpression="SET #status = :status, updated_at = :updated_at" + 
-                           (", #result = :result" if result else ""),
-            ExpressionAttributeNames={
-                "#status": "status",
-                **({"#result": "result"} if result else {})
-            },
+            Key={"job_id": job_id, "chunk_id": chunk_id},
+            UpdateExpression=(
+                "SET #status = :processing, lease_owner = :owner, lease_expires_at = :expires, "
+                "updated_at = :updated_at ADD attempts :one"
+            ),
+            ConditionExpression=(
+                "attribute_not_exists(#status) OR #status IN (:queued, :failed) "
+                "OR (#status = :processing AND lease_expires_at < :now)"
+            ),
+            ExpressionAttributeNames={"#status": "status"},
             ExpressionAttributeValues={
-                ":status": status,
-                ":updated_at": update_data["updated_at"],
-                **({"result": result} if result else {})
+                ":processing": "processing",
+                ":queued": "queued",
+                ":failed": "failed",
+                ":owner": lease_owner,
+                ":expires": now + CHUNK_LEASE_SECONDS,
+                ":now": now,
+                ":one": 1,
+                ":updated_at": datetime.utcnow().isoformat()
             }
         )
-        
+        return CLAIM_ACQUIRED
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        item = table.get_item(
+            Key={"job_id": job_id, "chunk_id": chunk_id},
+            ProjectionExpression="#status",
+            ExpressionAttributeNames={"#status": "status"},
+            ConsistentRead=True
+        ).get("Item") or {}
+        return CLAIM_DUPLICATE if item.get("status") == "completed" else CLAIM_BUSY
+
+def complete_chunk(job_id, chunk_id, result):
+    """
+    청크 완료 기록과 매니페스트 completed_chunks 증가를 하나의 트랜잭션으로 수행
+    이미 완료된 청크(임대 만료 후 재처리 경합)는 다시 집계하지 않음
+    """
+    table = _jobs_table()
+    updated_at = datetime.utcnow().isoformat()
+    try:
+        table.meta.client.transact_write_items(
+            TransactItems=[
+                {
+                    "Update": {
+                        "TableName": BATCH_JOBS_TABLE,
+                        "Key": {"job_id": job_id, "chunk_id": chunk_id},
+                        "UpdateExpression": (
+                            "SET #status = :completed, #result = :result, updated_at = :updated_at "
+                            "REMOVE lease_owner, lease_expires_at, #error"
+                        ),
+                        "ConditionExpression": "#status <> :completed",
+                        "ExpressionAttributeNames": {"#status": "status", "#result": "result", "#error": "error"},
+                        "ExpressionAttributeValues": {
+                            ":completed": "completed",
+                            ":result": result,
+                            ":updated_at": updated_at
+                        }
+                    }
+                },
+                {
+                    "Update": {
+                        "TableName": BATCH_JOBS_TABLE,
+                        "Key": {"job_id": job_id, "chunk_id": MANIFEST_ID},
+                        "UpdateExpression": "ADD completed_chunks :one SET updated_at = :updated_at",
+                        "ExpressionAttributeValues": {":one": 1, ":updated_at": updated_at}
+                    }
+                }
+            ]
+        )
+    except table.meta.client.exceptions.TransactionCanceledException as e:
+        reasons = e.response.get("CancellationReasons", [])
+        if not reasons or reasons[0].get("Code") != "ConditionalCheckFailed":
+            raise
+        print(f"청크가 이미 완료되어 집계하지 않음: job_id={job_id}, chunk_id={chunk_id}")
+
+def finish_job_if_complete(job_id):
+    """
+    모든 청크가 완료됐고 작업이 아직 completed가 아니면 리듀스 (리듀스 결과 반환, 아니면 None)
+    청크 완료 직후와 완료된 청크의 재전달 시 모두 호출하여 리듀스 실패 후에도 작업이 끝나도록 함
+    """
+    manifest = _jobs_table().get_item(
+        Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+        ConsistentRead=True
+    ).get("Item") or {}
+    completed = int(manifest.get("completed_chunks", 0))
+    total = int(manifest.get("total_chunks", 0))
+    print(f"작업 진행: job_id={job_id}, {completed}/{total}")
+    
+    if total and completed >= total and manifest.get("status") != "completed":
+        return reduce_job(job_id)
+    return None
+
+def release_chunk(job_id, chunk_id, lease_owner, error=None, status="failed"):
+    """
+    자신이 보유한 임대를 반납하고 상태 기록 (재시도 시 즉시 재획득 가능)
+    처리 실패는 failed, 예산 부족으로 미룬 경우는 queued
+    """
+    table = _jobs_table()
+    update_expression = "SET #status = :status, updated_at = :updated_at"
+    names = {"#status": "status"}
+    values = {
+        ":status": status,
+        ":processing": "processing",
+        ":owner": lease_owner,
+        ":updated_at": datetime.utcnow().isoformat()
+    }
+    if error:
+        update_expression += ", #error = :error"
+        names["#error"] = "error"
+        values[":error"] = error
+    try:
+        table.update_item(
+            Key={"job_id": job_id, "chunk_id": chunk_id},
+            UpdateExpression=update_expression + " REMOVE lease_owner, lease_expires_at",
+            ConditionExpression="#status = :processing AND lease_owner = :owner",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"임대가 이미 만료되어 상태를 기록하지 않음: job_id={job_id}, chunk_id={chunk_id}")
     except Exception as e:
         print(f"상태 업데이트 오류: {e}")
 
-def send_websocket_message(connection_id, message):
-    """WebSocket으로 메시지 전송"""
+def process_with_bedrock(content, prompt, model_id, on_delta=None, usage=None):
+    """Bedrock 스트리밍 호출로 AI 처리 (모델별 요청/응답 형식은 공유 레이어에서 처리)"""
     try:
-        # WebSocket API 엔드포인트 설정 (환경에 따라 조정 필요)
-        websocket_url = f"https://xov5aktydl.execute-api.{REGION}.amazonaws.com/prod"
-        
-        apigateway_client = boto3.client(
-            "apigatewaymanagementapi",
-            endpoint_url=websocket_url
-        )
+        final_prompt = f"{prompt}\n\n{content}"
         
-        apigateway_client.post_to_connection(
-            ConnectionId=connection_id,
-            Data=json.dumps(message)
-        )
+        parts = []
+        # 허가를 얻은 뒤에만 호출하고 스로틀링/지연 결과로 모델별 한도를 조정
+        with concurrency_controller.permit(model_id, timeout_seconds=PERMIT_TIMEOUT_SECONDS):
+            for text in invoke_stream(
+                bedrock_client,
+                model_id,
+                [{"role": "user", "content": final_prompt}],
+                max_tokens=4096,
+                temperature=0.1,
+                usage=usage
+            ):
+                parts.append(text)
+                if on_delta:
+                    on_delta(text)
+        return "".join(parts)
         
     except Exception as e:
-        print(f"WebSocket 전송 오류: {e}")
\ No newline at end of file
+        print(f"Bedrock 처리 오류: model={model_id}, {e}")
+        raise
+
+class ChunkStreamer:
+    """청크 부분 결과를 일정 간격으로 모아 WebSocket으로 전송"""
+    
+    def __init__(self, connection_id, job_id, chunk_id):
+        self.connection_id = connection_id
+        self.job_id = job_id
+        self.chunk_id = chunk_id
+        self.pending = []
+        self.sent_chars = 0
+        self.last_sent = time.time()
+    
+    def __call__(self, text):
+        self.pending.append(text)
+        if time.time() - self.last_sent >= STREAM_FLUSH_SECONDS:
+            self.flush()
+    
+    def flush(self):
+        if not self.pending:
+            return
+        text = "".join(self.pending)
+        self.pending = []
+        self.last_sent = time.time()
+        ws_delivery.enqueue(self.job_id, self.connection_id, {
+            "type": "chunk_delta",
+            "job_id": self.job_id,
+            "chunk_id": self.chunk_id,
+            "offset": self.sent_chars,
+            "text": text
+        })
+        self.sent_chars += len(text)
+
+def reduce_job(job_id):
+    """
+    모든 청크 결과를 순서대로 병합하여 최종 결과 항목 생성
+    running → reducing 전환 시 임대(reduce_owner, reduce_lease_expires_at)를 함께 기록하여 한 작업자만 실행
+    리듀스 도중 실패하면 임대를 반납하고, 반납하지 못하고 죽어도 임대가 만료되면 다른 작업자가 이어받음
+    """
+    table = _jobs_table()
+    reduce_owner = uuid.uuid4().hex
+    now = int(time.time())
+    try:
+        table.update_item(
+            Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+            UpdateExpression="SET #status = :reducing, reduce_owner = :owner, reduce_lease_expires_at = :expires",
+            ConditionExpression=(
+                "#status = :running OR (#status = :reducing AND "
+                "(attribute_not_exists(reduce_lease_expires_at) OR reduce_lease_expires_at < :now))"
+            ),
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={
+                ":reducing": "reducing",
+                ":running": "running",
+                ":owner": reduce_owner,
+                ":expires": now + REDUCE_LEASE_SECONDS,
+                ":now": now
+            }
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"리듀스 이미 진행됨: job_id={job_id}")
+        return None
+    
+    try:
+        return _reduce_results(table, job_id)
+    except Exception:
+        # 임대를 바로 만료시켜 재전달된 메시지가 즉시 리듀스를 다시 시도하도록 함
+        try:
+            table.update_item(
+                Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+                UpdateExpression="SET reduce_lease_expires_at = :expired",
+                ConditionExpression="#status = :reducing AND reduce_owner = :owner",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":expired": 0, ":reducing": "reducing", ":owner": reduce_owner}
+            )
+        except Exception as e:
+            print(f"리듀스 임대 반납 오류: job_id={job_id}, {e}")
+        raise
+
+def _reduce_results(table, job_id):
+    """청크 결과를 병합해 RESULT 항목을 기록하고 매니페스트를 completed로 전환"""
+    items = []
+    query_kwargs = {
+        "KeyConditionExpression": Key("job_id").eq(job_id) & Key("chunk_id").begins_with(CHUNK_PREFIX),
+        "ConsistentRead": True
+    }
+    while True:
+        response = table.query(**query_kwargs)
+        items.extend(response.get("Items", []))
+        if not response.get("LastEvaluatedKey"):
+            break
+        query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    
+    # chunk_id는 0으로 채운 번호이므로 정렬 키 순서가 곧 원문 순서
+    results = [item.get("result", "") for item in items if item.get("result")]
+    final_result = "\n\n".join(results)
+    compressed = zlib.compress(final_result.encode("utf-8"), 6)
+    completed_at = datetime.utcnow().isoformat()
+    
+    result_item = {
+        "job_id": job_id,
+        "chunk_id": RESULT_ID,
+        "chunk_count": len(items),
+        "result_length": len(final_result),
+        "created_at": completed_at,
+        "ttl": int(time.time()) + RESULT_TTL_SECONDS
+    }
+    if len(compressed) <= RESULT_MAX_BYTES:
+        result_item["result_z"] = compressed
+    else:
+        # 항목 크기 제한을 넘으면 청크 결과를 그대로 두고 조회 시 병합
+        print(f"최종 결과가 커서 청크 결과로 대체: job_id={job_id}, {len(compressed)}바이트")
+    table.put_item(Item=result_item)
+    
+    table.update_item(
+        Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+        UpdateExpression=(
+            "SET #status = :completed, completed_at = :completed_at REMOVE reduce_owner, reduce_lease_expires_at"
+        ),
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={":completed": "completed", ":completed_at": completed_at}
+    )
+    print(f"작업 리듀스 완료: job_id={job_id}, 청크 {len(items)}개, {len(final_result)}자")
+    return final_result
@@ -0,0 +1,223 @@
+"""
+배치 작업 WebSocket 전송
+- 엔드포인트는 작업 매니페스트 또는 연결 항목(domainName/stage)에서 확인하고 관리 API 클라이언트를 엔드포인트별로 캐시
+- 연결별로 메시지를 모아 한 번에 전송 (여러 청크가 동시에 처리되어도 전송 횟수 최소화)
+- GoneException이 발생하면 작업을 detached로 표시하여 이후 청크는 결과만 저장
+"""
+import json
+import os
+import threading
+import time
+import boto3
+
+BATCH_JOBS_TABLE = os.environ.get("BATCH_JOBS_TABLE")
+CONNECTIONS_TABLE = os.environ.get("CONNECTIONS_TABLE")
+REGION = os.environ.get("REGION")
+
+MANIFEST_ID = "MANIFEST"
+
+# 작업 전송 정보를 다시 읽기까지의 시간 (다른 컨테이너의 detached 표시 반영)
+DELIVERY_CACHE_TTL_SECONDS = 30
+# 연결별로 모은 메시지를 보내는 간격
+FLUSH_INTERVAL_SECONDS = 0.5
+# 한 WebSocket 프레임에 담을 최대 크기 (128KB 제한 여유 포함)
+MAX_FRAME_BYTES = 100 * 1024
+
+_session = boto3.session.Session()
+# boto3 resource는 스레드 간 공유가 안전하지 않으므로 스레드별로 생성
+_thread_local = threading.local()
+
+_lock = threading.Lock()
+_management_clients = {}  # endpoint -> apigatewaymanagementapi client
+_job_delivery = {}  # job_id -> {'connection_id', 'endpoint', 'detached', 'loaded_at'}
+_outboxes = {}  # connection_id -> {'endpoint', 'messages', 'job_ids', 'last_flush'}
+
+
+def _table(name):
+    tables = getattr(_thread_local, "tables", None)
+    if tables is None:
+        tables = _thread_local.tables = {}
+    if name not in tables:
+        tables[name] = boto3.session.Session().resource("dynamodb", region_name=REGION).Table(name)
+    return tables[name]
+
+
+def _management_client(endpoint):
+    with _lock:
+        client = _management_clients.get(endpoint)
+        if client is None:
+            client = _session.client("apigatewaymanagementapi", endpoint_url=endpoint, region_name=REGION)
+            _management_clients[endpoint] = client
+        return client
+
+
+def _endpoint_from_connection(connection_id):
+    """연결 항목의 domainName/stage로 관리 API 엔드포인트 구성"""
+    if not CONNECTIONS_TABLE:
+        return None
+    item = _table(CONNECTIONS_TABLE).get_item(
+        Key={"connectionId": connection_id},
+        ProjectionExpression="domainName, stage"
+    ).get("Item")
+    if not item or not item.get("domainName"):
+        return None
+    return f"https://{item['domainName']}/{item.get('stage', 'prod')}"
+
+
+def get_job_delivery(job_id, connection_id):
+    """
+    작업의 전송 정보 조회 (컨테이너 캐시)
+    엔드포인트를 처음 확인한 작업자가 매니페스트에 기록하여 다른 작업자는 연결 항목을 읽지 않음
+    """
+    now = time.time()
+    with _lock:
+        cached = _job_delivery.get(job_id)
+        if cached and (cached["detached"] or now - cached["loaded_at"] < DELIVERY_CACHE_TTL_SECONDS):
+            return cached
+
+    table = _table(BATCH_JOBS_TABLE)
+    manifest = table.get_item(
+        Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+        ProjectionExpression="delivery_status, websocket_endpoint"
+    ).get("Item") or {}
+
+    detached = manifest.get("delivery_status") == "detached"
+    endpoint = manifest.get("websocket_endpoint")
+    if not detached and not endpoint:
+        endpoint = _endpoint_from_connection(connection_id)
+        if endpoint:
+            table.update_item(
+                Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+                UpdateExpression="SET websocket_endpoint = if_not_exists(websocket_endpoint, :endpoint)",
+                ExpressionAttributeValues={":endpoint": endpoint}
+            )
+        else:
+            # 연결 항목이 없으면 이미 끊긴 연결
+            mark_detached(job_id, connection_id)
+            detached = True
+
+    delivery = {
+        "connection_id": connection_id,
+        "endpoint": endpoint,
+        "detached": detached,
+        "loaded_at": now
+    }
+    with _lock:
+        _job_delivery[job_id] = delivery
+    return delivery
+
+
+def mark_detached(job_id, connection_id):
+    """연결이 끊긴 작업을 detached로 표시 (이후 청크는 전송 없이 결과만 저장)"""
+    with _lock:
+        cached = _job_delivery.get(job_id)
+        if cached:
+            cached["detached"] = True
+    try:
+        _table(BATCH_JOBS_TABLE).update_item(
+            Key={"job_id": job_id, "chunk_id": MANIFEST_ID},
+            UpdateExpression="SET delivery_status = :detached",
+            ExpressionAttributeValues={":detached": "detached"}
+        )
+        print(f"작업 전송 중단(detached): job_id={job_id}, connection={connection_id}")
+    except Exception as e:
+        print(f"detached 표시 오류: job_id={job_id}, {e}")
+
+
+def enqueue(job_id, connection_id, message, force=False):
+    """
+    연결별 전송 대기열에 메시지 추가
+    전송 간격이 지났거나 force인 경우 즉시 전송
+    """
+    if not connection_id:
+        return
+    delivery = get_job_delivery(job_id, connection_id)
+    if delivery["detached"] or not delivery["endpoint"]:
+        return
+
+    with _lock:
+        outbox = _outboxes.setdefault(connection_id, {
+            "endpoint": delivery["endpoint"],
+            "messages": [],
+            "job_ids": set(),
+            "last_flush": time.time()
+        })
+        outbox["messages"].append(message)
+        outbox["job_ids"].add(job_id)
+        due = force or time.time() - outbox["last_flush"] >= FLUSH_INTERVAL_SECONDS
+
+    if due:
+        flush(connection_id)
+
+
+def _frames(messages):
+    """
+    메시지를 프레임 크기 제한 안에서 묶음 (하나면 그대로, 여럿이면 batch_updates로 전송)
+    단독으로도 제한을 넘는 메시지는 전송할 수 없으므로 건너뜀
+    """
+    frames, current, size = [], [], 0
+    for message in messages:
+        encoded_size = len(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+        if encoded_size > MAX_FRAME_BYTES:
+            print(f"프레임 크기 초과로 메시지 제외: type={message.get('type')}, job_id={message.get('job_id')}, {encoded_size}B")
+            continue
+        if current and size + encoded_size > MAX_FRAME_BYTES:
+            frames.append(current)
+            current, size = [], 0
+        current.append(message)
+        size += encoded_size
+    if current:
+        frames.append(current)
+
+    for frame in frames:
+        if len(frame) == 1:
+            yield json.dumps(frame[0], ensure_ascii=False)
+        else:
+            yield json.dumps({"type": "batch_updates", "messages": frame}, ensure_ascii=False)
+
+
+def flush(connection_id):
+    """
+    연결에 쌓인 메시지를 전송
+    프레임별로 오류를 처리하여 한 프레임이 실패해도 나머지는 전송 (GoneException이면 중단)
+    """
+    with _lock:
+        outbox = _outboxes.get(connection_id)
+        if not outbox or not outbox["messages"]:
+            return
+        messages, outbox["messages"] = outbox["messages"], []
+        job_ids = set(outbox["job_ids"])
+        outbox["last_flush"] = time.time()
+        endpoint = outbox["endpoint"]
+
+    client = _management_client(endpoint)
+    for data in _frames(messages):
+        try:
+            client.post_to_connection(ConnectionId=connection_id, Data=data)
+        except client.exceptions.GoneException:
+            print(f"WebSocket 연결 종료됨: {connection_id}")
+            with _lock:
+                _outboxes.pop(connection_id, None)
+            for job_id in job_ids:
+                mark_detached(job_id, connection_id)
+            _delete_connection(connection_id)
+            return
+        except Exception as e:
+            print(f"WebSocket 프레임 전송 오류: {connection_id}, {e}")
+
+
+def flush_all():
+    """대기 중인 모든 연결의 메시지 전송 (핸들러 종료 전 호출)"""
+    with _lock:
+        connection_ids = [cid for cid, outbox in _outboxes.items() if outbox["messages"]]
+    for connection_id in connection_ids:
+        flush(connection_id)
+
+
+def _delete_connection(connection_id):
+    if not CONNECTIONS_TABLE:
+        return
+    try:
+        _table(CONNECTIONS_TABLE).delete_item(Key={"connectionId": connection_id})
+    except Exception as e:
+        print(f"연결 항목 삭제 오류: {connection_id}, {e}")
@@ -0,0 +1,461 @@
+"""
+프롬프트 카드 오프라인 평가 Lambda 함수
+- 카드 버전 하나를 골든 코퍼스(S3 JSONL, 한 줄에 기사 하나)의 모든 기사에 동시에 실행
+- 기사별로 출력, 입력/출력 토큰, 첫 토큰까지 시간(TTFT), 전체 지연 시간을 기록
+- 보고서를 S3(evaluation/reports/{cardId}/{version}.json)에 저장하고 같은 카드의 이전 버전 보고서와 비교
+  (입력 토큰 증가 = 프롬프트 비대화, 지연 시간 증가를 배포 전에 확인)
+- 실제 모델 대신 스텁 Bedrock(stub=true)으로도 실행 가능, 로컬 실행(--local)은 항상 스텁 사용
+  PYTHONPATH=../shared/python python evaluation.py --local corpus.jsonl --card card.txt
+"""
+import argparse
+import json
+import os
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+
+from bedrock_provider import get_provider, invoke_stream
+from card_store import CardStore
+from card_versions import load_version_cards
+from prompt_bundle import bundle_cards, load_bundle
+from thought_log import ThoughtLogWriter
+from token_budget import PRIORITY_BATCH, BudgetExhausted, TokenBudget, estimate_tokens
+
+# 환경 변수
+PROMPT_META_TABLE = os.environ.get("PROMPT_META_TABLE")
+PROMPT_BUCKET = os.environ.get("PROMPT_BUCKET")
+EVALUATION_BUCKET = os.environ.get("EVALUATION_BUCKET") or PROMPT_BUCKET
+AGENT_THOUGHTS_TABLE = os.environ.get("AGENT_THOUGHTS_TABLE")
+PROMPT_VERSIONS_TABLE = os.environ.get("PROMPT_VERSIONS_TABLE")
+REGION = os.environ.get("REGION")
+
+DEFAULT_MODEL_ID = "apac.anthropic.claude-sonnet-4-20250514-v1:0"
+DEFAULT_CORPUS_KEY = "evaluation/golden/articles.jsonl"
+REPORT_PREFIX = "evaluation/reports/"
+# 기사 동시 실행 수 (실제 모델 호출 시 TPM 예산도 함께 적용)
+EVALUATION_CONCURRENCY = int(os.environ.get("EVALUATION_CONCURRENCY", "4"))
+EVALUATION_MAX_TOKENS = 1024
+# 이전 버전 대비 이 비율 이상 늘어나면 회귀로 표시
+INPUT_TOKEN_REGRESSION_RATIO = float(os.environ.get("INPUT_TOKEN_REGRESSION_RATIO", "0.10"))
+LATENCY_REGRESSION_RATIO = float(os.environ.get("LATENCY_REGRESSION_RATIO", "0.20"))
+# 보고서에 남길 기사별 출력 최대 길이
+MAX_OUTPUT_CHARS = 2000
+
+# AWS 클라이언트는 처음 사용할 때 생성 (--local 실행은 리전 설정 없이도 모듈을 불러올 수 있어야 함)
+_clients = {}
+
+
+def _client(service):
+    if service not in _clients:
+        _clients[service] = boto3.client(service, region_name=REGION)
+    return _clients[service]
+
+
+def _dynamodb():
+    if "dynamodb" not in _clients:
+        _clients["dynamodb"] = boto3.resource("dynamodb", region_name=REGION)
+    return _clients["dynamodb"]
+
+# 평가 호출은 배치 우선순위로 예산 차감 (대화형 예약분을 침범하지 않음)
+token_budget = TokenBudget()
+
+
+def handler(event, context):
+    """
+    예상 이벤트 (save_prompt의 start_evaluation_process가 비동기 호출):
+    {cardId, version, adminId, sessionId, [corpusKey], [modelId], [stub], [baselineVersion]}
+    """
+    session_id = event.get("sessionId") or str(uuid.uuid4())
+    thoughts = ThoughtLogWriter(AGENT_THOUGHTS_TABLE)
+    try:
+        card_id = event["cardId"]
+        card = load_card(card_id, event.get("version"))
+        version = str(card["version"])
+        model_id = event.get("modelId") or DEFAULT_MODEL_ID
+        corpus_key = event.get("corpusKey") or DEFAULT_CORPUS_KEY
+        stub = bool(event.get("stub"))
+
+        articles = load_corpus(EVALUATION_BUCKET, corpus_key)
+        thoughts.log(session_id, card_id, 1, "planning",
+                     f"카드 {card_id} 버전 {version}을 기사 {len(articles)}개로 평가합니다 "
+                     f"(모델: {model_id}{', 스텁' if stub else ''})")
+
+        system_prompt = build_system_prompt(card)
+        client = StubBedrockClient() if stub else _client("bedrock-runtime")
+        results = run_evaluation(articles, system_prompt, model_id, client, use_budget=not stub)
+        report = build_report(card_id, version, model_id, corpus_key, stub, system_prompt, results)
+        thoughts.log(session_id, card_id, 2, "observation", _summary_line(report["summary"]))
+
+        baseline = load_baseline_report(card_id, version, event.get("baselineVersion"))
+        report["comparison"] = compare_reports(report, baseline)
+        report["sessionId"] = session_id
+        report_key = save_report(report)
+        thoughts.log(session_id, card_id, 3, "conclusion", _comparison_line(report["comparison"]))
+
+        return {"statusCode": 200, "body": json.dumps({
+            "sessionId": session_id,
+            "reportKey": report_key,
+            "summary": report["summary"],
+            "comparison": report["comparison"]
+        }, ensure_ascii=False)}
+    except Exception as e:
+        print(f"평가 오류: {traceback.format_exc()}")
+        thoughts.log(session_id, event.get("cardId"), 99, "error", f"평가 실패: {e}")
+        return {"statusCode": 500, "body": json.dumps({"sessionId": session_id, "error": str(e)}, ensure_ascii=False)}
+    finally:
+        thoughts.flush()
+
+
+# --- 입력 준비 ---
+
+def load_card(card_id, version=None):
+    """
+    평가할 카드 (버전을 지정하면 버전 이력에서, 없으면 메타 테이블의 활성 버전)
+    버전 항목은 불변이라 평가 중 카드가 수정돼도 보고서와 본문이 어긋나지 않음
+    보고서는 버전별로 저장하므로 버전이 없는 카드(버전 이력 도입 전 카드)는 평가하지 않음
+    """
+    if version is not None:
+        if not PROMPT_VERSIONS_TABLE:
+            raise ValueError("PROMPT_VERSIONS_TABLE이 설정되지 않아 카드 버전을 지정할 수 없습니다")
+        cards = load_version_cards(_dynamodb().Table(PROMPT_VERSIONS_TABLE), CardStore(_client("s3"), PROMPT_BUCKET),
+                                   [(card_id, str(version))])
+        card = cards.get((card_id, str(version)))
+        if not card:
+            raise ValueError(f"프롬프트 카드 버전을 찾을 수 없습니다: {card_id} v{version}")
+        return card
+
+    table = _dynamodb().Table(PROMPT_META_TABLE)
+    item = table.get_item(Key={"promptId": card_id}).get("Item")
+    if not item:
+        raise ValueError(f"프롬프트 카드를 찾을 수 없습니다: {card_id}")
+    if item.get("version") is None:
+        raise ValueError(f"카드에 버전이 없습니다 (scripts/backfill_card_versions.py로 버전 이력을 먼저 기록하세요): {card_id}")
+    content = CardStore(_client("s3"), PROMPT_BUCKET).read_content(item)
+    return {**item, "version": int(item["version"]), "content": content}
+
+
+def load_corpus(bucket, key):
+    """골든 코퍼스 JSONL ({"id": ..., "content": ...}) 로드"""
+    body = _client("s3").get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+
+def build_system_prompt(card):
+    """
+    실제 생성 시와 같은 시스템 프롬프트: 현재 활성 카드 번들에서 평가 대상 카드만 후보 본문으로 교체
+    (번들이 없으면 후보 카드만 사용)
+    """
+    cards = []
+    try:
+        bundle = load_bundle(_dynamodb().Table(PROMPT_META_TABLE), _client("s3"), PROMPT_BUCKET)
+        cards = (bundle_cards(bundle) or []) if bundle else []
+    except Exception as e:
+        print(f"프롬프트 번들 로드 실패 - 후보 카드만 사용: {e}")
+
+    parts, replaced = [], False
+    for existing in cards:
+        if existing["promptId"] == card["promptId"]:
+            parts.append(card["content"].strip())
+            replaced = True
+        else:
+            parts.append(existing["content"])
+    if not replaced:
+        parts.append(card["content"].strip())
+    return "\n\n".join(part for part in parts if part)
+
+
+# --- 실행 ---
+
+def run_evaluation(articles, system_prompt, model_id, client, use_budget=True, concurrency=EVALUATION_CONCURRENCY):
+    """기사별로 동시에 스트리밍 호출하고 결과를 입력 순서대로 반환"""
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(articles) or 1))) as executor:
+        futures = [
+            executor.submit(evaluate_article, article, index, system_prompt, model_id, client, use_budget)
+            for index, article in enumerate(articles)
+        ]
+        return [future.result() for future in futures]
+
+
+def evaluate_article(article, index, system_prompt, model_id, client, use_budget=True):
+    """기사 하나 실행: 출력, 토큰 사용량, TTFT, 전체 지연 시간 기록"""
+    article_id = article.get("id", index)
+    content = article.get("content", "")
+    reserved = estimate_tokens(system_prompt + content, EVALUATION_MAX_TOKENS)
+    if use_budget:
+        _take_budget(reserved)
+
+    usage = {}
+    chunks = []
+    started = time.perf_counter()
+    first_token_at = None
+    try:
+        for delta in invoke_stream(client, model_id, [{"role": "user", "content": content}],
+                                   system=system_prompt, max_tokens=EVALUATION_MAX_TOKENS, usage=usage):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            chunks.append(delta)
+    except Exception as e:
+        return {"id": article_id, "error": str(e), "latencyMs": _ms(time.perf_counter() - started)}
+    finally:
+        # 사용량을 받기 전에 실패해도 예약한 토큰은 반환 (실제 사용량 0으로 정산)
+        if use_budget:
+            token_budget.settle(reserved, usage.get("input_tokens", 0) + usage.get("output_tokens", 0), PRIORITY_BATCH)
+
+    finished = time.perf_counter()
+    output = "".join(chunks)
+    return {
+        "id": article_id,
+        "output": output[:MAX_OUTPUT_CHARS],
+        "inputTokens": usage.get("input_tokens", 0),
+        "outputTokens": usage.get("output_tokens", 0),
+        "ttftMs": _ms(first_token_at - started) if first_token_at else None,
+        "latencyMs": _ms(finished - started)
+    }
+
+
+def _take_budget(tokens):
+    """배치 우선순위로 예산 차감 (부족하면 안내된 시간만큼 기다렸다가 재시도)"""
+    while True:
+        try:
+            token_budget.take(tokens, PRIORITY_BATCH)
+            return
+        except BudgetExhausted as e:
+            time.sleep(e.retry_after)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+# --- 보고서 ---
+
+def _percentile(values, percent):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return round(values[lower] + (values[upper] - values[lower]) * (position - lower), 1)
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return round(sum(values) / len(values), 1) if values else None
+
+
+def build_report(card_id, version, model_id, corpus_key, stub, system_prompt, results):
+    succeeded = [result for result in results if "error" not in result]
+    summary = {
+        "articles": len(results),
+        "errors": len(results) - len(succeeded),
+        "systemPromptChars": len(system_prompt),
+        "systemPromptTokens": estimate_tokens(system_prompt),
+        "inputTokensMean": _mean([result["inputTokens"] for result in succeeded]),
+        "inputTokensTotal": sum(result["inputTokens"] for result in succeeded),
+        "outputTokensMean": _mean([result["outputTokens"] for result in succeeded]),
+        "outputTokensTotal": sum(result["outputTokens"] for result in succeeded),
+        "ttftMsP50": _percentile([result["ttftMs"] for result in succeeded], 50),
+        "ttftMsP95": _percentile([result["ttftMs"] for result in succeeded], 95),
+        "latencyMsP50": _percentile([result["latencyMs"] for result in succeeded], 50),
+        "latencyMsP95": _percentile([result["latencyMs"] for result in succeeded], 95)
+    }
+    return {
+        "cardId": card_id,
+        "version": version,
+        "modelId": model_id,
+        "corpusKey": corpus_key,
+        "stub": stub,
+        "evaluatedAt": datetime.now(timezone.utc).isoformat(),
+        "summary": summary,
+        "results": results
+    }
+
+
+COMPARED_METRICS = (
+    ("inputTokensMean", INPUT_TOKEN_REGRESSION_RATIO),
+    ("outputTokensMean", None),
+    ("ttftMsP50", LATENCY_REGRESSION_RATIO),
+    ("ttftMsP95", LATENCY_REGRESSION_RATIO),
+    ("latencyMsP50", LATENCY_REGRESSION_RATIO),
+    ("latencyMsP95", LATENCY_REGRESSION_RATIO)
+)
+
+
+def compare_reports(report, baseline):
+    """
+    이전 버전 보고서와 지표 비교
+    입력 토큰이나 지연 시간이 허용 비율 이상 늘어나면 regressions에 기록 (스텁과 실제 모델 결과는 지연 시간 비교 안 함)
+    """
+    if not baseline:
+        return {"baselineVersion": None, "verdict": "no_baseline", "metrics": {}, "regressions": []}
+
+    comparable_latency = baseline.get("stub") == report["stub"] and baseline.get("modelId") == report["modelId"]
+    metrics, regressions = {}, []
+    for name, ratio in COMPARED_METRICS:
+        current = report["summary"].get(name)
+        previous = baseline.get("summary", {}).get(name)
+        if current is None or previous is None:
+            continue
+        change = round((current - previous) / previous, 4) if previous else None
+        metrics[name] = {"previous": previous, "current": current, "change": change}
+        is_latency = name.startswith(("ttft", "latency"))
+        if ratio is not None and change is not None and change > ratio and (comparable_latency or not is_latency):
+            regressions.append(name)
+
+    return {
+        "baselineVersion": baseline.get("version"),
+        "verdict": "regression" if regressions else "pass",
+        "metrics": metrics,
+        "regressions": regressions
+    }
+
+
+def _report_key(card_id, version):
+    return f"{REPORT_PREFIX}{card_id}/{version}.json"
+
+
+def _index_key(card_id):
+    return f"{REPORT_PREFIX}{card_id}/index.json"
+
+
+def _read_json(key):
+    try:
+        return json.loads(_client("s3").get_object(Bucket=EVALUATION_BUCKET, Key=key)["Body"].read())
+    except _client("s3").exceptions.NoSuchKey:
+        return None
+
+
+def load_baseline_report(card_id, version, baseline_version=None):
+    """비교 기준 보고서: 지정된 버전, 없으면 평가 이력에서 현재 버전이 아닌 가장 최근 버전"""
+    if baseline_version:
+        return _read_json(_report_key(card_id, baseline_version))
+    index = _read_json(_index_key(card_id)) or {"reports": []}
+    for entry in reversed(index["reports"]):
+        if entry["version"] != version:
+            return _read_json(entry["key"])
+    return None
+
+
+def save_report(report):
+    """보고서 저장 후 카드별 평가 이력(index.json) 갱신"""
+    key = _report_key(report["cardId"], report["version"])
+    _client("s3").put_object(
+        Bucket=EVALUATION_BUCKET,
+        Key=key,
+        Body=json.dumps(report, ensure_ascii=False).encode("utf-8"),
+        ContentType="application/json"
+    )
+    index = _read_json(_index_key(report["cardId"])) or {"cardId": report["cardId"], "reports": []}
+    index["reports"] = [entry for entry in index["reports"] if entry["version"] != report["version"]]
+    index["reports"].append({"version": report["version"], "key": key, "evaluatedAt": report["evaluatedAt"]})
+    _client("s3").put_object(
+        Bucket=EVALUATION_BUCKET,
+        Key=_index_key(report["cardId"]),
+        Body=json.dumps(index, ensure_ascii=False).encode("utf-8"),
+        ContentType="application/json"
+    )
+    print(f"평가 보고서 저장: s3://{EVALUATION_BUCKET}/{key}")
+    return key
+
+
+def _summary_line(summary):
+    return (f"기사 {summary['articles']}개 (오류 {summary['errors']}개), 시스템 프롬프트 {summary['systemPromptTokens']} 토큰, "
+            f"평균 입력 {summary['inputTokensMean']} / 출력 {summary['outputTokensMean']} 토큰, "
+            f"TTFT p50 {summary['ttftMsP50']}ms, 지연 p95 {summary['latencyMsP95']}ms")
+
+
+def _comparison_line(comparison):
+    if comparison["verdict"] == "no_baseline":
+        return "비교할 이전 버전 보고서가 없습니다."
+    if comparison["regressions"]:
+        return f"버전 {comparison['baselineVersion']} 대비 회귀: {', '.join(comparison['regressions'])}"
+    return f"버전 {comparison['baselineVersion']} 대비 회귀 없음"
+
+
+# --- 스텁 Bedrock ---
+
+class StubBedrockClient:
+    """
+    bedrock-runtime의 invoke_model_with_response_stream 대체
+    입력 마지막 줄로 만든 고정 제목을 제공자별 스트림 청크로 반환 (입력 길이에 비례한 TTFT 지연 포함)
+    """
+
+    def __init__(self, seconds_per_1k_input_tokens=0.02, seconds_per_chunk=0.005):
+        self.seconds_per_1k_input_tokens = seconds_per_1k_input_tokens
+        self.seconds_per_chunk = seconds_per_chunk
+
+    def invoke_model_with_response_stream(self, modelId, body):
+        request = json.loads(body)
+        provider = get_provider(modelId)
+        if provider == "anthropic":
+            system, text = request.get("system", ""), request["messages"][-1]["content"]
+        elif provider == "meta":
+            system, text = "", request["prompt"]
+        else:
+            system = "".join(block["text"] for block in request.get("system", []))
+            text = request["messages"][-1]["content"][0]["text"]
+
+        input_tokens = estimate_tokens(system + text)
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        title = f"[stub] {(lines[-1] if lines else '')[:60]}"
+        pieces = [title[i:i + 8] for i in range(0, len(title), 8)]
+        output_tokens = max(1, len(title) // 4)
+        return {"body": self._events(provider, pieces, input_tokens, output_tokens)}
+
+    def _events(self, provider, pieces, input_tokens, output_tokens):
+        time.sleep(self.seconds_per_1k_input_tokens * input_tokens / 1000)
+        if provider == "anthropic":
+            chunks = [{"type": "message_start", "message": {"usage": {"input_tokens": input_tokens}}}]
+            chunks += [{"type": "content_block_delta", "delta": {"text": piece}} for piece in pieces]
+            chunks.append({"type": "message_delta", "usage": {"output_tokens": output_tokens}})
+        elif provider == "meta":
+            chunks = [{"generation": piece} for piece in pieces]
+            chunks.append({"generation": "", "prompt_token_count": input_tokens, "generation_token_count": output_tokens})
+        else:
+            chunks = [{"contentBlockDelta": {"delta": {"text": piece}}} for piece in pieces]
+            chunks.append({"metadata": {"usage": {"inputTokens": input_tokens, "outputTokens": output_tokens}}})
+        for chunk in chunks:
+            time.sleep(self.seconds_per_chunk)
+            yield {"chunk": {"bytes": json.dumps(chunk, ensure_ascii=False).encode("utf-8")}}
+
+
+# --- 로컬 실행 (스텁 모델) ---
+
+def run_local(corpus_path, card_path, model_id, out_dir, baseline_path=None, version="local"):
+    """로컬 평가: 코퍼스 파일과 카드 본문 파일로 스텁 실행 후 보고서(및 기준 보고서 비교) 작성"""
+    with open(corpus_path, encoding="utf-8") as f:
+        articles = [json.loads(line) for line in f if line.strip()]
+    with open(card_path, encoding="utf-8") as f:
+        system_prompt = f.read().strip()
+
+    results = run_evaluation(articles, system_prompt, model_id, StubBedrockClient(), use_budget=False)
+    report = build_report(os.path.basename(card_path), version, model_id, corpus_path, True, system_prompt, results)
+    baseline = None
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report["comparison"] = compare_reports(report, baseline)
+
+    os.makedirs(out_dir, exist_ok=True)
+    report_path = os.path.join(out_dir, f"report-{version}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return {"report": report_path, "summary": report["summary"], "comparison": report["comparison"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="프롬프트 카드 오프라인 평가 (로컬 스텁 실행)")
+    parser.add_argument("--local", required=True, help="골든 코퍼스 JSONL 경로 ({\"id\": ..., \"content\": ...} 한 줄에 한 기사)")
+    parser.add_argument("--card", required=True, help="평가할 카드 본문 파일")
+    parser.add_argument("--baseline", help="비교할 이전 보고서 JSON")
+    parser.add_argument("--version", default="local")
+    parser.add_argument("--model", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--out", default="evaluation-local")
+    args = parser.parse_args()
+    print(json.dumps(run_local(args.local, args.card, args.model, args.out, args.baseline, args.version),
+                     ensure_ascii=False, indent=2))
@@ -10,13 +10,35 @@ import traceback
 import boto3
 from datetime import datetime
 
+from token_budget import TokenBudget, estimate_tokens
+from stream_limiter import StreamLimiter, StreamLimitExceeded
+from prompt_template import TemplateRenderError, render_cards, resolve_placeholder_values
+
 # --- AWS 클라이언트 및 기본 설정 ---
 bedrock_client = boto3.client("bedrock-runtime", region_name=os.environ.get("REGION", "YOUR-REGION"))
 dynamodb_client = boto3.client("dynamodb", region_name=os.environ.get("REGION", "YOUR-REGION"))
+s3_client = boto3.client("s3", region_name=os.environ.get("REGION", "YOUR-REGION"))
 PROMPT_META_TABLE = os.environ.get("PROMPT_META_TABLE", "BedrockDiyPrompts")
+prompt_meta_table = boto3.resource("dynamodb", region_name=os.environ.get("REGION", "YOUR-REGION")).Table(PROMPT_META_TABLE)
+# 사용자 placeholder 값 (promptInstanceId로 조회)
+PROMPT_INSTANCE_TABLE = os.environ.get("PROMPT_INSTANCE_TABLE")
+prompt_instance_table = (boto3.resource("dynamodb", region_name=os.environ.get("REGION", "YOUR-REGION")).Table(PROMPT_INSTANCE_TABLE)
+                         if PROMPT_INSTANCE_TABLE else None)
+# 카드 버전 이력 (promptCardIds로 고정된 버전 해석)
+PROMPT_VERSIONS_TABLE = os.environ.get("PROMPT_VERSIONS_TABLE")
+prompt_versions_table = (boto3.resource("dynamodb", region_name=os.environ.get("REGION", "YOUR-REGION")).Table(PROMPT_VERSIONS_TABLE)
+                         if PROMPT_VERSIONS_TABLE else None)
 # 기본 모델 ID (프론트엔드에서 지정하지 않을 때 사용)
 DEFAULT_MODEL_ID = "apac.anthropic.claude-sonnet-4-20250514-v1:0"
 
+# 계정 TPM 예산 (대화형 우선순위, RATE_CONTROL_TABLE이 없으면 제한 없음)
+token_budget = TokenBudget()
+# 예산 차감 시 가정하는 출력 토큰 수
+EXPECTED_OUTPUT_TOKENS = 2048
+
+# 사용자별 동시 생성 요청 제한 (WebSocket 스트림과 같은 lease를 공유)
+stream_limiter = StreamLimiter()
+
 # 토큰 및 길이 제한 설정
 MAX_INPUT_LENGTH = 150000  # 약 150K 문자 (약 37.5K 토큰)
 MAX_TOTAL_TOKENS = 180000  # Claude의 200K 토큰 한계 고려
@@ -66,6 +88,9 @@ def handler(event, context):
             return _handle_s3_upload_request(event)
         elif path == "/generate/s3-process":
             return _handle_s3_process_request(event)
+        elif path.startswith("/generate/jobs/") and http_method == 'GET':
+            job_id = (event.get('pathParameters') or {}).get('id') or path.rsplit('/', 1)[-1]
+            return _handle_job_status_request(job_id, _verified_user_id(event))
 
         # 요청 본문(body) 파싱
         if http_method == 'GET':
@@ -74,23 +99,41 @@ def handler(event, context):
             chat_history_str = params.get('chat_history', '[]')
             chat_history = json.loads(chat_history_str)
             model_id = params.get('modelId', DEFAULT_MODEL_ID)
+            connection_id = None
         else: # POST
             body = json.loads(event.get('body', '{}'))
             user_input = body.get('userInput', '')
             chat_history = body.get('chat_history', [])
             prompt_cards = body.get('prompt_cards', [])
             model_id = body.get('modelId', DEFAULT_MODEL_ID)
+            # 배치 처리 시 부분 결과를 받을 WebSocket 연결 (선택)
+            connection_id = body.get('connectionId')
             
         if not user_input.strip():
             return _create_error_response(400, "사용자 입력이 필요합니다.")
         
+        # 카드 템플릿 placeholder 값 (프롬프트 인스턴스 + 요청 본문, 없으면 렌더링하지 않음)
+        placeholder_values = None
+        if http_method == 'POST':
+            try:
+                placeholder_values = resolve_placeholder_values(
+                    prompt_instance_table, body.get('promptInstanceId'), body.get('placeholderValues')
+                )
+            except TemplateRenderError as e:
+                return _create_error_response(400, str(e))
+            
+            # 카드 본문 대신 카드 ID(버전 고정 가능)를 보내면 번들/버전 이력에서 해석
+            if not prompt_cards and body.get('promptCardIds'):
+                prompt_cards = _resolve_prompt_card_refs(body['promptCardIds'])
+        
         # 입력 길이 체크 및 전처리
         content_length = len(user_input)
         
         # 대용량 문서 감지 (200K 문자 이상)
         if content_length > 200000:
             print(f"대용량 문서 감지: {content_length:,}자 - 배치 처리 모드")
-            return _handle_batch_processing(user_input, chat_history, prompt_cards, model_id)
+            return _handle_batch_processing(user_input, chat_history, prompt_cards, model_id, connection_id,
+                                            user_id=_verified_user_id(event))
         
         processed_input = _preprocess_long_content(user_input)
         if isinstance(processed_input, dict) and processed_input.get('error'):
@@ -111,11 +154,22 @@ def handler(event, context):
         print(f"선택된 모델: {model_id} ({SUPPORTED_MODELS.get(model_id, {}).get('name', 'Unknown')})")
         print(f"요청 본문에서 받은 modelId: {body.get('modelId') if http_method == 'POST' else params.get('modelId')}")
         
-        # 스트리밍 또는 일반 생성 분기
-        if "/stream" in path:
-            return _handle_streaming_generation(user_input, chat_history, prompt_cards, model_id)
-        else:
-            return _handle_standard_generation(user_input, chat_history, prompt_cards, model_id)
+        # 사용자별 동시 생성 제한 (한도에 도달하면 잠시 대기 후 429)
+        limit_key = _request_limit_key(event)
+        try:
+            lease_id = stream_limiter.acquire(limit_key)
+        except StreamLimitExceeded as e:
+            print(f"동시 생성 한도 초과로 거절: {limit_key} ({e.active}/{e.limit})")
+            return _create_rate_limited_response(e)
+        
+        try:
+            # 스트리밍 또는 일반 생성 분기
+            if "/stream" in path:
+                return _handle_streaming_generation(user_input, chat_history, prompt_cards, model_id, placeholder_values)
+            else:
+                return _handle_standard_generation(user_input, chat_history, prompt_cards, model_id, placeholder_values)
+        finally:
+            stream_limiter.release(limit_key, lease_id)
 
     except json.JSONDecodeError:
         print("JSON 파싱 오류 발생")
@@ -124,14 +178,14 @@ def handler(event, context):
         print(f"오류 발생: {traceback.format_exc()}")
         return _create_error_response(500, f"서버 내부 오류: {e}")
 
-def _handle_streaming_generation(user_input, chat_history, prompt_cards, model_id):
+def _handle_streaming_generation(user_input, chat_history, prompt_cards, model_id, placeholder_values=None):
     """
     Bedrock에서 스트리밍 응답을 받아 실시간으로 반환합니다.
     청크별로 즉시 SSE 형식으로 구성하여 반환합니다.
     """
     try:
         print(f"스트리밍 생성 시작: 모델={model_id}")
-        final_prompt = _build_final_prompt(user_input, chat_history, prompt_cards)
+        final_prompt = _build_final_prompt(user_input, chat_history, prompt_cards, placeholder_values)
         
         # 동적 토큰 할당
         max_tokens = _calculate_dynamic_max_tokens(len(final_prompt))
@@ -155,6 +209,9 @@ def _handle_streaming_generation(user_input, chat_history, prompt_cards, model_i
                 "top_p": 0.9,
             }
 
+        # TPM 예산 차감 (대화형 요청은 부족해도 잠시 대기 후 진행)
+        token_budget.take(estimate_tokens(final_prompt, EXPECTED_OUTPUT_TOKENS))
+        
         # 재시도 로직을 포함한 Bedrock 호출
         response_stream = _invoke_bedrock_with_retry(
             model_id, request_body, max_retries=3
@@ -217,6 +274,8 @@ def _handle_streaming_generation(user_input, chat_history, prompt_cards, model_i
             "isBase64Encoded": False
         }
                 
+    except TemplateRenderError as e:
+        return _create_error_response(400, str(e))
     except Exception as e:
         print(f"스트리밍 오류: {traceback.format_exc()}")
         
@@ -235,11 +294,11 @@ def _handle_streaming_generation(user_input, chat_history, prompt_cards, model_i
             "isBase64Encoded": False
         }
 
-def _handle_standard_generation(user_input, chat_history, prompt_cards, model_id):
+def _handle_standard_generation(user_input, chat_history, prompt_cards, model_id, placeholder_values=None):
     """일반(non-streaming) Bedrock 응답을 처리합니다."""
     try:
         print(f"일반 생성 시작: 모델={model_id}")
-        final_prompt = _build_final_prompt(user_input, chat_history, prompt_cards)
+        final_prompt = _build_final_prompt(user_input, chat_history, prompt_cards, placeholder_values)
         
         # 모델에 따른 요청 본문 구성
         if model_id.startswith("anthropic."):
@@ -259,12 +318,20 @@ def _handle_standard_generation(user_input, chat_history, prompt_cards, model_id
                 "top_p": 0.9,
             }
 
+        reserved_tokens = estimate_tokens(final_prompt, EXPECTED_OUTPUT_TOKENS)
+        token_budget.take(reserved_tokens)
+        
         response = bedrock_client.invoke_model(
             modelId=model_id,
             body=json.dumps(request_body)
         )
         response_body = json.loads(response['body'].read())
         
+        # 실제 사용량으로 예산 정산
+        usage = response_body.get('usage', {})
+        if usage:
+            token_budget.settle(reserved_tokens, usage.get('input_tokens', 0) + usage.get('output_tokens', 0))
+        
         # 모델별 응답 형식 처리
         if model_id.startswith("anthropic."):
             # Anthropic 모델 응답 형식
@@ -285,18 +352,76 @@ def _handle_standard_generation(user_input, chat_history, prompt_cards, model_id
             "body": json.dumps({"result": result_text}),
             "isBase64Encoded": False
         }
+    except TemplateRenderError as e:
+        return _create_error_response(400, str(e))
     except Exception as e:
         print(f"일반 생성 오류: {traceback.format_exc()}")
         return _create_error_response(500, f"Bedrock 호출 오류: {e}")
 
-def _build_final_prompt(user_input, chat_history, prompt_cards):
+def _load_prompt_bundle():
+    """활성 카드 번들 (포인터 GetItem 1회 + 해시별 캐시), 없거나 실패하면 None"""
+    try:
+        from prompt_bundle import load_bundle
+
+        bundle = load_bundle(prompt_meta_table, s3_client, os.environ.get('PROMPT_BUCKET', ''))
+        if bundle:
+            print(f"프롬프트 번들 사용: {bundle['hash'][:12]} ({len(bundle['cards'])}개 카드, {bundle['totalTokens']} 토큰)")
+        return bundle
+    except Exception as e:
+        print(f"프롬프트 번들 로드 실패: {str(e)}")
+        return None
+
+def _resolve_prompt_card_refs(card_refs):
+    """
+    promptCardIds(문자열 또는 {promptId, version})를 요청 순서대로 카드로 해석
+    - 버전이 없으면 번들의 활성 버전으로 고정 (요청 처리 중 카드가 수정돼도 한 버전만 사용)
+    - 번들에 같은 버전이 있으면 번들에서 잘라 쓰고, 나머지는 버전 이력에서 조회 (불변 버전 캐시)
+    """
+    from card_store import CardStore
+    from card_versions import load_version_cards, normalize_card_refs
+    from prompt_bundle import bundle_cards
+
+    bundle = _load_prompt_bundle()
+    entries = {entry['promptId']: entry for entry in bundle['cards']} if bundle else {}
+    refs = []
+    for prompt_id, version in normalize_card_refs(card_refs):
+        if version is None and prompt_id in entries:
+            version = entries[prompt_id].get('version')
+        refs.append((prompt_id, version))
+
+    in_bundle = [ref for ref in refs if ref[0] in entries and entries[ref[0]].get('version') == ref[1]]
+    bundled = {card['promptId']: card for card in bundle_cards(bundle, in_bundle) or []} if in_bundle else {}
+    pinned = {}
+    pinned_refs = [ref for ref in refs if ref not in in_bundle]
+    if pinned_refs:
+        if prompt_versions_table is not None:
+            card_store = CardStore(s3_client, os.environ.get('PROMPT_BUCKET', ''))
+            pinned = load_version_cards(prompt_versions_table, card_store, pinned_refs)
+        else:
+            print("PROMPT_VERSIONS_TABLE이 설정되지 않아 고정된 카드 버전을 해석할 수 없습니다")
+
+    cards = []
+    for prompt_id, version in refs:
+        card = bundled.get(prompt_id) if (prompt_id, version) in in_bundle else pinned.get((prompt_id, version))
+        if card:
+            cards.append(card)
+        else:
+            print(f"프롬프트 카드를 찾을 수 없습니다: {prompt_id} v{version}")
+    print(f"프롬프트 카드 ID 해석: 요청 {len(refs)}개, 번들 {len(bundled)}개, 버전 이력 {len(pinned)}개")
+    return cards
+
+def _build_final_prompt(user_input, chat_history, prompt_cards, placeholder_values=None):
     """프론트엔드에서 전송된 프롬프트 카드와 채팅 히스토리를 사용하여 최종 프롬프트를 구성합니다."""
     try:
         print(f"프롬프트 구성 시작")
         print(f"전달받은 프롬프트 카드 수: {len(prompt_cards)}")
         print(f"전달받은 채팅 히스토리 수: {len(chat_history)}")
         
-        # 프롬프트 카드가 없으면 데이터베이스에서 로드
+        # 프롬프트 카드가 없으면 사전 결합된 번들 사용 (번들이 없으면 데이터베이스에서 로드)
+        bundle = _load_prompt_bundle()
+        if not prompt_cards and bundle:
+            from prompt_bundle import bundle_cards
+            prompt_cards = bundle_cards(bundle) or []
         if not prompt_cards:
             try:
                 from prompt_manager import SimplePromptManager
@@ -329,6 +454,15 @@ def _build_final_prompt(user_input, chat_history, prompt_cards):
                 print(f"데이터베이스에서 프롬프트 로드 실패: {str(e)}")
                 prompt_cards = []
         
+        # relevance 카드는 입력과의 유사도가 카드 threshold 이상일 때만 포함
+        if bundle:
+            from card_relevance import RelevanceIndex, select_relevant_cards
+            prompt_cards = select_relevant_cards(prompt_cards, user_input, RelevanceIndex.from_bundle(bundle))
+        
+        # 카드 템플릿 렌더링 (컴파일 결과는 카드 버전별 캐시, 값 검증 실패는 호출자에서 400 처리)
+        if placeholder_values is not None:
+            prompt_cards = render_cards(prompt_cards, placeholder_values)
+        
         # 프롬프트 카드 처리
         system_prompt_parts = []
         for card in prompt_cards:
@@ -375,6 +509,8 @@ def _build_final_prompt(user_input, chat_history, prompt_cards):
         
         return final_prompt
 
+    except TemplateRenderError:
+        raise
     except Exception as e:
         print(f"프롬프트 구성 오류: {traceback.format_exc()}")
         # 오류 발생 시 기본 프롬프트 반환 (히스토리 포함)
@@ -543,8 +679,8 @@ def _get_user_friendly_error(error_str):
     else:
         return "일시적인 오류가 발생했습니다. 다시 시도해주세요."
 
-def _handle_batch_processing(user_input, chat_history, prompt_cards, model_id):
-    """대용량 문서 배치 처리"""
+def _handle_batch_processing(user_input, chat_history, prompt_cards, model_id, connection_id=None, user_id=None):
+    """대용량 문서 배치 처리 (user_id: 제출한 검증된 사용자, 작업 조회 시 소유자 확인에 사용)"""
     try:
         import uuid
         import boto3
@@ -559,6 +695,11 @@ def _handle_batch_processing(user_input, chat_history, prompt_cards, model_id):
         if not batch_queue_url or not batch_jobs_table_name:
             return _create_error_response(500, "배치 처리 시스템이 설정되지 않았습니다.")
         
+        # 워커가 그대로 사용하므로 지원 모델만 전달
+        if model_id not in SUPPORTED_MODELS:
+            print(f"지원되지 않는 모델 ID: {model_id}")
+            model_id = DEFAULT_MODEL_ID
+        
         # 작업 ID 생성
         job_id = str(uuid.uuid4())
         
@@ -568,29 +709,51 @@ def _handle_batch_processing(user_input, chat_history, prompt_cards, model_id):
         # 프롬프트 구성
         final_prompt = _build_final_prompt("", chat_history, prompt_cards)
         
-        # 각 청크를 SQS로 전송
+        # 프롬프트는 해시를 키로 한 번만 저장하고 청크 메시지에는 해시만 포함
         batch_jobs_table = dynamodb.Table(batch_jobs_table_name)
+        prompt_hash = _store_batch_prompt(batch_jobs_table, final_prompt)
         
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"chunk_{i}"
-            
-            # 작업 상태 저장
-            batch_jobs_table.put_item(
+        # 작업 매니페스트와 청크 항목 저장 (PK job_id, SK chunk_id)
+        created_at = datetime.utcnow().isoformat()
+        ttl = int(datetime.utcnow().timestamp() + 86400)  # 24시간 TTL
+        chunk_ids = [f"chunk_{i:04d}" for i in range(len(chunks))]
+        
+        with batch_jobs_table.batch_writer() as batch:
+            batch.put_item(
                 Item={
-                    'job_id': f"{job_id}#{chunk_id}",
-                    'status': 'queued',
-                    'created_at': datetime.utcnow().isoformat(),
-                    'ttl': int((datetime.utcnow().timestamp() + 86400))  # 24시간 TTL
+                    'job_id': job_id,
+                    'chunk_id': 'MANIFEST',
+                    'status': 'running',
+                    'total_chunks': len(chunks),
+                    'completed_chunks': 0,
+                    'prompt_hash': prompt_hash,
+                    **({'connection_id': connection_id} if connection_id else {}),
+                    **({'user_id': user_id} if user_id else {}),
+                    'model_id': model_id,
+                    'created_at': created_at,
+                    'ttl': ttl
                 }
             )
-            
+            for chunk_id in chunk_ids:
+                batch.put_item(
+                    Item={
+                        'job_id': job_id,
+                        'chunk_id': chunk_id,
+                        'status': 'queued',
+                        'created_at': created_at,
+                        'ttl': ttl
+                    }
+                )
+        
+        for chunk_id, chunk in zip(chunk_ids, chunks):
             # SQS 메시지 전송
             message = {
                 'job_id': job_id,
                 'chunk_id': chunk_id,
                 'content': chunk,
-                'prompt': final_prompt,
-                'model_id': model_id
+                'prompt_hash': prompt_hash,
+                'model_id': model_id,
+                'connection_id': connection_id
             }
             
             sqs.send_message(
@@ -615,6 +778,26 @@ def _handle_batch_processing(user_input, chat_history, prompt_cards, model_id):
         print(f"배치 처리 오류: {traceback.format_exc()}")
         return _create_error_response(500, f"배치 처리 오류: {str(e)}")
 
+def _store_batch_prompt(batch_jobs_table, prompt):
+    """
+    배치 프롬프트를 SHA-256 해시를 키로 압축 저장하고 해시 반환
+    같은 프롬프트는 한 항목을 공유하며 저장할 때마다 TTL만 연장
+    """
+    import hashlib
+    import zlib
+    
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    batch_jobs_table.update_item(
+        Key={'job_id': f"prompt#{prompt_hash}", 'chunk_id': 'PROMPT'},
+        UpdateExpression='SET prompt_z = if_not_exists(prompt_z, :prompt_z), #ttl = :ttl',
+        ExpressionAttributeNames={'#ttl': 'ttl'},
+        ExpressionAttributeValues={
+            ':prompt_z': zlib.compress(prompt.encode('utf-8'), 6),
+            ':ttl': int(datetime.utcnow().timestamp() + 86400)  # 24시간 TTL
+        }
+    )
+    return prompt_hash
+
 def _split_content_into_chunks(content, chunk_size=50000):
     """콘텐츠를 청크로 분할"""
     try:
@@ -658,6 +841,86 @@ def _split_articles_into_chunks(content, articles_per_chunk=10):
         print(f"기사 청크 분할 오류: {e}")
         return [content[:50000]]  # 안전한 폴백
 
+def _handle_job_status_request(job_id, user_id=None):
+    """
+    배치 작업 진행 상황과 결과를 한 번의 Query로 조회
+    제출한 사용자(매니페스트의 user_id)와 요청한 검증된 사용자가 같을 때만 반환 (익명 작업은 익명 요청만)
+    """
+    try:
+        import zlib
+        from boto3.dynamodb.conditions import Key
+        
+        batch_jobs_table_name = os.environ.get('BATCH_JOBS_TABLE')
+        if not batch_jobs_table_name:
+            return _create_error_response(500, "배치 처리 시스템이 설정되지 않았습니다.")
+        
+        table = boto3.resource('dynamodb', region_name=os.environ.get('REGION')).Table(batch_jobs_table_name)
+        items = []
+        query_kwargs = {'KeyConditionExpression': Key('job_id').eq(job_id)}
+        while True:
+            response = table.query(**query_kwargs)
+            items.extend(response.get('Items', []))
+            if not response.get('LastEvaluatedKey'):
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        
+        manifest = next((item for item in items if item['chunk_id'] == 'MANIFEST'), None)
+        # 다른 사용자의 작업은 존재 여부도 드러내지 않음
+        if not manifest or manifest.get('user_id') != user_id:
+            return _create_error_response(404, "배치 작업을 찾을 수 없습니다.")
+        
+        result_item = next((item for item in items if item['chunk_id'] == 'RESULT'), None)
+        # 백필 작업은 기사별 결과가 독립적이므로 청크마다 결과를 반환하고 병합하지 않음
+        is_backfill = manifest.get('job_type') == 'backfill'
+        chunks = [
+            {
+                'chunk_id': item['chunk_id'],
+                'status': item.get('status'),
+                'updated_at': item.get('updated_at', item.get('created_at')),
+                **({'article_id': item['article_id']} if item.get('article_id') else {}),
+                **({'result': item['result']} if is_backfill and item.get('result') else {}),
+                **({'error': item['error']} if item.get('error') else {})
+            }
+            for item in items if item['chunk_id'].startswith('chunk_')
+        ]
+        
+        result = None
+        if result_item and result_item.get('result_z') is not None:
+            compressed = result_item['result_z']
+            result = zlib.decompress(getattr(compressed, 'value', compressed)).decode('utf-8')
+        elif manifest.get('status') == 'completed' and not is_backfill:
+            # 최종 결과가 항목 크기 제한을 넘은 경우 청크 결과를 순서대로 이어붙임
+            result = "\n\n".join(
+                item.get('result', '') for item in items
+                if item['chunk_id'].startswith('chunk_') and item.get('result')
+            )
+        
+        total_chunks = int(manifest.get('total_chunks', 0))
+        completed_chunks = int(manifest.get('completed_chunks', 0))
+        return {
+            "statusCode": 200,
+            "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
+            "body": json.dumps({
+                "job_id": job_id,
+                "job_type": manifest.get('job_type', 'batch'),
+                "status": manifest.get('status'),
+                "total_chunks": total_chunks,
+                "completed_chunks": completed_chunks,
+                "progress": round(completed_chunks / total_chunks * 100, 1) if total_chunks else 0,
+                "created_at": manifest.get('created_at'),
+                "completed_at": manifest.get('completed_at'),
+                # 재시도 한도를 넘긴 청크가 있으면 status=failed와 원인
+                **({"failed_at": manifest['failed_at'], "error": manifest.get('error')} if manifest.get('failed_at') else {}),
+                "chunks": chunks,
+                "result": result
+            }, ensure_ascii=False),
+            "isBase64Encoded": False
+        }
+        
+    except Exception as e:
+        print(f"배치 작업 조회 오류: {traceback.format_exc()}")
+        return _create_error_response(500, f"배치 작업 조회 오류: {str(e)}")
+
 def _create_error_response(status_code, message):
     """일반적인 JSON 오류 응답을 생성합니다."""
     return {
@@ -667,6 +930,46 @@ def _create_error_response(status_code, message):
         "isBase64Encoded": False
         }
 
+def _create_rate_limited_response(error):
+    """동시 생성 한도 초과 응답 (429 + Retry-After)"""
+    return {
+        "statusCode": 429,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+            "Retry-After": str(error.retry_after)
+        },
+        "body": json.dumps({
+            "error": f"동시에 진행할 수 있는 요청은 {error.limit}개입니다. 잠시 후 다시 시도해주세요.",
+            "retryAfter": error.retry_after,
+            "timestamp": datetime.utcnow().isoformat()
+        }),
+        "isBase64Encoded": False
+    }
+
+def _verified_user_id(event):
+    """
+    API Gateway authorizer가 검증한 사용자 ID (Cognito claims.sub 또는 Lambda authorizer의 userId), 없으면 None
+    (Authorization 헤더의 토큰은 서명 검증 전이라 사용하지 않음)
+    """
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    claims = authorizer.get('claims') or {}
+    return claims.get('sub') or authorizer.get('userId')
+
+def _request_limit_key(event):
+    """
+    동시 생성 제한 키
+    검증된 신원만 사용하고, 없으면 접속 IP
+    (Authorization 헤더의 토큰은 서명 검증 전이라 클라이언트가 sub를 바꿔 한도를 우회할 수 있음)
+    """
+    user_id = _verified_user_id(event)
+    if user_id:
+        return user_id
+
+    request_context = event.get('requestContext') or {}
+    source_ip = (request_context.get('identity') or {}).get('sourceIp')
+    return f"ip:{source_ip}" if source_ip else None
+
 def _handle_s3_upload_request(event):
     """S3 presigned URL 생성 for 대용량 파일 업로드"""
     try:
@@ -719,13 +1022,14 @@ def _handle_s3_process_request(event):
         print(f"S3 파일 읽기 완료: {len(content):,}자")
         
         # 병렬 처리를 위한 작업 생성
-        return _create_parallel_processing_jobs(content, chat_history, prompt_cards, model_id)
+        return _create_parallel_processing_jobs(content, chat_history, prompt_cards, model_id,
+                                                user_id=_verified_user_id(event))
         
     except Exception as e:
         print(f"S3 파일 처리 오류: {e}")
         return _create_error_response(500, "파일 처리 실패")
 
-def _create_parallel_processing_jobs(content, chat_history, prompt_cards, model_id):
+def _create_parallel_processing_jobs(content, chat_history, prompt_cards, model_id, user_id=None):
     """대용량 콘텐츠를 병렬 처리를 위한 작업으로 분할"""
     try:
         import uuid
@@ -737,7 +1041,7 @@ def _create_parallel_processing_jobs(content, chat_history, prompt_cards, model_
         
         if not state_machine_arn:
             # Step Functions가 없으면 기존 배치 처리 사용
-            return _handle_batch_processing(content, chat_history, prompt_cards, model_id)
+            return _handle_batch_processing(content, chat_history, prompt_cards, model_id, user_id=user_id)
         
         # 콘텐츠를 병렬 처리 가능한 청크로 분할
         chunks = _split_for_parallel_processing(content)
@@ -772,7 +1076,7 @@ def _create_parallel_processing_jobs(content, chat_history, prompt_cards, model_
         
     except Exception as e:
         print(f"병렬 처리 작업 생성 오류: {e}")
-        return _handle_batch_processing(content, chat_history, prompt_cards, model_id)
+        return _handle_batch_processing(content, chat_history, prompt_cards, model_id, user_id=user_id)
 
 def _split_for_parallel_processing(content, chunk_size=30000):
     """병렬 처리를 위한 스마트 청크 분할"""
@@ -11,8 +11,14 @@ import logging
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+from active_cards import query_active_cards
+from card_store import CardStore
+
 logger = logging.getLogger(__name__)
 
+# 카드 로드 시 필요한 속성만 읽음 (본문이 DynamoDB에 있는 카드는 S3를 읽지 않음)
+CARD_PROJECTION = 'promptId, title, content, isActive, threshold, s3Key, createdAt, updatedAt'
+
 class SimplePromptManager:
     """단순하고 효율적인 프롬프트 관리"""
     
@@ -25,45 +31,19 @@ class SimplePromptManager:
         self.prompt_bucket = prompt_bucket
         self.prompt_meta_table = prompt_meta_table
         self.prompt_table = self.dynamodb.Table(prompt_meta_table)
+        self.card_store = CardStore(self.s3_client, prompt_bucket)
     
     def load_all_active_prompts(self) -> List[Dict[str, Any]]:
         """모든 활성화된 프롬프트 카드 로드 (projectId 없이)"""
         try:
-            # DynamoDB에서 활성화된 프롬프트 메타데이터 조회
-            response = self.prompt_table.scan(
-                FilterExpression=boto3.dynamodb.conditions.Attr('isActive').eq(True)
-            )
-            
-            prompt_metas = response.get('Items', [])
+            # 활성 카드 sparse 인덱스 조회 (비활성/삭제 카드는 읽지 않음)
+            prompt_metas = query_active_cards(self.prompt_table, projection=CARD_PROJECTION)
             
             if not prompt_metas:
                 logger.info("활성화된 프롬프트 카드가 없습니다.")
                 return []
             
-            # S3에서 실제 프롬프트 내용 로드
-            prompts = []
-            for meta in prompt_metas:
-                try:
-                    content = self._load_prompt_content_by_s3key(meta.get('s3Key'))
-                    
-                    if content:
-                        prompts.append({
-                            'promptId': meta['promptId'],
-                            'title': meta.get('title', ''),
-                            'content': content,
-                            'isActive': meta.get('isActive', True),
-                            'threshold': float(meta.get('threshold', 0.7)),
-                            'createdAt': meta.get('createdAt', ''),
-                            'updatedAt': meta.get('updatedAt', '')
-                        })
-                        
-                except Exception as e:
-                    logger.warning(f"프롬프트 {meta['promptId']} 로드 실패: {str(e)}")
-                    continue
-            
-            # createdAt으로 정렬
-            prompts.sort(key=lambda x: x.get('createdAt', ''))
-            
+            prompts = self._build_prompts(prompt_metas)
             logger.info(f"{len(prompts)}개 프롬프트 로드 완료")
             return prompts
             
@@ -74,46 +54,18 @@ class SimplePromptManager:
     def load_project_prompts(self, project_id: str) -> List[Dict[str, Any]]:
         """프로젝트의 모든 활성화된 프롬프트 카드 로드 (레거시 메서드)"""
         try:
-            # DynamoDB에서 프로젝트의 활성화된 프롬프트 메타데이터 조회
-            response = self.prompt_table.scan(
-                FilterExpression=boto3.dynamodb.conditions.Attr('projectId').eq(project_id) & 
-                               boto3.dynamodb.conditions.Attr('isActive').eq(True)
-            )
-            
-            prompt_metas = response.get('Items', [])
+            # 활성 카드 인덱스에서 프로젝트 정렬 키 접두사로 조회
+            prompt_metas = query_active_cards(self.prompt_table, project_id=project_id, projection=CARD_PROJECTION)
             
             if not prompt_metas:
                 logger.info(f"프로젝트 {project_id}에 활성화된 프롬프트 카드가 없습니다.")
                 return []
             
-            # S3에서 실제 프롬프트 내용 로드
-            prompts = []
-            for meta in prompt_metas:
-                try:
-                    content = self._load_prompt_content(
-                        project_id, 
-                        meta['promptId'], 
-                        meta.get('s3Key')
-                    )
-                    
-                    if content:
-                        prompts.append({
-                            'promptId': meta['promptId'],
-                            'title': meta.get('title', ''),
-                            'content': content,
-                            'isActive': meta.get('isActive', True),
-                            'threshold': float(meta.get('threshold', 0.7)),  # 임계값 추가
-                            'createdAt': meta.get('createdAt', ''),
-                            'updatedAt': meta.get('updatedAt', '')
-                        })
-                        
-                except Exception as e:
-                    logger.warning(f"프롬프트 {meta['promptId']} 로드 실패: {str(e)}")
-                    continue
-            
-            # createdAt으로 정렬
-            prompts.sort(key=lambda x: x.get('createdAt', ''))
-            
+            # 본문도 s3Key도 없으면 이전 기본 경로 사용
+            prompts = self._build_prompts(
+                prompt_metas,
+                lambda meta: f"prompts/{project_id}/{meta['promptId']}/content.txt"
+            )
             logger.info(f"프로젝트 {project_id}: {len(prompts)}개 프롬프트 로드 완료")
             return prompts
             
@@ -121,42 +73,43 @@ class SimplePromptManager:
             logger.error(f"프롬프트 로드 오류 (프로젝트: {project_id}): {str(e)}")
             return []
     
+    def _build_prompts(self, prompt_metas: List[Dict[str, Any]], default_key_for=None) -> List[Dict[str, Any]]:
+        """
+        메타데이터에 본문을 채워 프롬프트 목록 생성 (createdAt 순)
+        본문은 카드 저장소의 공용 경로로 읽음 (인라인 본문은 그대로, S3 본문은 캐시를 거쳐 동시에 로드)
+        """
+        contents = self.card_store.load_contents(prompt_metas, default_key_for)
+        
+        prompts = []
+        for meta in prompt_metas:
+            content = contents.get(meta['promptId'])
+            if content:
+                prompts.append({
+                    'promptId': meta['promptId'],
+                    'title': meta.get('title', ''),
+                    'content': content,
+                    'isActive': meta.get('isActive', True),
+                    'threshold': float(meta.get('threshold', 0.7)),
+                    'createdAt': meta.get('createdAt', ''),
+                    'updatedAt': meta.get('updatedAt', '')
+                })
+        
+        # createdAt으로 정렬
+        prompts.sort(key=lambda x: x.get('createdAt', ''))
+        return prompts
+    
     def _load_prompt_content_by_s3key(self, s3_key: str) -> str:
         """S3에서 s3Key로 프롬프트 내용 로드"""
-        try:
-            if not s3_key:
-                return ""
-                
-            response = self.s3_client.get_object(
-                Bucket=self.prompt_bucket,
-                Key=s3_key
-            )
-            
-            content = response['Body'].read().decode('utf-8').strip()
-            return content
-            
-        except Exception as e:
-            logger.warning(f"S3에서 프롬프트 로드 실패 ({s3_key}): {str(e)}")
+        if not s3_key:
             return ""
+        return self.card_store.read_body(s3_key)
     
     def _load_prompt_content(self, project_id: str, prompt_id: str, s3_key: Optional[str] = None) -> str:
         """S3에서 개별 프롬프트 내용 로드 (레거시 메서드)"""
-        try:
-            # s3Key가 없으면 기본 경로 사용
-            if not s3_key:
-                s3_key = f"prompts/{project_id}/{prompt_id}/content.txt"
-            
-            response = self.s3_client.get_object(
-                Bucket=self.prompt_bucket,
-                Key=s3_key
-            )
-            
-            content = response['Body'].read().decode('utf-8').strip()
-            return content
-            
-        except Exception as e:
-            logger.warning(f"S3에서 프롬프트 로드 실패 ({s3_key}): {str(e)}")
-            return ""
+        # s3Key가 없으면 기본 경로 사용
+        if not s3_key:
+            s3_key = f"prompts/{project_id}/{prompt_id}/content.txt"
+        return self.card_store.read_body(s3_key)
     
     def combine_prompts(self, prompts: List[Dict[str, Any]], mode: str = "system") -> str:
         """프롬프트들을 결합하여 하나의 시스템 프롬프트 생성"""
@@ -7,6 +7,7 @@
 """
 
 import json
+import hashlib
 import boto3
 import os
 import uuid
@@ -15,6 +16,15 @@ from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional
 from decimal import Decimal
 
+from botocore.exceptions import ClientError
+
+from active_cards import active_index_attributes, active_sort_key, query_active_cards, query_active_page, ACTIVE_FLAG
+from card_store import CardStore
+from card_versions import append_version, get_version, list_versions
+from card_relevance import RELEVANCE_DEFAULT_THRESHOLD, SELECTION_ALWAYS, SELECTION_MODES
+from prompt_bundle import materialize_bundle
+from thought_log import ThoughtLogWriter, query_thoughts
+
 # 로깅 설정
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -27,9 +37,26 @@ PROMPT_META_TABLE = os.environ.get('PROMPT_META_TABLE', 'title-generator-prompt-
 PROMPT_BUCKET = os.environ.get('PROMPT_BUCKET', 'title-generator-prompts')
 REGION = os.environ.get('REGION', 'us-east-1')
 
+# GET /prompts 목록에서 읽는 속성 (includeContent=true)
+PROMPT_LIST_PROJECTION = ('promptId, title, tags, createdAt, updatedAt, threshold, relevanceThreshold, content, s3Key, '
+                          'isActive, version, selectionMode')
+# 메타데이터 전용 목록에서 읽는 속성 (본문 제외)
+PROMPT_METADATA_PROJECTION = ('promptId, title, tags, createdAt, updatedAt, threshold, relevanceThreshold, isActive, '
+                              'version, selectionMode')
+# 한 페이지 최대 카드 수
+MAX_PAGE_SIZE = 100
+AGENT_THOUGHTS_TABLE = os.environ.get('AGENT_THOUGHTS_TABLE')
+PROMPT_VERSIONS_TABLE = os.environ.get('PROMPT_VERSIONS_TABLE', 'title-generator-prompt-versions')
+
 # DynamoDB 테이블 참조
 prompt_meta_table = dynamodb.Table(PROMPT_META_TABLE)
+# 카드 버전 이력 (추가 전용, 메타 항목의 version이 활성 버전 포인터)
+prompt_versions_table = dynamodb.Table(PROMPT_VERSIONS_TABLE)
 s3_client = boto3.client('s3', region_name=REGION)
+# 카드 본문 저장소 (작은 본문은 DynamoDB, 큰 본문은 S3)
+card_store = CardStore(s3_client, PROMPT_BUCKET)
+# 에이전트 사고 로그 (버퍼링 후 BatchWriteItem, 핸들러 종료 시 flush)
+thought_writer = ThoughtLogWriter(AGENT_THOUGHTS_TABLE)
 
 class DecimalEncoder(json.JSONEncoder):
     """DynamoDB Decimal 타입을 JSON으로 변환하는 인코더"""
@@ -45,6 +72,7 @@ class PromptCardManager:
         self.prompt_table = prompt_meta_table
         self.s3_client = s3_client
         self.bucket_name = PROMPT_BUCKET
+        self.card_store = card_store
     
     def create_prompt_card(self, admin_id: str, card_data: Dict[str, Any]) -> Dict[str, Any]:
         """새로운 프롬프트 카드를 생성"""
@@ -54,34 +82,57 @@ class PromptCardManager:
             # prompt_text 또는 content 필드 모두 지원
             content = card_data.get('prompt_text', card_data.get('content', '')).strip()
             category = card_data.get('category', 'general')
+            project_id = card_data.get('projectId')
             steps = card_data.get('steps', [])
-            threshold = card_data.get('threshold', 0.7)  # 기본 임계값
+            threshold = card_data.get('threshold', 0.7)  # 단계별 실행 신뢰도 임계값
+            # always: 항상 포함, relevance: 입력과의 유사도가 relevanceThreshold 이상일 때만 포함
+            selection_mode = card_data.get('selectionMode', SELECTION_ALWAYS)
+            relevance_threshold = card_data.get('relevanceThreshold', RELEVANCE_DEFAULT_THRESHOLD)
             
             if not title:
                 return {'success': False, 'error': '제목이 필요합니다.'}
             if not content:
                 return {'success': False, 'error': '내용이 필요합니다.'}
+            if selection_mode not in SELECTION_MODES:
+                return {'success': False, 'error': f'selectionMode는 {", ".join(SELECTION_MODES)} 중 하나여야 합니다.'}
             
             # 새 카드 생성
             card_id = str(uuid.uuid4())
             timestamp = datetime.now(timezone.utc).isoformat()
             
-            # DynamoDB에 모든 데이터 저장 (S3 사용하지 않음)
+            # 본문은 크기에 따라 DynamoDB(content) 또는 S3(s3Key)에 배치
+            content_attributes, _ = self.card_store.place_content(card_id, content)
+            # 첫 버전을 이력에 기록하고 메타 항목은 이를 활성 버전으로 가리킴
+            version_item = append_version(prompt_versions_table, card_id, {
+                'title': title,
+                **content_attributes,
+                'threshold': Decimal(str(threshold)),
+                'relevanceThreshold': Decimal(str(relevance_threshold)),
+                'selectionMode': selection_mode,
+                'tags': card_data.get('tags', [])
+            }, admin_id)
             card_item = {
                 'promptId': card_id,
                 'title': title,
-                'content': content,  # 프롬프트 내용을 DynamoDB에 직접 저장
+                **content_attributes,
                 'category': category,
                 'isActive': True,
                 'createdAt': timestamp,
                 'updatedAt': timestamp,
                 'adminId': admin_id,
                 'threshold': Decimal(str(threshold)),
+                'relevanceThreshold': Decimal(str(relevance_threshold)),
+                'selectionMode': selection_mode,
+                'version': version_item['version'],
                 'stepCount': len(steps),
                 'hasSteps': len(steps) > 0,
                 'tags': card_data.get('tags', []),
-                'steps': steps if steps else []
+                'steps': steps if steps else [],
+                # 활성 카드 sparse 인덱스 키
+                **active_index_attributes(True, project_id, timestamp)
             }
+            if project_id:
+                card_item['projectId'] = project_id
             
             self.prompt_table.put_item(Item=card_item)
             logger.info(f"프롬프트 카드 생성: {card_id} by admin {admin_id}")
@@ -89,6 +140,7 @@ class PromptCardManager:
             return {
                 'success': True,
                 'cardId': card_id,
+                'version': version_item['version'],
                 'message': '프롬프트 카드가 생성되었습니다.'
             }
             
@@ -136,25 +188,8 @@ class PromptCardManager:
     
     def log_agent_thought(self, session_id: str, card_id: str, step_number: int, 
                          thought_type: str, content: str) -> None:
-        """에이전트 사고 과정을 로그에 기록"""
-        timestamp = datetime.now(timezone.utc).isoformat()
-        sequence = str(int(datetime.now(timezone.utc).timestamp() * 1000))
-        
-        # TTL: 30일 후 자동 삭제
-        ttl = int(datetime.now(timezone.utc).timestamp()) + (30 * 24 * 60 * 60)
-        
-        thought_item = {
-            'PK': f'SESSION#{session_id}',
-            'SK': f'THOUGHT#{timestamp}#{sequence}',
-            'cardId': card_id,
-            'stepNumber': step_number,
-            'thoughtType': thought_type,
-            'content': content,
-            'timestamp': timestamp,
-            'ttl': ttl
-        }
-        
-        thoughts_table.put_item(Item=thought_item)
+        """에이전트 사고 과정을 로그에 기록 (버퍼에 모았다가 일괄 저장, TTL 30일)"""
+        thought_writer.log(session_id, card_id, step_number, thought_type, content)
     
     def get_admin_cards(self, admin_id: str, status: Optional[str] = None) -> List[Dict[str, Any]]:
         """관리자의 프롬프트 카드 목록 조회"""
@@ -200,6 +235,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     POST /save-prompt - 새 프롬프트 카드 생성
     GET /save-prompt - 관리자의 프롬프트 카드 목록 조회
     GET /prompts - 프롬프트 카드 목록 조회 (프론트엔드 호환)
+    GET /thoughts/{sessionId} - 평가 세션의 에이전트 사고 로그 조회
+    POST /prompts/{promptId}/evaluate - 카드 오프라인 평가 시작
+    GET /prompts/{promptId}/versions - 카드 버전 이력 조회
+    POST /prompts/{promptId}/activate - 지정한 버전을 활성 버전으로 전환 (롤백)
+    
+    카드 생성/수정 본문의 selectionMode와 임계값:
+    - threshold: 단계별 실행의 응답 신뢰도 임계값 (기본 0.7, 선택 방식과 무관)
+    - selectionMode always(기본): 항상 포함
+    - selectionMode relevance: 입력과의 유사도가 relevanceThreshold 이상일 때만 포함
+      유사도는 해싱한 문자 n-gram 코사인 값이라 관련 있는 입력도 0.1~0.3 정도이므로 relevanceThreshold는 이 범위로 지정
+      생략하면 0.2 (PUT도 본문 전체로 교체하므로 생략하면 기본값으로 돌아감)
     """
     logger.info(f"Handler started - Method: {event.get('httpMethod')}, Path: {event.get('path')}")
     
@@ -215,58 +261,167 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         body = json.loads(event.get('body', '{}')) if event.get('body') else {}
         query_params = event.get('queryStringParameters') or {}
         
+        # GET /prompts/{promptId}/versions - 카드 버전 이력을 최신순으로 페이지 조회 (본문 제외)
+        if http_method == 'GET' and path.startswith('/prompts/') and path.endswith('/versions'):
+            prompt_id = (event.get('pathParameters') or {}).get('promptId')
+            if not prompt_id:
+                return create_error_response(400, 'promptId가 필요합니다.')
+            try:
+                limit = max(1, min(int(query_params.get('limit', MAX_PAGE_SIZE)), MAX_PAGE_SIZE))
+                versions, next_token = list_versions(
+                    prompt_versions_table, prompt_id, limit, query_params.get('nextToken')
+                )
+            except ValueError as e:
+                return create_error_response(400, str(e))
+            response_body = {
+                'success': True,
+                'promptId': prompt_id,
+                'versions': versions,
+                'count': len(versions)
+            }
+            if next_token:
+                response_body['nextToken'] = next_token
+            return create_success_response(response_body)
+        
         # /prompts 엔드포인트 처리 (프론트엔드 호환)
         if '/prompts' in path and http_method == 'GET':
-            # projectId 없이 모든 활성화된 프롬프트 카드 조회
+            # 활성화된 프롬프트 카드 조회 (projectId가 있으면 해당 프로젝트만)
+            # includeContent=false면 본문 없이 메타데이터만, updatedSince가 있으면 이후 변경된 카드만 반환
             include_content = query_params.get('includeContent', 'false').lower() == 'true'
+            project_id = query_params.get('projectId')
+            updated_since = query_params.get('updatedSince')
+            projection = PROMPT_LIST_PROJECTION if include_content else PROMPT_METADATA_PROJECTION
             
             try:
-                # prompt_meta_table에서 활성화된 프롬프트 카드 스캔
-                response = prompt_meta_table.scan(
-                    FilterExpression='isActive = :active',
-                    ExpressionAttributeValues={
-                        ':active': True
-                    },
-                    ProjectionExpression='promptId, title, tags, createdAt, updatedAt, threshold, content, isActive'
-                )
+                # 활성 카드 sparse 인덱스 조회 (limit가 있으면 nextToken으로 페이지 단위 조회)
+                next_token = None
+                if query_params.get('limit'):
+                    limit = max(1, min(int(query_params['limit']), MAX_PAGE_SIZE))
+                    items, next_token = query_active_page(
+                        prompt_meta_table, limit, query_params.get('nextToken'),
+                        project_id=project_id, projection=projection
+                    )
+                else:
+                    items = query_active_cards(prompt_meta_table, project_id=project_id, projection=projection)
+                
+                # 카드 구성(ID, 버전, 최종 수정 시각)과 요청 형태가 같으면 304
+                etag = compute_list_etag(items, [include_content, project_id, updated_since,
+                                                 query_params.get('limit'), query_params.get('nextToken')])
+                if etag_matches(get_request_header(event, 'If-None-Match'), etag):
+                    return create_not_modified_response(etag)
+                
+                last_updated_at = max((item.get('updatedAt', '') for item in items), default='')
+                changed = [item for item in items if not updated_since or item.get('updatedAt', '') > updated_since]
+                # S3에 배치된 큰 본문은 카드 저장소 캐시를 거쳐 채움
+                contents = card_store.load_contents(changed) if include_content else {}
                 
                 cards = []
-                for item in response.get('Items', []):
+                for item in changed:
                     card = {
                         'promptId': item.get('promptId'),
                         'prompt_id': item.get('promptId'),  # 프론트엔드 호환성
                         'title': item.get('title', ''),
                         'tags': item.get('tags', []),
                         'threshold': float(item.get('threshold', 0.7)),
+                        'relevanceThreshold': float(item.get('relevanceThreshold', RELEVANCE_DEFAULT_THRESHOLD)),
                         'createdAt': item.get('createdAt', ''),
                         'updatedAt': item.get('updatedAt', ''),
+                        'version': item.get('version'),
+                        'selectionMode': item.get('selectionMode', SELECTION_ALWAYS),
                         'isActive': True,
                         'enabled': True  # 프론트엔드 호환성
                     }
                     
-                    # includeContent가 true인 경우 DynamoDB에서 직접 content 포함
+                    # includeContent가 true인 경우에만 본문 포함
                     if include_content:
                         # content 필드를 prompt_text로 매핑 (프론트엔드 호환성)
-                        card['prompt_text'] = item.get('content', '')
-                        card['content'] = item.get('content', '')  # 프론트엔드 호환성
-                    else:
-                        # includeContent가 false여도 항상 prompt_text 포함
-                        card['prompt_text'] = item.get('content', '')
-                        card['content'] = item.get('content', '')
+                        card['prompt_text'] = contents.get(item.get('promptId'), '')
+                        card['content'] = card['prompt_text']  # 프론트엔드 호환성
                     
                     cards.append(card)
                 
-                return create_success_response({
+                response_body = {
                     'success': True,
                     'promptCards': cards,
                     'cards': cards,  # 프론트엔드 호환성
-                    'count': len(cards)
+                    'count': len(cards),
+                    'lastUpdatedAt': last_updated_at  # 다음 updatedSince 값으로 사용
+                }
+                if updated_since:
+                    # 삭제/비활성화된 카드는 인덱스에서 빠지므로 현재 활성 ID 목록으로 판별
+                    response_body['delta'] = True
+                    response_body['activeIds'] = [item.get('promptId') for item in items]
+                if next_token:
+                    response_body['nextToken'] = next_token
+                return create_success_response(response_body, headers={
+                    'ETag': etag,
+                    'Cache-Control': 'private, no-cache'
                 })
                 
+            except ValueError as e:
+                return create_error_response(400, str(e))
             except Exception as e:
                 logger.error(f"프롬프트 카드 조회 실패: {str(e)}")
                 return create_error_response(500, f'프롬프트 카드 조회 실패: {str(e)}')
         
+        # GET /thoughts/{sessionId} - 세션의 에이전트 사고 로그를 기록 순서대로 페이지 조회
+        if path.startswith('/thoughts/') and http_method == 'GET':
+            session_id = (event.get('pathParameters') or {}).get('sessionId')
+            if not session_id:
+                return create_error_response(400, 'sessionId가 필요합니다.')
+            if not AGENT_THOUGHTS_TABLE:
+                return create_error_response(500, 'AGENT_THOUGHTS_TABLE이 설정되지 않았습니다.')
+            try:
+                limit = max(1, min(int(query_params.get('limit', MAX_PAGE_SIZE)), MAX_PAGE_SIZE))
+                thoughts, next_token = query_thoughts(
+                    dynamodb.Table(AGENT_THOUGHTS_TABLE), session_id, limit, query_params.get('nextToken')
+                )
+            except ValueError as e:
+                return create_error_response(400, str(e))
+            response_body = {
+                'success': True,
+                'sessionId': session_id,
+                'thoughts': thoughts,
+                'count': len(thoughts)
+            }
+            if next_token:
+                response_body['nextToken'] = next_token
+            return create_success_response(response_body)
+
+        # POST /prompts/{promptId}/evaluate - 골든 코퍼스 오프라인 평가 시작 (진행 상황은 /thoughts/{sessionId})
+        if http_method == 'POST' and path.endswith('/evaluate'):
+            prompt_id = (event.get('pathParameters') or {}).get('promptId')
+            if not prompt_id:
+                return create_error_response(400, 'promptId가 필요합니다.')
+            session_id = prompt_manager.start_evaluation_process(
+                prompt_id, body.get('version'), body.get('adminId', 'default')
+            )
+            return create_success_response({
+                'success': True,
+                'sessionId': session_id,
+                'message': '프롬프트 카드 평가를 시작했습니다.'
+            }, status_code=202)
+
+        # POST /prompts/{promptId}/activate - 이력의 버전을 활성 버전으로 전환 (버전 항목은 그대로 두고 포인터만 이동)
+        if http_method == 'POST' and path.endswith('/activate'):
+            prompt_id = (event.get('pathParameters') or {}).get('promptId')
+            if not prompt_id or body.get('version') is None:
+                return create_error_response(400, 'promptId와 version이 필요합니다.')
+            try:
+                version_item = get_version(prompt_versions_table, prompt_id, body['version'])
+            except (TypeError, ValueError):
+                return create_error_response(400, 'version은 숫자여야 합니다.')
+            if not version_item:
+                return create_error_response(404, f"버전을 찾을 수 없습니다: {prompt_id} v{body['version']}")
+            activate_card_version(version_item)
+            refresh_prompt_bundle()
+            return create_success_response({
+                'success': True,
+                'promptId': prompt_id,
+                'version': version_item['version'],
+                'message': f"버전 {version_item['version']}이 활성화되었습니다."
+            })
+        
         # 관리자 ID 확인 (기존 /save-prompt 엔드포인트)
         admin_id = body.get('adminId') or query_params.get('adminId')
         if not admin_id:
@@ -319,30 +474,74 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'content': body.get('prompt_text') or body.get('content', ''),
                 'tags': body.get('tags', []),
                 'isActive': body.get('isActive', True),
-                'threshold': body.get('threshold', 0.7)
+                'threshold': body.get('threshold', 0.7),
+                'relevanceThreshold': body.get('relevanceThreshold', RELEVANCE_DEFAULT_THRESHOLD),
+                'selectionMode': body.get('selectionMode', SELECTION_ALWAYS)
             }
+            if update_data['selectionMode'] not in SELECTION_MODES:
+                return create_error_response(400, f'selectionMode는 {", ".join(SELECTION_MODES)} 중 하나여야 합니다.')
             
             try:
-                # DynamoDB 업데이트 (content 포함)
+                updated_at = datetime.now(timezone.utc).isoformat()
+                update_expression = ('SET title = :title, tags = :tags, isActive = :active, threshold = :threshold, '
+                                     'relevanceThreshold = :relevance_threshold, selectionMode = :selection_mode, '
+                                     'updatedAt = :updated')
+                expression_values = {
+                    ':title': update_data['title'],
+                    ':tags': update_data['tags'],
+                    ':active': update_data['isActive'],
+                    ':threshold': Decimal(str(update_data['threshold'])),
+                    ':relevance_threshold': Decimal(str(update_data['relevanceThreshold'])),
+                    ':selection_mode': update_data['selectionMode'],
+                    ':updated': updated_at
+                }
+                # 본문은 크기에 따라 DynamoDB 또는 S3에 배치하고 반대쪽 속성은 제거
+                content_attributes, remove_attributes = card_store.place_content(prompt_id, update_data['content'])
+                # 기존 버전은 그대로 두고 새 버전을 추가한 뒤 활성 버전 포인터를 옮김
+                version_item = append_version(prompt_versions_table, prompt_id, {
+                    'title': update_data['title'],
+                    **content_attributes,
+                    'threshold': expression_values[':threshold'],
+                    'relevanceThreshold': expression_values[':relevance_threshold'],
+                    'selectionMode': update_data['selectionMode'],
+                    'tags': update_data['tags']
+                }, admin_id)
+                update_expression += ', version = :version'
+                expression_values[':version'] = version_item['version']
+                for name, value in content_attributes.items():
+                    update_expression += f', {name} = :{name}'
+                    expression_values[f':{name}'] = value
+                # 활성 상태에 따라 sparse 인덱스 키 추가/제거
+                if update_data['isActive']:
+                    update_expression += ', activeFlag = :flag, activeSortKey = if_not_exists(activeSortKey, :sort_key)'
+                    expression_values[':flag'] = ACTIVE_FLAG
+                    expression_values[':sort_key'] = active_sort_key(None, updated_at)
+                else:
+                    remove_attributes = remove_attributes + ['activeFlag']
+                update_expression += ' REMOVE ' + ', '.join(remove_attributes)
+                
+                # DynamoDB 업데이트 (동시 수정 시 더 높은 버전이 이미 활성이면 포인터를 되돌리지 않음)
                 prompt_meta_table.update_item(
                     Key={'promptId': prompt_id},
-                    UpdateExpression='SET title = :title, content = :content, tags = :tags, isActive = :active, threshold = :threshold, updatedAt = :updated',
-                    ExpressionAttributeValues={
-                        ':title': update_data['title'],
-                        ':content': update_data['content'],
-                        ':tags': update_data['tags'],
-                        ':active': update_data['isActive'],
-                        ':threshold': Decimal(str(update_data['threshold'])),
-                        ':updated': datetime.now(timezone.utc).isoformat()
-                    }
+                    UpdateExpression=update_expression,
+                    ConditionExpression='attribute_not_exists(version) OR version < :version',
+                    ExpressionAttributeValues=expression_values
                 )
                 
                 response_data = {
                     'success': True,
                     'message': '프롬프트 카드가 업데이트되었습니다.',
-                    'promptId': prompt_id
+                    'promptId': prompt_id,
+                    'version': version_item['version']
                 }
                 
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    logger.error(f"프롬프트 카드 업데이트 실패: {str(e)}")
+                    return create_error_response(500, f'업데이트 실패: {str(e)}')
+                return create_error_response(
+                    409, f"버전 {version_item['version']}은 저장되었지만 더 최신 버전이 이미 활성화되어 있습니다."
+                )
             except Exception as e:
                 logger.error(f"프롬프트 카드 업데이트 실패: {str(e)}")
                 return create_error_response(500, f'업데이트 실패: {str(e)}')
@@ -356,10 +555,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return create_error_response(400, 'promptId가 필요합니다.')
             
             try:
-                # DynamoDB에서 논리적 삭제 (isActive = false)
+                # DynamoDB에서 논리적 삭제 (isActive = false, 활성 카드 인덱스에서 제외)
                 prompt_meta_table.update_item(
                     Key={'promptId': prompt_id},
-                    UpdateExpression='SET isActive = :active, updatedAt = :updated',
+                    UpdateExpression='SET isActive = :active, updatedAt = :updated REMOVE activeFlag',
                     ExpressionAttributeValues={
                         ':active': False,
                         ':updated': datetime.now(timezone.utc).isoformat()
@@ -383,11 +582,80 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not response_data.get('success', True):
             return create_error_response(400, response_data.get('error', '알 수 없는 오류'))
         
+        # 카드 변경 시 활성 카드 번들 재생성 (생성 요청은 포인터 하나만 읽음)
+        if http_method in ('POST', 'PUT', 'DELETE'):
+            refresh_prompt_bundle()
+        
         return create_success_response(response_data, status_code)
         
     except Exception as e:
         logger.error(f"Handler error: {str(e)}", exc_info=True)
         return create_error_response(500, f'서버 오류: {str(e)}')
+    finally:
+        # 버퍼에 남은 사고 로그 저장
+        thought_writer.flush()
+
+def activate_card_version(version_item: Dict[str, Any]) -> None:
+    """버전 항목의 속성을 메타 항목에 복사하고 활성 버전 포인터를 해당 버전으로 변경"""
+    expression_values = {
+        ':title': version_item.get('title', ''),
+        ':threshold': version_item.get('threshold', Decimal('0.7')),
+        ':relevance_threshold': version_item.get('relevanceThreshold', Decimal(str(RELEVANCE_DEFAULT_THRESHOLD))),
+        ':selection_mode': version_item.get('selectionMode', SELECTION_ALWAYS),
+        ':tags': version_item.get('tags', []),
+        ':version': version_item['version'],
+        ':updated': datetime.now(timezone.utc).isoformat()
+    }
+    update_expression = ('SET title = :title, threshold = :threshold, relevanceThreshold = :relevance_threshold, '
+                         'selectionMode = :selection_mode, tags = :tags, version = :version, updatedAt = :updated')
+    if version_item.get('contentBytes') is not None:
+        update_expression += ', contentBytes = :content_bytes'
+        expression_values[':content_bytes'] = version_item['contentBytes']
+    # 버전의 본문 배치(content 또는 s3Key)를 그대로 사용하고 반대쪽 속성은 제거
+    if version_item.get('s3Key'):
+        update_expression += ', s3Key = :s3_key REMOVE content'
+        expression_values[':s3_key'] = version_item['s3Key']
+    else:
+        update_expression += ', content = :content REMOVE s3Key'
+        expression_values[':content'] = version_item.get('content', '')
+    prompt_meta_table.update_item(
+        Key={'promptId': version_item['promptId']},
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=expression_values
+    )
+    logger.info(f"활성 버전 전환: {version_item['promptId']} v{version_item['version']}")
+
+def refresh_prompt_bundle() -> None:
+    """활성 카드 번들 재생성 (실패해도 카드 저장은 성공으로 처리, 생성 Lambda는 기존 경로로 폴백)"""
+    try:
+        bundle = materialize_bundle(prompt_meta_table, s3_client, PROMPT_BUCKET)
+        if bundle:
+            logger.info(f"프롬프트 번들 갱신: {bundle['hash'][:12]} ({len(bundle['cards'])}개 카드, {bundle['totalTokens']} 토큰)")
+    except Exception as e:
+        logger.warning(f"프롬프트 번들 갱신 실패: {str(e)}")
+
+def compute_list_etag(items: List[Dict[str, Any]], variant: List[Any]) -> str:
+    """카드 목록의 최종 수정 시각, 카드별 버전, 요청 형태로 ETag 계산"""
+    max_updated_at = max((item.get('updatedAt', '') for item in items), default='')
+    versions = sorted(f"{item.get('promptId')}:{item.get('version', '')}" for item in items)
+    payload = json.dumps([variant, max_updated_at, versions], ensure_ascii=False, cls=DecimalEncoder)
+    return f'W/"{hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 헤더가 현재 ETag와 일치하는지 확인 (약한 비교)"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    if '*' in candidates:
+        return True
+    return etag.replace('W/', '', 1) in [value.replace('W/', '', 1) for value in candidates]
+
+def get_request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """요청 헤더 조회 (대소문자 구분 없음)"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
 
 def get_cors_headers() -> Dict[str, str]:
     """CORS 헤더 반환"""
@@ -395,7 +663,8 @@ def get_cors_headers() -> Dict[str, str]:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Requested-With'
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Requested-With, If-None-Match',
+        'Access-Control-Expose-Headers': 'ETag'
     }
 
 def create_cors_response() -> Dict[str, Any]:
@@ -406,14 +675,23 @@ def create_cors_response() -> Dict[str, Any]:
         'body': ''
     }
 
-def create_success_response(data: Dict[str, Any], status_code: int = 200) -> Dict[str, Any]:
+def create_success_response(data: Dict[str, Any], status_code: int = 200,
+                            headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """성공 응답 생성"""
     return {
         'statusCode': status_code,
-        'headers': get_cors_headers(),
+        'headers': {**get_cors_headers(), **(headers or {})},
         'body': json.dumps(data, ensure_ascii=False, cls=DecimalEncoder)
     }
 
+def create_not_modified_response(etag: str) -> Dict[str, Any]:
+    """변경 없음(304) 응답 생성"""
+    return {
+        'statusCode': 304,
+        'headers': {**get_cors_headers(), 'ETag': etag, 'Cache-Control': 'private, no-cache'},
+        'body': ''
+    }
+
 def create_error_response(status_code: int, message: str) -> Dict[str, Any]:
     """에러 응답 생성"""
     return {
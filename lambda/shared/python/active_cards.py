@@ -0,0 +1,76 @@
+"""
+활성 프롬프트 카드 sparse 인덱스 (active-index)
+- activeFlag는 활성 카드에만 기록되므로 인덱스에는 활성 카드만 존재 (비활성/삭제 카드는 읽기 비용 없음)
+- activeSortKey = {projectId 또는 GLOBAL}#{createdAt} → 프로젝트별 조회는 begins_with, 같은 프로젝트 안에서는 생성일 순
+- 모든 조회는 LastEvaluatedKey를 따라 끝까지 또는 페이지 단위로 수행 (1MB에서 잘리지 않음)
+"""
+import base64
+import json
+
+from boto3.dynamodb.conditions import Key
+
+ACTIVE_INDEX = 'active-index'
+ACTIVE_FLAG = 'ACTIVE'
+GLOBAL_PROJECT = 'GLOBAL'
+
+
+def active_sort_key(project_id, created_at):
+    return f"{project_id or GLOBAL_PROJECT}#{created_at}"
+
+
+def active_index_attributes(is_active, project_id, created_at):
+    """카드 생성 시 항목에 함께 기록할 인덱스 속성 (비활성 카드는 activeFlag 없이 정렬 키만)"""
+    attributes = {'activeSortKey': active_sort_key(project_id, created_at)}
+    if is_active:
+        attributes['activeFlag'] = ACTIVE_FLAG
+    return attributes
+
+
+def _query_kwargs(project_id, projection, limit, start_key):
+    condition = Key('activeFlag').eq(ACTIVE_FLAG)
+    if project_id:
+        condition = condition & Key('activeSortKey').begins_with(f"{project_id}#")
+    kwargs = {'IndexName': ACTIVE_INDEX, 'KeyConditionExpression': condition}
+    if projection:
+        kwargs['ProjectionExpression'] = projection
+    if limit:
+        kwargs['Limit'] = limit
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    return kwargs
+
+
+def query_active_cards(table, project_id=None, projection=None):
+    """활성 카드 전체 조회 (페이지를 끝까지 따라감)"""
+    items = []
+    start_key = None
+    while True:
+        response = table.query(**_query_kwargs(project_id, projection, None, start_key))
+        items.extend(response.get('Items', []))
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key:
+            return items
+
+
+def query_active_page(table, limit, next_token=None, project_id=None, projection=None):
+    """
+    활성 카드 한 페이지 조회
+    반환: (items, next_token) - 마지막 페이지면 next_token은 None
+    """
+    response = table.query(**_query_kwargs(project_id, projection, limit, decode_page_token(next_token)))
+    return response.get('Items', []), encode_page_token(response.get('LastEvaluatedKey'))
+
+
+def encode_page_token(last_key):
+    if not last_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+
+def decode_page_token(token):
+    if not token:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("잘못된 페이지 토큰입니다")
@@ -0,0 +1,162 @@
+"""
+Bedrock 모델 제공자 추상화
+- 모델 ID로 제공자(Anthropic, Meta, Amazon)를 판별하여 요청 본문과 응답 파싱을 통일
+- 일반 호출과 스트리밍 호출 모두 텍스트 델타와 토큰 사용량을 같은 형식으로 반환
+- Lambda 레이어(/opt/python)로 배포되어 generate, websocket, batch에서 공유
+"""
+import json
+
+DEFAULT_MAX_TOKENS = 4096
+
+
+def get_provider(model_id):
+    """모델 ID에서 제공자 판별 (apac./us. 등 추론 프로파일 접두사 포함)"""
+    model_id = model_id or ''
+    if 'anthropic.' in model_id:
+        return 'anthropic'
+    if 'meta.' in model_id:
+        return 'meta'
+    if 'amazon.' in model_id:
+        return 'amazon'
+    raise ValueError(f"지원하지 않는 모델 제공자입니다: {model_id}")
+
+
+def _llama_prompt(messages, system=None):
+    """Llama 3 채팅 템플릿으로 메시지 직렬화"""
+    parts = ['<|begin_of_text|>']
+    if system:
+        parts.append(f"<|start_header_id|>system<|end_header_id|>\n\n{system}<|eot_id|>")
+    for message in messages:
+        parts.append(f"<|start_header_id|>{message['role']}<|end_header_id|>\n\n{message['content']}<|eot_id|>")
+    parts.append('<|start_header_id|>assistant<|end_header_id|>\n\n')
+    return ''.join(parts)
+
+
+def build_request_body(model_id, messages, system=None, max_tokens=DEFAULT_MAX_TOKENS, temperature=0.1):
+    """
+    제공자별 요청 본문 생성
+    messages: [{'role': 'user'|'assistant', 'content': str}, ...]
+    """
+    provider = get_provider(model_id)
+
+    if provider == 'anthropic':
+        body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "messages": messages,
+            "temperature": temperature
+        }
+        if system:
+            body["system"] = system
+        return body
+
+    if provider == 'meta':
+        return {
+            "prompt": _llama_prompt(messages, system),
+            "max_gen_len": min(max_tokens, 2048),
+            "temperature": temperature
+        }
+
+    body = {
+        "schemaVersion": "messages-v1",
+        "messages": [
+            {"role": message['role'], "content": [{"text": message['content']}]}
+            for message in messages
+        ],
+        "inferenceConfig": {"maxTokens": max_tokens, "temperature": temperature}
+    }
+    if system:
+        body["system"] = [{"text": system}]
+    return body
+
+
+def parse_response(model_id, response_body):
+    """일반 호출 응답에서 (텍스트, 사용량) 추출"""
+    provider = get_provider(model_id)
+
+    if provider == 'anthropic':
+        text = ''.join(block.get('text', '') for block in response_body.get('content', []))
+        usage = response_body.get('usage', {})
+        return text, {
+            'input_tokens': usage.get('input_tokens', 0),
+            'output_tokens': usage.get('output_tokens', 0)
+        }
+
+    if provider == 'meta':
+        return response_body.get('generation', ''), {
+            'input_tokens': response_body.get('prompt_token_count', 0),
+            'output_tokens': response_body.get('generation_token_count', 0)
+        }
+
+    content = response_body.get('output', {}).get('message', {}).get('content', [])
+    usage = response_body.get('usage', {})
+    return ''.join(block.get('text', '') for block in content), {
+        'input_tokens': usage.get('inputTokens', 0),
+        'output_tokens': usage.get('outputTokens', 0)
+    }
+
+
+def parse_stream_event(model_id, chunk):
+    """
+    스트리밍 청크 하나에서 (텍스트 델타, 사용량 갱신) 추출
+    해당 정보가 없으면 각각 '' / None
+    """
+    provider = get_provider(model_id)
+
+    if provider == 'anthropic':
+        chunk_type = chunk.get('type')
+        if chunk_type == 'content_block_delta':
+            return chunk.get('delta', {}).get('text', ''), None
+        if chunk_type == 'message_start':
+            usage = chunk.get('message', {}).get('usage', {})
+            return '', {'input_tokens': usage.get('input_tokens', 0)}
+        if chunk_type == 'message_delta':
+            return '', {'output_tokens': chunk.get('usage', {}).get('output_tokens', 0)}
+        return '', None
+
+    if provider == 'meta':
+        usage = None
+        if 'generation_token_count' in chunk or 'prompt_token_count' in chunk:
+            usage = {}
+            if chunk.get('prompt_token_count') is not None:
+                usage['input_tokens'] = chunk['prompt_token_count']
+            if chunk.get('generation_token_count') is not None:
+                usage['output_tokens'] = chunk['generation_token_count']
+        return chunk.get('generation', '') or '', usage
+
+    if 'contentBlockDelta' in chunk:
+        return chunk['contentBlockDelta'].get('delta', {}).get('text', ''), None
+    if 'metadata' in chunk:
+        usage = chunk['metadata'].get('usage', {})
+        return '', {
+            'input_tokens': usage.get('inputTokens', 0),
+            'output_tokens': usage.get('outputTokens', 0)
+        }
+    return '', None
+
+
+def invoke(bedrock_client, model_id, messages, system=None, max_tokens=DEFAULT_MAX_TOKENS, temperature=0.1):
+    """일반 호출 후 (텍스트, 사용량) 반환"""
+    body = build_request_body(model_id, messages, system, max_tokens, temperature)
+    response = bedrock_client.invoke_model(modelId=model_id, body=json.dumps(body))
+    return parse_response(model_id, json.loads(response['body'].read()))
+
+
+def invoke_stream(bedrock_client, model_id, messages, system=None, max_tokens=DEFAULT_MAX_TOKENS,
+                  temperature=0.1, usage=None):
+    """
+    스트리밍 호출 후 텍스트 델타를 순서대로 생성
+    usage 딕셔너리를 넘기면 스트림 종료 시점까지의 토큰 사용량을 채움
+    """
+    body = build_request_body(model_id, messages, system, max_tokens, temperature)
+    response = bedrock_client.invoke_model_with_response_stream(modelId=model_id, body=json.dumps(body))
+
+    for event in response['body']:
+        if 'chunk' not in event:
+            continue
+        chunk = json.loads(event['chunk']['bytes'].decode('utf-8'))
+        text, usage_update = parse_stream_event(model_id, chunk)
+        if usage_update and usage is not None:
+            usage.update(usage_update)
+        if text:
+            yield text
@@ -0,0 +1,141 @@
+"""
+입력과의 유사도 기반 프롬프트 카드 선택
+- 카드마다 selectionMode를 가짐: always(기본, 항상 포함) / relevance(입력과의 유사도가 카드 relevanceThreshold 이상일 때만 포함)
+- relevanceThreshold는 단계별 실행의 신뢰도 임계값(threshold)과 별도 속성 (값의 척도가 달라 공유하지 않음)
+- 임베딩은 외부 모델 없이 문자 n-gram을 고정 차원으로 해싱한 벡터 (한국어는 음절 2~3-gram이 잘 맞음)
+- relevance 카드의 임베딩은 번들 생성 시(카드 변경 시) 미리 계산해 번들에 넣고, 인덱스는 번들 해시별로 캐시
+"""
+import math
+import re
+import threading
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # 패키징에 NumPy가 없으면 순수 Python 내적으로 계산
+    np = None
+
+SELECTION_ALWAYS = 'always'
+SELECTION_RELEVANCE = 'relevance'
+SELECTION_MODES = (SELECTION_ALWAYS, SELECTION_RELEVANCE)
+# relevanceThreshold 기본값 - 해싱 n-gram 코사인 유사도는 관련 있는 입력도 0.1~0.3 정도
+RELEVANCE_DEFAULT_THRESHOLD = 0.2
+
+EMBED_DIMS = 1024
+NGRAM_SIZES = (2, 3)
+# 입력 임베딩에 사용하는 앞부분 길이 (긴 기사도 요청당 비용을 일정하게 유지)
+EMBED_INPUT_CHARS = 4000
+INDEX_CACHE_SIZE = 4
+
+_index_cache = {}  # bundle hash -> RelevanceIndex
+_index_cache_lock = threading.Lock()
+
+
+def embed_text(text, dims=EMBED_DIMS, max_chars=None):
+    """
+    해싱된 문자 n-gram 임베딩 (L2 정규화된 희소 벡터 {차원: 가중치})
+    해시는 crc32를 사용해 프로세스가 달라도 같은 값이 나옴
+    """
+    text = re.sub(r'\s+', ' ', (text or '').lower()).strip()
+    if max_chars:
+        text = text[:max_chars]
+
+    counts = {}
+    for n in NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if gram.strip() != gram:
+                continue
+            hashed = zlib.crc32(gram.encode('utf-8'))
+            index = hashed % dims
+            sign = 1.0 if (hashed >> 31) & 1 == 0 else -1.0
+            counts[index] = counts.get(index, 0.0) + sign
+
+    vector = {index: math.copysign(math.log1p(abs(count)), count) for index, count in counts.items() if count}
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    if not norm:
+        return {}
+    return {index: value / norm for index, value in vector.items()}
+
+
+def encode_embedding(vector):
+    """번들 JSON에 넣을 수 있는 [[차원, 가중치], ...] 형태 (소수점 4자리)"""
+    return [[index, round(value, 4)] for index, value in sorted(vector.items())]
+
+
+class RelevanceIndex:
+    """relevance 카드 임베딩 행렬 (NumPy가 있으면 행렬곱, 없으면 희소 내적)"""
+
+    def __init__(self, entries, dims=EMBED_DIMS):
+        self.dims = dims
+        self.prompt_ids = [entry['promptId'] for entry in entries]
+        self.thresholds = {entry['promptId']: float(entry.get('relevanceThreshold', RELEVANCE_DEFAULT_THRESHOLD))
+                           for entry in entries}
+        self.vectors = [{int(index): value for index, value in entry['embedding']} for entry in entries]
+        self.matrix = None
+        if np is not None and entries:
+            self.matrix = np.zeros((len(entries), dims), dtype=np.float32)
+            for row, vector in enumerate(self.vectors):
+                for index, value in vector.items():
+                    self.matrix[row, index] = value
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        """번들의 relevance 카드로 인덱스 생성 (번들 해시별 캐시)"""
+        with _index_cache_lock:
+            cached = _index_cache.get(bundle['hash'])
+        if cached:
+            return cached
+
+        index = cls([
+            entry for entry in bundle['cards']
+            if entry.get('selectionMode') == SELECTION_RELEVANCE and entry.get('embedding')
+        ])
+        with _index_cache_lock:
+            if len(_index_cache) >= INDEX_CACHE_SIZE:
+                _index_cache.pop(next(iter(_index_cache)))
+            _index_cache[bundle['hash']] = index
+        return index
+
+    def __contains__(self, prompt_id):
+        return prompt_id in self.thresholds
+
+    def scores(self, text):
+        """입력과 각 relevance 카드의 코사인 유사도 {promptId: score}"""
+        if not self.prompt_ids:
+            return {}
+        query = embed_text(text, self.dims, max_chars=EMBED_INPUT_CHARS)
+        if self.matrix is not None:
+            dense = np.zeros(self.dims, dtype=np.float32)
+            for index, value in query.items():
+                dense[index] = value
+            values = (self.matrix @ dense).tolist()
+        else:
+            values = [
+                sum(value * vector.get(index, 0.0) for index, value in query.items())
+                for vector in self.vectors
+            ]
+        return dict(zip(self.prompt_ids, values))
+
+
+def select_relevant_cards(cards, user_input, index):
+    """
+    relevance 카드 중 입력과의 유사도가 threshold 미만인 카드를 제외 (순서 유지)
+    인덱스에 없는 카드(always 카드, 클라이언트 전용 카드)는 그대로 포함
+    """
+    if not cards or not user_input or index is None or not index.prompt_ids:
+        return cards
+
+    scores = index.scores(user_input)
+    selected = []
+    for card in cards:
+        prompt_id = card.get('promptId') or card.get('prompt_id')
+        if prompt_id not in index:
+            selected.append(card)
+            continue
+        score = scores.get(prompt_id, 0.0)
+        if score >= index.thresholds[prompt_id]:
+            selected.append(card)
+        else:
+            print(f"관련성 낮은 카드 제외: {prompt_id} (유사도 {score:.3f} < {index.thresholds[prompt_id]:.2f})")
+    return selected
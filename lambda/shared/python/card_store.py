@@ -0,0 +1,131 @@
+"""
+프롬프트 카드 본문 저장소
+- 배치 정책: 본문이 CARD_INLINE_MAX_BYTES 이하면 DynamoDB 항목의 content에, 크면 S3(cards/{promptId}/{hash}.txt)에 두고 s3Key만 기록
+- 읽기는 read_content 한 경로로 처리: 인라인 본문은 그대로, S3 본문은 컨테이너 캐시를 거쳐 로드
+- 저장(save_prompt), 생성(prompt_manager), WebSocket(prompt_card_cache), 번들 생성이 모두 이 모듈을 사용
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+# DynamoDB 항목에 직접 저장하는 본문 최대 크기 (항목 한도 400KB, 인덱스 프로젝션 포함 여유)
+CARD_INLINE_MAX_BYTES = int(os.environ.get('CARD_INLINE_MAX_BYTES', str(32 * 1024)))
+# S3 본문 키 접두사 (내용 해시가 키에 들어가므로 객체는 불변)
+CARD_CONTENT_PREFIX = 'cards/'
+# S3 본문 동시 로드 최대 스레드 수
+MAX_S3_WORKERS = 8
+# 컨테이너 수명 동안 유지하는 S3 본문 캐시 (s3Key -> {'etag', 'body', 'updatedAt'})
+BODY_CACHE_SIZE = 256
+
+_body_cache = {}
+_body_cache_lock = threading.Lock()
+
+
+def content_key(prompt_id, content):
+    return f"{CARD_CONTENT_PREFIX}{prompt_id}/{hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]}.txt"
+
+
+class CardStore:
+    """크기 기반 배치 정책과 캐시된 읽기 경로를 가진 카드 본문 저장소"""
+
+    def __init__(self, s3_client, bucket, inline_max_bytes=CARD_INLINE_MAX_BYTES):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.inline_max_bytes = inline_max_bytes
+
+    def place_content(self, prompt_id, content):
+        """
+        본문 배치 후 항목에 기록할 속성 반환
+        반환: (set_attributes, remove_attributes) - 인라인이면 s3Key 제거, S3면 content 제거
+        """
+        body = content.encode('utf-8')
+        if len(body) <= self.inline_max_bytes:
+            return {'content': content, 'contentBytes': len(body)}, ['s3Key']
+
+        s3_key = content_key(prompt_id, content)
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=s3_key,
+            Body=body,
+            ContentType='text/plain; charset=utf-8'
+        )
+        with _body_cache_lock:
+            _store_body(s3_key, '', content, '')
+        return {'s3Key': s3_key, 'contentBytes': len(body)}, ['content']
+
+    def read_content(self, item, default_key=None):
+        """카드 항목의 본문 반환 (인라인 → S3 순, 없으면 빈 문자열)"""
+        if item.get('content'):
+            return item['content']
+        s3_key = item.get('s3Key') or default_key
+        if not s3_key:
+            return ''
+        return self.read_body(s3_key, item.get('updatedAt', ''))
+
+    def load_contents(self, items, default_key_for=None):
+        """
+        여러 카드의 본문을 promptId -> 본문으로 반환
+        인라인 본문은 그대로 사용하고 S3 본문만 동시에 로드
+        """
+        contents = {}
+        pending = {}
+        for item in items:
+            if item.get('content'):
+                contents[item['promptId']] = item['content']
+            elif item.get('s3Key') or (default_key_for and default_key_for(item)):
+                pending[item['promptId']] = item
+
+        if pending:
+            workers = min(MAX_S3_WORKERS, len(pending))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    prompt_id: executor.submit(
+                        self.read_content, item, default_key_for(item) if default_key_for else None
+                    )
+                    for prompt_id, item in pending.items()
+                }
+                for prompt_id, future in futures.items():
+                    contents[prompt_id] = future.result()
+        return contents
+
+    def read_body(self, s3_key, updated_at=''):
+        """
+        S3 본문 로드 (컨테이너 캐시 사용)
+        - cards/ 아래 객체는 불변이므로 캐시에 있으면 그대로 반환
+        - 이전 경로 객체는 메타데이터의 updatedAt이 캐시와 같으면 요청 없이, 아니면 ETag 조건부 GET
+        """
+        with _body_cache_lock:
+            cached = _body_cache.get(s3_key)
+        if cached and (s3_key.startswith(CARD_CONTENT_PREFIX) or (updated_at and cached['updatedAt'] == updated_at)):
+            return cached['body']
+
+        request = {'Bucket': self.bucket, 'Key': s3_key}
+        if cached and cached['etag']:
+            request['IfNoneMatch'] = cached['etag']
+        try:
+            response = self.s3_client.get_object(**request)
+        except ClientError as e:
+            if cached and e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                with _body_cache_lock:
+                    cached['updatedAt'] = updated_at
+                return cached['body']
+            print(f"S3 프롬프트 본문 로드 실패: {s3_key}, {str(e)}")
+            return ''
+        except Exception as e:
+            print(f"S3 프롬프트 본문 로드 실패: {s3_key}, {str(e)}")
+            return ''
+
+        body = response['Body'].read().decode('utf-8').strip()
+        with _body_cache_lock:
+            _store_body(s3_key, response.get('ETag', ''), body, updated_at)
+        return body
+
+
+def _store_body(s3_key, etag, body, updated_at):
+    """캐시에 본문 저장 (호출자가 잠금을 보유, 가득 차면 가장 오래된 항목 제거)"""
+    if s3_key not in _body_cache and len(_body_cache) >= BODY_CACHE_SIZE:
+        _body_cache.pop(next(iter(_body_cache)))
+    _body_cache[s3_key] = {'etag': etag, 'body': body, 'updatedAt': updated_at}
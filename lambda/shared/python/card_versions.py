@@ -0,0 +1,179 @@
+"""
+프롬프트 카드 버전 이력 (PromptVersionsTable)
+- 항목 키: PK=promptId, SK=version(숫자) - 카드 생성/수정 시 새 버전을 추가만 하고 기존 버전은 고치지 않음
+- 메타 테이블 카드 항목의 version이 활성 버전 포인터이고, 본문/제목 등은 활성 버전의 사본 (기존 조회 경로 유지)
+- 요청은 {promptId, version}으로 버전을 고정할 수 있으며, 버전 항목은 불변이라 (promptId, version) 캐시는 무효화가 필요 없음
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from active_cards import decode_page_token, encode_page_token
+from card_relevance import RELEVANCE_DEFAULT_THRESHOLD, SELECTION_ALWAYS
+
+# 버전 항목에 복사하는 카드 속성 (본문은 카드 저장소 배치 결과 그대로: content 또는 s3Key)
+VERSION_ATTRIBUTES = ('title', 'content', 's3Key', 'contentBytes', 'threshold', 'relevanceThreshold', 'selectionMode', 'tags')
+# 버전 목록에서 읽는 속성 (본문 제외)
+VERSION_LIST_PROJECTION = ('promptId, version, title, threshold, relevanceThreshold, selectionMode, tags, contentBytes, '
+                           'createdAt, adminId')
+# 동시 수정으로 같은 버전 번호가 겹칠 때 재시도 횟수
+MAX_APPEND_ATTEMPTS = 5
+# DynamoDB BatchGetItem 한 번에 조회 가능한 최대 키 수
+BATCH_GET_LIMIT = 100
+VERSION_CACHE_SIZE = 512
+
+_version_cache = OrderedDict()  # (promptId, version) -> 카드
+_version_cache_lock = threading.Lock()
+
+
+def normalize_card_refs(card_refs):
+    """문자열 ID 또는 {promptId, version} 형태를 (promptId, version) 목록으로 변환 (버전은 문자열)"""
+    refs = []
+    for ref in card_refs or []:
+        if isinstance(ref, dict):
+            prompt_id = ref.get('promptId') or ref.get('prompt_id')
+            version = ref.get('version')
+        else:
+            prompt_id, version = ref, None
+        if prompt_id:
+            refs.append((str(prompt_id), str(version) if version is not None else None))
+    return refs
+
+
+def latest_version_number(table, prompt_id):
+    """카드의 가장 최근 버전 번호 (이력이 없으면 0)"""
+    response = table.query(
+        KeyConditionExpression='promptId = :id',
+        ExpressionAttributeValues={':id': prompt_id},
+        ProjectionExpression='version',
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return int(items[0]['version']) if items else 0
+
+
+def append_version(table, prompt_id, attributes, admin_id=None):
+    """
+    카드의 새 버전 추가 후 버전 항목 반환
+    최근 버전 + 1을 조건부 PutItem으로 기록 (다른 수정이 먼저 같은 번호를 쓰면 다음 번호로 재시도)
+    """
+    for _ in range(MAX_APPEND_ATTEMPTS):
+        item = {
+            'promptId': prompt_id,
+            'version': latest_version_number(table, prompt_id) + 1,
+            **{name: attributes[name] for name in VERSION_ATTRIBUTES if attributes.get(name) is not None},
+            'createdAt': datetime.now(timezone.utc).isoformat()
+        }
+        if admin_id:
+            item['adminId'] = admin_id
+        try:
+            table.put_item(Item=item, ConditionExpression='attribute_not_exists(promptId)')
+            return item
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
+    raise RuntimeError(f"카드 버전을 추가하지 못했습니다 (동시 수정 충돌): {prompt_id}")
+
+
+def get_version(table, prompt_id, version):
+    """버전 항목 하나 조회 (없으면 None)"""
+    return table.get_item(Key={'promptId': prompt_id, 'version': int(version)}).get('Item')
+
+
+def list_versions(table, prompt_id, limit=20, next_token=None):
+    """
+    카드의 버전 목록을 최신순으로 한 페이지 조회 (본문 제외)
+    반환: (items, next_token) - 마지막 페이지면 next_token은 None
+    """
+    kwargs = {
+        'KeyConditionExpression': 'promptId = :id',
+        'ExpressionAttributeValues': {':id': prompt_id},
+        'ProjectionExpression': VERSION_LIST_PROJECTION,
+        'ScanIndexForward': False,
+        'Limit': limit
+    }
+    start_key = decode_page_token(next_token)
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    response = table.query(**kwargs)
+    last_key = response.get('LastEvaluatedKey')
+    if last_key:
+        # 정렬 키가 숫자(Decimal)라 JSON 토큰용으로 변환
+        last_key = {'promptId': last_key['promptId'], 'version': int(last_key['version'])}
+    return response.get('Items', []), encode_page_token(last_key)
+
+
+def card_from_version(item, content):
+    """버전 항목을 프롬프트 구성에 사용하는 카드 형식으로 변환 (번들 카드와 같은 형식)"""
+    return {
+        'promptId': item['promptId'],
+        'title': item.get('title', ''),
+        'prompt_text': content,
+        'content': content,
+        'threshold': float(item.get('threshold', 0.7)),
+        'relevanceThreshold': float(item.get('relevanceThreshold', RELEVANCE_DEFAULT_THRESHOLD)),
+        'selectionMode': item.get('selectionMode') or SELECTION_ALWAYS,
+        'isActive': True,
+        'updatedAt': item.get('createdAt', ''),
+        'version': str(int(item['version']))
+    }
+
+
+def cached_version_cards(refs):
+    """캐시에 있는 고정 버전 카드만 {(promptId, version): 카드}로 반환 (조회 없음)"""
+    cards = {}
+    with _version_cache_lock:
+        for prompt_id, version in refs:
+            ref = (prompt_id, str(version)) if version is not None else None
+            card = _version_cache.get(ref) if ref else None
+            if card is not None:
+                _version_cache.move_to_end(ref)
+                cards[ref] = card
+    return cards
+
+
+def load_version_cards(table, card_store, refs):
+    """
+    고정된 (promptId, version) 목록을 카드로 해석해 {(promptId, version): 카드} 반환
+    캐시에 없는 버전만 BatchGetItem으로 조회하고, 없는 버전은 결과에서 빠짐
+    """
+    refs = [(prompt_id, str(version)) for prompt_id, version in refs
+            if version is not None and str(version).isdigit()]
+    cards = cached_version_cards(refs)
+    missing = [ref for ref in dict.fromkeys(refs) if ref not in cards]
+    if not missing:
+        return cards
+
+    loaded = []
+    client = table.meta.client
+    for i in range(0, len(missing), BATCH_GET_LIMIT):
+        request = {table.name: {'Keys': [
+            {'promptId': prompt_id, 'version': int(version)} for prompt_id, version in missing[i:i + BATCH_GET_LIMIT]
+        ]}}
+        # 처리되지 않은 키는 재시도
+        while request:
+            response = client.batch_get_item(RequestItems=request)
+            loaded.extend(response.get('Responses', {}).get(table.name, []))
+            request = response.get('UnprocessedKeys') or None
+
+    for item in loaded:
+        # S3 본문 키(cards/{promptId}/{hash}.txt)도 내용 해시 기반이라 불변
+        content = card_store.read_content(item)
+        card = card_from_version(item, content)
+        ref = (card['promptId'], card['version'])
+        cards[ref] = card
+        if not content and item.get('s3Key'):
+            # 본문 로드 실패는 캐시하지 않음 (다음 요청에서 다시 시도)
+            continue
+        with _version_cache_lock:
+            _version_cache[ref] = card
+            if len(_version_cache) > VERSION_CACHE_SIZE:
+                _version_cache.popitem(last=False)
+
+    for prompt_id, version in missing:
+        if (prompt_id, version) not in cards:
+            print(f"프롬프트 카드 버전을 찾을 수 없습니다: {prompt_id} v{version}")
+    return cards
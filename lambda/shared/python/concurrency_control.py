@@ -0,0 +1,231 @@
+"""
+AIMD 적응형 동시성 제어
+- 모델별 허용 동시 호출 수(limit)와 현재 호출 수(in_flight)를 DynamoDB 항목 하나에 공유
+- 정상 응답이면 limit을 가산 증가, 스로틀링이나 지연 초과면 승산 감소
+- 현재 limit/in_flight는 CloudWatch Embedded Metric Format으로 기록
+"""
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+import boto3
+
+RATE_CONTROL_TABLE = os.environ.get('RATE_CONTROL_TABLE')
+REGION = os.environ.get('REGION')
+METRICS_NAMESPACE = os.environ.get('CONCURRENCY_METRICS_NAMESPACE', 'BedrockDiy/Concurrency')
+
+INITIAL_LIMIT = float(os.environ.get('AIMD_INITIAL_LIMIT', '4'))
+MIN_LIMIT = float(os.environ.get('AIMD_MIN_LIMIT', '1'))
+MAX_LIMIT = float(os.environ.get('AIMD_MAX_LIMIT', '50'))
+# 성공 1건마다 1/limit 증가 → 전체 창이 성공하면 limit이 약 1 증가
+ADDITIVE_INCREASE = 1.0
+# 스로틀링 시 감소 비율, 지연 초과 시 감소 비율
+THROTTLE_DECREASE = 0.5
+LATENCY_DECREASE = 0.9
+# 이 시간 안에는 한 번만 감소 (동시에 여러 스로틀이 와도 한 번만 줄임)
+DECREASE_COOLDOWN_SECONDS = 2
+# 지연 목표 (초과 시 혼잡 신호로 간주)
+LATENCY_TARGET_MS = float(os.environ.get('AIMD_LATENCY_TARGET_MS', '60000'))
+# 반납되지 않은 허가(중단된 Lambda)를 정리하는 기준 시간
+STALE_PERMIT_SECONDS = 15 * 60
+STATE_TTL_SECONDS = 7 * 24 * 3600
+
+
+class ConcurrencyTimeout(Exception):
+    """허가를 제한 시간 안에 얻지 못함"""
+    pass
+
+
+def is_throttle_error(error):
+    """Bedrock 스로틀링 오류 여부"""
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code', '')
+    return code in ('ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException') \
+        or 'throttl' in str(error).lower()
+
+
+def _decimal(value):
+    return Decimal(str(round(value, 4)))
+
+
+class AimdController:
+    """모델별 AIMD 동시성 제어기"""
+
+    def __init__(self, table_name=RATE_CONTROL_TABLE):
+        self.table_name = table_name
+        self._local = threading.local()
+
+    @property
+    def table(self):
+        """스레드별 Table (boto3 resource는 스레드 간 공유가 안전하지 않음)"""
+        if not self.table_name:
+            return None
+        if not hasattr(self._local, 'table'):
+            self._local.table = boto3.session.Session().resource('dynamodb', region_name=REGION).Table(self.table_name)
+        return self._local.table
+
+    def _key(self, model_id):
+        return {'pk': f"aimd#{model_id}"}
+
+    def acquire(self, model_id, timeout_seconds=60):
+        """
+        허가 획득 (in_flight < limit일 때만 증가, 소수 limit은 올림값이 실제 한도)
+        제한 시간 초과 시 ConcurrencyTimeout
+        """
+        if not self.table:
+            return
+        deadline = time.time() + timeout_seconds
+        delay = 0.2
+        while True:
+            now = int(time.time())
+            try:
+                response = self.table.update_item(
+                    Key=self._key(model_id),
+                    UpdateExpression=(
+                        'SET #limit = if_not_exists(#limit, :initial), updated_at = :now, #ttl = :ttl '
+                        'ADD in_flight :one'
+                    ),
+                    ConditionExpression='attribute_not_exists(in_flight) OR in_flight < #limit',
+                    ExpressionAttributeNames={'#limit': 'limit', '#ttl': 'ttl'},
+                    ExpressionAttributeValues={
+                        ':initial': _decimal(INITIAL_LIMIT),
+                        ':one': 1,
+                        ':now': now,
+                        ':ttl': now + STATE_TTL_SECONDS
+                    },
+                    ReturnValues='ALL_NEW'
+                )
+                self._emit(model_id, response['Attributes'])
+                return
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+                self._reset_if_stale(model_id)
+                if time.time() >= deadline:
+                    raise ConcurrencyTimeout(f"동시성 허가 대기 시간 초과: {model_id}")
+                time.sleep(delay + random.uniform(0, delay))
+                delay = min(delay * 2, 2.0)
+
+    def release(self, model_id, throttled=False, latency_ms=None):
+        """허가 반납과 함께 결과에 따라 limit 조정"""
+        if not self.table:
+            return
+        try:
+            state = self.table.update_item(
+                Key=self._key(model_id),
+                UpdateExpression='ADD in_flight :minus_one SET updated_at = :now',
+                ConditionExpression='in_flight > :zero',
+                ExpressionAttributeValues={':minus_one': -1, ':zero': 0, ':now': int(time.time())},
+                ReturnValues='ALL_NEW'
+            )['Attributes']
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            # 오래된 허가 정리로 이미 초기화된 경우
+            state = self.table.get_item(Key=self._key(model_id)).get('Item') or {}
+        if not state:
+            return
+
+        limit = float(state.get('limit', INITIAL_LIMIT))
+        if throttled:
+            self._decrease(model_id, state, max(MIN_LIMIT, limit * THROTTLE_DECREASE), 'throttle')
+        elif latency_ms is not None and latency_ms > LATENCY_TARGET_MS:
+            self._decrease(model_id, state, max(MIN_LIMIT, limit * LATENCY_DECREASE), 'latency')
+        elif limit < MAX_LIMIT:
+            try:
+                self.table.update_item(
+                    Key=self._key(model_id),
+                    UpdateExpression='ADD #limit :increase',
+                    ConditionExpression='#limit < :max',
+                    ExpressionAttributeNames={'#limit': 'limit'},
+                    ExpressionAttributeValues={
+                        ':increase': _decimal(ADDITIVE_INCREASE / max(limit, 1.0)),
+                        ':max': _decimal(MAX_LIMIT)
+                    }
+                )
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+                pass
+
+        self._emit(model_id, state, throttled=throttled, latency_ms=latency_ms)
+
+    @contextmanager
+    def permit(self, model_id, timeout_seconds=60):
+        """
+        with 블록 동안 허가를 보유
+        블록에서 스로틀링 오류가 발생하면 limit을 감소시킨 뒤 오류를 다시 발생
+        """
+        self.acquire(model_id, timeout_seconds)
+        started = time.time()
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = is_throttle_error(e)
+            raise
+        finally:
+            try:
+                self.release(model_id, throttled=throttled, latency_ms=(time.time() - started) * 1000)
+            except Exception as e:
+                print(f"동시성 허가 반납 오류: {model_id}, {e}")
+
+    def _decrease(self, model_id, state, new_limit, reason):
+        """쿨다운 안에서는 한 번만 승산 감소 (이전 limit 값을 조건으로 사용)"""
+        now = time.time()
+        if not state or now - float(state.get('decreased_at', 0)) < DECREASE_COOLDOWN_SECONDS:
+            return
+        try:
+            self.table.update_item(
+                Key=self._key(model_id),
+                UpdateExpression='SET #limit = :new, decreased_at = :now',
+                ConditionExpression='#limit = :old',
+                ExpressionAttributeNames={'#limit': 'limit'},
+                ExpressionAttributeValues={
+                    ':new': _decimal(new_limit),
+                    ':old': state['limit'],
+                    ':now': _decimal(now)
+                }
+            )
+            print(f"동시성 한도 감소({reason}): {model_id} {float(state['limit']):.2f} → {new_limit:.2f}")
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+    def _reset_if_stale(self, model_id):
+        """오래 갱신되지 않은 상태의 in_flight 초기화 (반납되지 않은 허가 정리)"""
+        now = int(time.time())
+        try:
+            self.table.update_item(
+                Key=self._key(model_id),
+                UpdateExpression='SET in_flight = :zero, updated_at = :now',
+                ConditionExpression='updated_at < :stale',
+                ExpressionAttributeValues={':zero': 0, ':now': now, ':stale': now - STALE_PERMIT_SECONDS}
+            )
+            print(f"오래된 동시성 허가 초기화: {model_id}")
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+    def _emit(self, model_id, state, throttled=False, latency_ms=None):
+        """현재 limit/in_flight를 EMF 지표로 기록"""
+        if not state:
+            return
+        metrics = [
+            {'Name': 'ConcurrencyLimit', 'Unit': 'Count'},
+            {'Name': 'InFlight', 'Unit': 'Count'},
+            {'Name': 'Throttles', 'Unit': 'Count'}
+        ]
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['ModelId']],
+                    'Metrics': metrics
+                }]
+            },
+            'ModelId': model_id,
+            'ConcurrencyLimit': float(state.get('limit', INITIAL_LIMIT)),
+            'InFlight': int(state.get('in_flight', 0)),
+            'Throttles': 1 if throttled else 0
+        }
+        if latency_ms is not None:
+            metrics.append({'Name': 'BedrockLatency', 'Unit': 'Milliseconds'})
+            record['BedrockLatency'] = round(latency_ms, 1)
+        print(json.dumps(record))
@@ -0,0 +1,167 @@
+"""
+사전 결합된 프롬프트 번들
+- 카드 저장/수정/삭제 시 활성 카드를 생성일 순으로 결합한 불변 번들을 S3(bundles/{hash}.json)에 기록
+- 번들에는 결합 텍스트, 카드별 오프셋/길이/토큰 수, 내용 해시가 들어있어 일부 카드만 필요해도 잘라서 사용
+- 프롬프트 메타 테이블의 포인터 항목(bundle#active) 하나만 읽고 번들 본문은 해시별로 컨테이너에 캐시
+- relevance 선택 카드는 입력 유사도 계산용 임베딩을 함께 저장 (card_relevance 참고)
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from active_cards import query_active_cards
+from card_store import CardStore
+from card_relevance import (RELEVANCE_DEFAULT_THRESHOLD, SELECTION_ALWAYS, SELECTION_RELEVANCE, embed_text,
+                            encode_embedding)
+from token_budget import estimate_tokens
+
+BUNDLE_POINTER_KEY = {'promptId': 'bundle#active'}
+BUNDLE_PREFIX = 'bundles/'
+# 카드 사이 구분자 (생성 Lambda의 시스템 프롬프트 결합 방식과 동일)
+CARD_SEPARATOR = '\n\n'
+BUNDLE_CACHE_SIZE = 4
+
+_bundle_cache = {}  # hash -> bundle
+_bundle_cache_lock = threading.Lock()
+
+
+def build_bundle(cards):
+    """카드 목록(이미 정렬됨)으로 번들 생성 (content가 빈 카드는 제외)"""
+    parts, entries, offset = [], [], 0
+    for card in cards:
+        text = (card.get('content') or '').strip()
+        if not text:
+            continue
+        if parts:
+            offset += len(CARD_SEPARATOR)
+        entry = {
+            'promptId': card['promptId'],
+            'title': card.get('title', ''),
+            'threshold': float(card.get('threshold', 0.7)),
+            'updatedAt': card.get('updatedAt', ''),
+            'version': str(card['version']) if card.get('version') is not None else None,
+            'selectionMode': card.get('selectionMode') or SELECTION_ALWAYS,
+            'offset': offset,
+            'length': len(text),
+            'tokens': estimate_tokens(text)
+        }
+        if entry['selectionMode'] == SELECTION_RELEVANCE:
+            entry['relevanceThreshold'] = float(card.get('relevanceThreshold', RELEVANCE_DEFAULT_THRESHOLD))
+            entry['embedding'] = encode_embedding(embed_text(f"{entry['title']}\n{text}"))
+        entries.append(entry)
+        parts.append(text)
+        offset += len(text)
+
+    text = CARD_SEPARATOR.join(parts)
+    return {
+        'hash': hashlib.sha256(json.dumps([text, entries], ensure_ascii=False).encode('utf-8')).hexdigest(),
+        'text': text,
+        'cards': entries,
+        'totalTokens': sum(entry['tokens'] for entry in entries),
+        'createdAt': datetime.now(timezone.utc).isoformat()
+    }
+
+
+def materialize_bundle(table, s3_client, bucket):
+    """
+    활성 카드로 번들을 만들어 S3에 기록하고 포인터 갱신
+    동시에 여러 저장이 일어나면 더 늦게 시작한 결과만 포인터에 반영
+    """
+    started_at = time.time()
+    items = query_active_cards(
+        table,
+        projection=('promptId, title, content, threshold, relevanceThreshold, s3Key, createdAt, updatedAt, version, '
+                    'selectionMode')
+    )
+    items.sort(key=lambda item: item.get('createdAt', ''))
+    # 본문이 S3에 있는 큰 카드는 카드 저장소 캐시를 거쳐 로드
+    contents = CardStore(s3_client, bucket).load_contents(items)
+    for item in items:
+        item['content'] = contents.get(item['promptId'], '')
+        if not item['content'] and item.get('s3Key'):
+            # 카드가 빠진 번들로 포인터를 옮기지 않음
+            raise RuntimeError(f"카드 본문을 읽지 못했습니다: {item['promptId']}")
+
+    bundle = build_bundle(items)
+    bundle_key = f"{BUNDLE_PREFIX}{bundle['hash']}.json"
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=bundle_key,
+        Body=json.dumps(bundle, ensure_ascii=False).encode('utf-8'),
+        ContentType='application/json'
+    )
+
+    try:
+        table.update_item(
+            Key=BUNDLE_POINTER_KEY,
+            UpdateExpression=(
+                'SET bundleHash = :hash, bundleKey = :key, cardCount = :count, totalTokens = :tokens, '
+                'materializedAt = :started, updatedAt = :updated ADD bundleVersion :one'
+            ),
+            ConditionExpression='attribute_not_exists(materializedAt) OR materializedAt < :started',
+            ExpressionAttributeValues={
+                ':hash': bundle['hash'],
+                ':key': bundle_key,
+                ':count': len(bundle['cards']),
+                ':tokens': bundle['totalTokens'],
+                ':started': Decimal(str(round(started_at, 6))),
+                ':updated': bundle['createdAt'],
+                ':one': 1
+            }
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        # 더 늦게 시작한 번들 생성이 이미 포인터를 갱신함
+        return None
+    return bundle
+
+
+def load_bundle(table, s3_client, bucket):
+    """포인터가 가리키는 번들 반환 (포인터가 없으면 None)"""
+    pointer = table.get_item(Key=BUNDLE_POINTER_KEY, ProjectionExpression='bundleHash, bundleKey').get('Item')
+    if not pointer:
+        return None
+
+    bundle_hash = pointer['bundleHash']
+    with _bundle_cache_lock:
+        cached = _bundle_cache.get(bundle_hash)
+    if cached:
+        return cached
+
+    bundle = json.loads(s3_client.get_object(Bucket=bucket, Key=pointer['bundleKey'])['Body'].read())
+    with _bundle_cache_lock:
+        if len(_bundle_cache) >= BUNDLE_CACHE_SIZE:
+            _bundle_cache.pop(next(iter(_bundle_cache)))
+        _bundle_cache[bundle_hash] = bundle
+    return bundle
+
+
+def bundle_cards(bundle, refs=None):
+    """
+    번들에서 카드 본문을 잘라 카드 목록으로 반환
+    refs: [(promptId, version), ...] - 없으면 전체, 번들에 없거나 버전이 다른 카드가 있으면 None
+    """
+    entries = {entry['promptId']: entry for entry in bundle['cards']}
+    if refs is None:
+        refs = [(entry['promptId'], None) for entry in bundle['cards']]
+
+    cards = []
+    for prompt_id, version in refs:
+        entry = entries.get(prompt_id)
+        if not entry or (version is not None and entry.get('version') != str(version)):
+            return None
+        text = bundle['text'][entry['offset']:entry['offset'] + entry['length']]
+        cards.append({
+            'promptId': prompt_id,
+            'title': entry['title'],
+            'prompt_text': text,
+            'content': text,
+            'threshold': entry['threshold'],
+            'selectionMode': entry.get('selectionMode', SELECTION_ALWAYS),
+            'isActive': True,
+            'updatedAt': entry['updatedAt'],
+            'version': entry.get('version')
+        })
+    return cards
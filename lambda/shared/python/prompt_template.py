@@ -0,0 +1,137 @@
+"""
+프롬프트 카드 템플릿 ({{name}} placeholder)
+- 카드 본문을 한 번만 파싱해 (리터럴 목록, placeholder 이름 목록)으로 컴파일하고 (promptId, 본문 해시)별로 캐시
+  (클라이언트가 보낸 카드 본문도 렌더링하므로 클라이언트가 정하는 version은 캐시 키로 쓰지 않음)
+- 렌더링은 리터럴과 값을 번갈아 join할 뿐이라 요청마다 다시 파싱하지 않음
+- 값은 프롬프트 인스턴스 테이블(instanceId → placeholderValues)이나 요청 본문에서 받음
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*([A-Za-z0-9_\-\.가-힣]+)\s*\}\}')
+TEMPLATE_CACHE_SIZE = 512
+
+_template_cache = OrderedDict()  # (promptId, 본문 sha256) -> CompiledTemplate
+_template_cache_lock = threading.Lock()
+
+
+class TemplateRenderError(ValueError):
+    """placeholder 값이 모자라거나 카드에 없는 값이 전달됨"""
+
+    def __init__(self, message, missing=None, extra=None):
+        super().__init__(message)
+        self.missing = sorted(missing or [])
+        self.extra = sorted(extra or [])
+
+
+class CompiledTemplate:
+    """파싱된 템플릿 (literals는 names보다 항상 하나 많음)"""
+
+    __slots__ = ('literals', 'names', 'placeholders')
+
+    def __init__(self, literals, names):
+        self.literals = literals
+        self.names = names
+        self.placeholders = frozenset(names)
+
+    def render(self, values):
+        """placeholder를 값으로 치환 (빠진 값이 있으면 TemplateRenderError)"""
+        if not self.names:
+            return self.literals[0]
+        missing = self.placeholders.difference(values)
+        if missing:
+            raise TemplateRenderError(f"placeholder 값이 없습니다: {', '.join(sorted(missing))}", missing=missing)
+        parts = [None] * (len(self.literals) + len(self.names))
+        parts[0::2] = self.literals
+        parts[1::2] = [str(values[name]) for name in self.names]
+        return ''.join(parts)
+
+
+def compile_template(text):
+    """본문을 리터럴/placeholder 목록으로 파싱"""
+    literals, names = [], []
+    position = 0
+    for match in PLACEHOLDER_PATTERN.finditer(text or ''):
+        literals.append(text[position:match.start()])
+        names.append(match.group(1))
+        position = match.end()
+    literals.append((text or '')[position:])
+    return CompiledTemplate(literals, names)
+
+
+def get_compiled_template(prompt_id, text):
+    """
+    (promptId, 본문 해시)별로 캐시된 컴파일 결과 반환
+    같은 promptId/version으로 다른 본문이 들어와도(클라이언트 전송 카드, 버전 없이 바뀐 본문) 서로의 결과를 쓰지 않음
+    """
+    cache_key = (prompt_id, hashlib.sha256((text or '').encode('utf-8')).hexdigest())
+    with _template_cache_lock:
+        compiled = _template_cache.get(cache_key)
+        if compiled is not None:
+            _template_cache.move_to_end(cache_key)
+            return compiled
+
+    compiled = compile_template(text)
+    with _template_cache_lock:
+        _template_cache[cache_key] = compiled
+        if len(_template_cache) > TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+    return compiled
+
+
+def render_cards(cards, values):
+    """
+    카드 목록의 본문을 placeholder 값으로 렌더링한 새 카드 목록 반환
+    - 카드별로 빠진 값, 어느 카드에서도 쓰이지 않는 값(오타 등)은 TemplateRenderError
+    """
+    rendered, used, missing = [], set(), set()
+    for card in cards:
+        text = card.get('prompt_text', card.get('content', ''))
+        compiled = get_compiled_template(card.get('promptId') or card.get('prompt_id'), text)
+        used.update(compiled.placeholders)
+        missing.update(compiled.placeholders.difference(values))
+        if missing or not compiled.names:
+            rendered.append(card)
+            continue
+        body = compiled.render(values)
+        rendered.append({**card, 'prompt_text': body, 'content': body})
+
+    extra = set(values).difference(used)
+    if missing or extra:
+        problems = []
+        if missing:
+            problems.append(f"값이 없는 placeholder: {', '.join(sorted(missing))}")
+        if extra:
+            problems.append(f"카드에 없는 placeholder: {', '.join(sorted(extra))}")
+        raise TemplateRenderError('; '.join(problems), missing=missing, extra=extra)
+    return rendered
+
+
+def load_instance_values(table, instance_id):
+    """프롬프트 인스턴스의 placeholder 값 조회 (인스턴스가 없으면 TemplateRenderError)"""
+    item = table.get_item(Key={'instanceId': instance_id}).get('Item')
+    if not item:
+        raise TemplateRenderError(f"프롬프트 인스턴스를 찾을 수 없습니다: {instance_id}")
+    return dict(item.get('placeholderValues') or {})
+
+
+def resolve_placeholder_values(table, instance_id=None, inline_values=None):
+    """
+    요청의 placeholder 값 (인스턴스 값 위에 요청 본문의 placeholderValues를 덮어씀)
+    둘 다 없으면 None (카드 본문을 그대로 사용)
+    """
+    if not instance_id and not inline_values:
+        return None
+
+    values = {}
+    if instance_id:
+        if table is None:
+            raise TemplateRenderError("PROMPT_INSTANCE_TABLE이 설정되지 않아 프롬프트 인스턴스를 사용할 수 없습니다")
+        values.update(load_instance_values(table, instance_id))
+    if inline_values:
+        if not isinstance(inline_values, dict):
+            raise TemplateRenderError("placeholderValues는 객체여야 합니다")
+        values.update(inline_values)
+    return values
@@ -0,0 +1,151 @@
+"""
+사용자별 동시 스트림 제한
+- 사용자마다 RateControlTable 항목 하나(user#{key}#streams)에 진행 중인 스트림 lease를 맵으로 기록
+- lease마다 만료 시각이 있어 중간에 종료된 Lambda가 반납하지 못해도 자동으로 풀림
+- 한도에 도달하면 잠깐 대기(queue)한 뒤에도 자리가 없으면 StreamLimitExceeded로 빠르게 거절
+"""
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+import boto3
+
+RATE_CONTROL_TABLE = os.environ.get('RATE_CONTROL_TABLE')
+REGION = os.environ.get('REGION')
+
+# 사용자당 동시에 진행할 수 있는 스트림 수
+MAX_STREAMS_PER_USER = int(os.environ.get('MAX_STREAMS_PER_USER', '3'))
+# lease 유효 시간 (Lambda 최대 실행 시간 15분 + 여유)
+LEASE_SECONDS = 16 * 60
+# 한도 도달 시 자리가 나기를 기다리는 최대 시간
+QUEUE_WAIT_SECONDS = float(os.environ.get('STREAM_QUEUE_WAIT_SECONDS', '3'))
+# 거절 시 클라이언트에 안내하는 재시도 간격
+RETRY_AFTER_SECONDS = 5
+STATE_TTL_SECONDS = 24 * 3600
+
+
+class StreamLimitExceeded(Exception):
+    """사용자의 동시 스트림 한도 초과"""
+
+    def __init__(self, message, active, limit, retry_after=RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.active = active
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class StreamLimiter:
+    """사용자별 동시 스트림 세마포어 (lease 만료 포함)"""
+
+    def __init__(self, table_name=RATE_CONTROL_TABLE, limit=MAX_STREAMS_PER_USER):
+        self.table_name = table_name
+        self.limit = limit
+        self._local = threading.local()
+
+    @property
+    def table(self):
+        """스레드별 Table (boto3 resource는 스레드 간 공유가 안전하지 않음)"""
+        if not self.table_name:
+            return None
+        if not hasattr(self._local, 'table'):
+            self._local.table = boto3.session.Session().resource('dynamodb', region_name=REGION).Table(self.table_name)
+        return self._local.table
+
+    def _key(self, user_key):
+        return {'pk': f"user#{user_key}#streams"}
+
+    def acquire(self, user_key, on_queued=None, wait_seconds=QUEUE_WAIT_SECONDS, lease_seconds=LEASE_SECONDS):
+        """
+        스트림 lease 획득 후 lease ID 반환 (제한을 적용하지 않는 경우 None)
+        한도에 도달하면 on_queued(active, limit)를 한 번 호출하고 wait_seconds 동안 재시도
+        """
+        if not self.table or not user_key:
+            return None
+        lease_id = uuid.uuid4().hex
+        deadline = time.time() + wait_seconds
+        delay = 0.25
+        queued = False
+
+        while True:
+            acquired, active = self._try_acquire(user_key, lease_id, lease_seconds)
+            if acquired:
+                return lease_id
+            if time.time() + delay > deadline:
+                raise StreamLimitExceeded(
+                    f"동시 스트림 한도 초과: {user_key} ({active}/{self.limit})", active, self.limit
+                )
+            if not queued and on_queued:
+                on_queued(active, self.limit)
+                queued = True
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    def _try_acquire(self, user_key, lease_id, lease_seconds):
+        """
+        만료된 lease를 정리하고 자리가 있으면 새 lease 추가
+        version을 조건으로 맵 전체를 갱신 (다른 요청이 먼저 바꾸면 다시 읽음)
+        """
+        for _ in range(5):
+            now = time.time()
+            item = self.table.get_item(Key=self._key(user_key), ConsistentRead=True).get('Item')
+            leases = {
+                lid: expires_at
+                for lid, expires_at in ((item or {}).get('leases') or {}).items()
+                if float(expires_at) > now
+            }
+            if len(leases) >= self.limit:
+                return False, len(leases)
+            leases[lease_id] = Decimal(str(round(now + lease_seconds, 3)))
+
+            update_kwargs = {
+                'Key': self._key(user_key),
+                'UpdateExpression': 'SET leases = :leases, #ttl = :ttl ADD version :one',
+                'ExpressionAttributeNames': {'#ttl': 'ttl'},
+                'ExpressionAttributeValues': {
+                    ':leases': leases,
+                    ':ttl': int(now) + STATE_TTL_SECONDS,
+                    ':one': 1
+                }
+            }
+            if item and 'version' in item:
+                update_kwargs['ConditionExpression'] = 'version = :version'
+                update_kwargs['ExpressionAttributeValues'][':version'] = item['version']
+            else:
+                update_kwargs['ConditionExpression'] = 'attribute_not_exists(version)'
+            try:
+                self.table.update_item(**update_kwargs)
+                return True, len(leases)
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+                continue
+        # 경합이 계속되면 한도에 도달한 것으로 간주
+        return False, self.limit
+
+    def release(self, user_key, lease_id):
+        """lease 반납 (version도 올려서 동시에 진행 중인 획득이 반납 전 맵을 덮어쓰지 않게 함)"""
+        if not self.table or not user_key or not lease_id:
+            return
+        try:
+            self.table.update_item(
+                Key=self._key(user_key),
+                UpdateExpression='REMOVE leases.#lease ADD version :one',
+                ConditionExpression='attribute_exists(leases.#lease)',
+                ExpressionAttributeNames={'#lease': lease_id},
+                ExpressionAttributeValues={':one': 1}
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            # 이미 만료되어 정리된 lease
+            pass
+        except Exception as e:
+            print(f"스트림 lease 반납 오류: {user_key}, {e}")
+
+    @contextmanager
+    def slot(self, user_key, on_queued=None):
+        """with 블록 동안 스트림 lease를 보유"""
+        lease_id = self.acquire(user_key, on_queued=on_queued)
+        try:
+            yield lease_id
+        finally:
+            self.release(user_key, lease_id)
@@ -0,0 +1,123 @@
+"""
+에이전트 사고 로그 (AgentThoughtsTable)
+- 항목 키: PK=SESSION#{sessionId}, SK=THOUGHT#{timestamp}#{순번} → 세션별 Query 한 번으로 기록 순서대로 조회
+- ThoughtLogWriter는 기록을 순서대로 버퍼에 모았다가 25개가 차거나 일정 시간이 지나면 BatchWriteItem으로 저장
+- 핸들러 종료 전에 flush()를 호출해야 남은 기록이 저장됨 (처리되지 않은 항목은 백오프하며 재시도)
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import boto3
+
+from active_cards import decode_page_token, encode_page_token
+
+AGENT_THOUGHTS_TABLE = os.environ.get('AGENT_THOUGHTS_TABLE')
+REGION = os.environ.get('REGION')
+
+# BatchWriteItem 한 번에 보낼 수 있는 최대 항목 수
+BATCH_WRITE_LIMIT = 25
+# 버퍼의 첫 기록 이후 이 시간이 지나면 다음 기록 시 flush
+FLUSH_INTERVAL_SECONDS = float(os.environ.get('THOUGHT_FLUSH_INTERVAL_SECONDS', '2'))
+MAX_WRITE_ATTEMPTS = 5
+# 30일 후 자동 삭제
+THOUGHT_TTL_SECONDS = 30 * 24 * 3600
+
+
+def session_key(session_id):
+    return f"SESSION#{session_id}"
+
+
+class ThoughtLogWriter:
+    """세션 사고 로그 버퍼 (size/time 기준 flush, 미처리 항목 재시도)"""
+
+    def __init__(self, table_name=AGENT_THOUGHTS_TABLE, batch_size=BATCH_WRITE_LIMIT,
+                 flush_interval=FLUSH_INTERVAL_SECONDS):
+        self.table_name = table_name
+        self.batch_size = min(batch_size, BATCH_WRITE_LIMIT)
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._first_buffered_at = None
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._client = None
+
+    @property
+    def client(self):
+        # resource의 client는 Python 타입을 그대로 받음 (batch_write_item도 Decimal/str 자동 변환)
+        if self._client is None:
+            self._client = boto3.resource('dynamodb', region_name=REGION).meta.client
+        return self._client
+
+    def log(self, session_id, card_id, step_number, thought_type, content):
+        """사고 기록을 버퍼에 추가 (임계값에 도달하면 즉시 flush)"""
+        if not self.table_name:
+            return
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            # 같은 시각에 기록돼도 SK가 겹치지 않고 기록 순서가 유지되도록 순번을 붙임
+            self._sequence += 1
+            self._buffer.append({
+                'PK': session_key(session_id),
+                'SK': f"THOUGHT#{now.isoformat()}#{self._sequence:06d}",
+                'sessionId': session_id,
+                'cardId': card_id,
+                'stepNumber': step_number,
+                'thoughtType': thought_type,
+                'content': content,
+                'timestamp': now.isoformat(),
+                'ttl': int(now.timestamp()) + THOUGHT_TTL_SECONDS
+            })
+            if self._first_buffered_at is None:
+                self._first_buffered_at = time.time()
+            should_flush = (len(self._buffer) >= self.batch_size
+                            or time.time() - self._first_buffered_at >= self.flush_interval)
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """버퍼의 기록을 순서대로 BatchWriteItem으로 저장, 저장하지 못한 항목 수 반환"""
+        with self._lock:
+            pending, self._buffer = self._buffer, []
+            self._first_buffered_at = None
+        failed = 0
+        for i in range(0, len(pending), self.batch_size):
+            failed += self._write_batch(pending[i:i + self.batch_size])
+        return failed
+
+    def _write_batch(self, items):
+        request = {self.table_name: [{'PutRequest': {'Item': item}} for item in items]}
+        delay = 0.05
+        for attempt in range(MAX_WRITE_ATTEMPTS):
+            try:
+                response = self.client.batch_write_item(RequestItems=request)
+            except Exception as e:
+                print(f"사고 로그 저장 오류 (시도 {attempt + 1}/{MAX_WRITE_ATTEMPTS}): {e}")
+            else:
+                request = response.get('UnprocessedItems') or {}
+                if not request:
+                    return 0
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+        remaining = len(request.get(self.table_name, []))
+        print(f"사고 로그 {remaining}개를 저장하지 못했습니다: {self.table_name}")
+        return remaining
+
+
+def query_thoughts(table, session_id, limit=100, next_token=None):
+    """
+    세션의 사고 로그를 기록 순서대로 한 페이지 조회
+    반환: (items, next_token) - 마지막 페이지면 next_token은 None
+    """
+    kwargs = {
+        'KeyConditionExpression': 'PK = :pk AND begins_with(SK, :prefix)',
+        'ExpressionAttributeValues': {':pk': session_key(session_id), ':prefix': 'THOUGHT#'},
+        'Limit': limit
+    }
+    start_key = decode_page_token(next_token)
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    response = table.query(**kwargs)
+    return response.get('Items', []), encode_page_token(response.get('LastEvaluatedKey'))
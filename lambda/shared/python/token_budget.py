@@ -0,0 +1,156 @@
+"""
+계정 단위 TPM(분당 토큰) 예산 스케줄러
+- DynamoDB 항목 하나를 토큰 버킷으로 사용하고 조건부 업데이트(낙관적 동시성)로 차감
+- 컨테이너는 토큰을 묶음(lease)으로 미리 받아 로컬에서 소비하여 호출마다 DynamoDB를 읽지 않음
+- 배치 트래픽은 예약분(reserve)을 남겨두고만 사용할 수 있어 대화형 트래픽이 우선
+"""
+import os
+import random
+import threading
+import time
+from decimal import Decimal
+
+import boto3
+
+RATE_CONTROL_TABLE = os.environ.get('RATE_CONTROL_TABLE')
+REGION = os.environ.get('REGION')
+
+TPM_LIMIT = float(os.environ.get('BEDROCK_TPM_LIMIT', '400000'))
+# 배치 트래픽이 건드릴 수 없는 대화형 전용 비율
+INTERACTIVE_RESERVE_RATIO = float(os.environ.get('TPM_INTERACTIVE_RESERVE_RATIO', '0.3'))
+# 한 번에 미리 받아두는 토큰 수와 로컬 보유 유효 시간
+LEASE_TOKENS = int(os.environ.get('TPM_LEASE_TOKENS', '8000'))
+LEASE_TTL_SECONDS = 30
+# 대화형 요청이 예산을 기다리는 최대 시간 (초과 시 사용자 요청은 그대로 진행)
+INTERACTIVE_MAX_WAIT_SECONDS = 5
+STATE_TTL_SECONDS = 7 * 24 * 3600
+
+BUCKET_KEY = {'pk': 'tpm#global'}
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BATCH = 'batch'
+
+
+class BudgetExhausted(Exception):
+    """예산 부족으로 작업을 미뤄야 함 (retry_after초 후 재시도 권장)"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text, max_output_tokens=0):
+    """입력 길이로 토큰 수 추정 (약 4자 = 1토큰) + 예상 출력 토큰"""
+    return max(1, len(text or '') // 4) + int(max_output_tokens)
+
+
+class TokenBudget:
+    """분산 토큰 버킷 (컨테이너별 로컬 lease 포함)"""
+
+    def __init__(self, table_name=RATE_CONTROL_TABLE, tpm_limit=TPM_LIMIT):
+        self.table_name = table_name
+        self.capacity = tpm_limit
+        self.refill_per_second = tpm_limit / 60.0
+        self.reserve = tpm_limit * INTERACTIVE_RESERVE_RATIO
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # 우선순위별 로컬 보유 토큰과 만료 시각
+        self._leases = {PRIORITY_INTERACTIVE: [0, 0.0], PRIORITY_BATCH: [0, 0.0]}
+
+    @property
+    def table(self):
+        if not self.table_name:
+            return None
+        if not hasattr(self._local, 'table'):
+            self._local.table = boto3.session.Session().resource('dynamodb', region_name=REGION).Table(self.table_name)
+        return self._local.table
+
+    def take(self, tokens, priority=PRIORITY_INTERACTIVE):
+        """
+        토큰 차감
+        배치: 예산이 부족하면 BudgetExhausted (호출자가 작업을 미룸)
+        대화형: 잠시 기다린 뒤에도 부족하면 경고만 남기고 진행
+        """
+        if not self.table:
+            return
+        tokens = int(tokens)
+        deadline = time.time() + INTERACTIVE_MAX_WAIT_SECONDS
+
+        while True:
+            if self._take_local(tokens, priority):
+                return
+            granted, retry_after = self._lease(max(tokens, LEASE_TOKENS), tokens, priority)
+            if granted:
+                with self._lock:
+                    lease = self._leases[priority]
+                    lease[0] += granted - tokens
+                    lease[1] = time.time() + LEASE_TTL_SECONDS
+                return
+
+            if priority == PRIORITY_BATCH:
+                raise BudgetExhausted(f"TPM 예산 부족: {tokens}토큰 요청", retry_after)
+            if time.time() + retry_after > deadline:
+                print(f"TPM 예산 부족 - 대화형 요청은 대기 없이 진행: {tokens}토큰")
+                return
+            time.sleep(retry_after)
+
+    def settle(self, reserved_tokens, used_tokens, priority=PRIORITY_INTERACTIVE):
+        """실제 사용량과 예상치의 차이를 로컬 lease에 반영 (남으면 적립, 초과면 차감)"""
+        if not self.table:
+            return
+        with self._lock:
+            lease = self._leases[priority]
+            lease[0] += int(reserved_tokens) - int(used_tokens)
+
+    def _take_local(self, tokens, priority):
+        with self._lock:
+            lease = self._leases[priority]
+            if lease[1] < time.time():
+                lease[0] = 0
+            if lease[0] >= tokens:
+                lease[0] -= tokens
+                return True
+            return False
+
+    def _lease(self, want, need, priority):
+        """
+        버킷에서 토큰 묶음 차감 (리필 계산 후 refilled_at을 조건으로 갱신)
+        want만큼 안 되면 need 이상만큼 부분 지급, 불가하면 (0, 대기 시간) 반환
+        """
+        floor = self.reserve if priority == PRIORITY_BATCH else 0
+        for _ in range(5):
+            now = time.time()
+            state = self.table.get_item(Key=BUCKET_KEY, ConsistentRead=True).get('Item')
+            if state:
+                elapsed = max(0.0, now - float(state['refilled_at']))
+                available = min(self.capacity, float(state['tokens']) + elapsed * self.refill_per_second)
+            else:
+                available = self.capacity
+
+            usable = available - floor
+            if usable < need:
+                return 0, max(0.5, (need - usable) / self.refill_per_second)
+            granted = int(min(want, usable))
+
+            update_kwargs = {
+                'Key': BUCKET_KEY,
+                'UpdateExpression': 'SET tokens = :tokens, refilled_at = :now, #ttl = :ttl',
+                'ExpressionAttributeNames': {'#ttl': 'ttl'},
+                'ExpressionAttributeValues': {
+                    ':tokens': Decimal(str(round(available - granted, 3))),
+                    ':now': Decimal(str(round(now, 3))),
+                    ':ttl': int(now) + STATE_TTL_SECONDS
+                }
+            }
+            if state:
+                update_kwargs['ConditionExpression'] = 'refilled_at = :previous'
+                update_kwargs['ExpressionAttributeValues'][':previous'] = state['refilled_at']
+            else:
+                update_kwargs['ConditionExpression'] = 'attribute_not_exists(pk)'
+            try:
+                self.table.update_item(**update_kwargs)
+                return granted, 0
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+                # 다른 컨테이너가 먼저 갱신함 - 다시 읽어서 재시도
+                time.sleep(random.uniform(0.01, 0.05))
+        return 0, 0.5
@@ -3,11 +3,22 @@ WebSocket 연결 처리 Lambda 함수
 """
 import json
 import os
+import time
 import boto3
 from datetime import datetime, timedelta
 
+from connection_context import ConnectionAuthError, verify_connection_token, pack_context
+from message_store import query_owned_message_history
+from prompt_card_cache import load_active_cards
+
 dynamodb = boto3.client('dynamodb')
+dynamodb_resource = boto3.resource('dynamodb')
 CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE')
+MESSAGES_TABLE = os.environ.get('MESSAGES_TABLE')
+CONVERSATIONS_TABLE = os.environ.get('CONVERSATIONS_TABLE')
+
+# 연결 시 미리 불러올 최근 메시지 수 (stream.py의 SERVER_HISTORY_LIMIT와 동일)
+STAGED_HISTORY_LIMIT = 10
 
 def handler(event, context):
     """
@@ -23,21 +34,47 @@ def handler(event, context):
         
         print(f"연결 정보 - ID: {connection_id}, Domain: {domain_name}, Stage: {stage}")
         
+        query_params = event.get('queryStringParameters') or {}
+        
+        # 토큰이 있으면 검증 (유효하지 않은 토큰은 연결 거부, 토큰이 없으면 익명 연결)
+        try:
+            identity = verify_connection_token(query_params.get('token'))
+        except ConnectionAuthError as e:
+            print(f"WebSocket 연결 인증 실패: {connection_id}, {str(e)}")
+            return {
+                'statusCode': 401
+            }
+        
         # 연결 정보를 DynamoDB에 저장 (TTL 1시간)
         ttl = int((datetime.utcnow() + timedelta(hours=1)).timestamp())
         
+        item = {
+            'connectionId': {'S': connection_id},
+            'connectedAt': {'S': datetime.utcnow().isoformat()},
+            'domainName': {'S': domain_name},
+            'stage': {'S': stage},
+            'ttl': {'N': str(ttl)}
+        }
+        # 익명 연결의 동시 스트림 제한 키로 사용
+        source_ip = event['requestContext'].get('identity', {}).get('sourceIp')
+        if source_ip:
+            item['sourceIp'] = {'S': source_ip}
+        if identity and identity.get('userSub'):
+            item['userSub'] = {'S': identity['userSub']}
+            if identity.get('email'):
+                item['email'] = {'S': identity['email']}
+        
+        # 첫 stream 요청에서 바로 사용할 컨텍스트 준비
+        item.update(stage_connection_context(
+            query_params.get('conversationId'), identity.get('userSub') if identity else None
+        ))
+        
         dynamodb.put_item(
             TableName=CONNECTIONS_TABLE,
-            Item={
-                'connectionId': {'S': connection_id},
-                'connectedAt': {'S': datetime.utcnow().isoformat()},
-                'domainName': {'S': domain_name},
-                'stage': {'S': stage},
-                'ttl': {'N': str(ttl)}
-            }
+            Item=item
         )
         
-        print(f"WebSocket 연결 성공: {connection_id}")
+        print(f"WebSocket 연결 성공: {connection_id}, 사용자: {identity.get('userSub') if identity else '익명'}")
         
         # WebSocket 연결에서는 body가 필요하지 않음
         return {
@@ -51,4 +88,38 @@ def handler(event, context):
         # 연결 실패 시에도 적절한 응답 반환
         return {
             'statusCode': 500
-        }
\ No newline at end of file
+        }
+
+def stage_connection_context(conversation_id=None, user_sub=None):
+    """
+    활성 프롬프트 카드 묶음과 최근 대화를 압축하여 연결 항목 속성으로 반환
+    최근 대화는 토큰으로 검증한 사용자가 소유한 대화일 때만 준비
+    준비에 실패해도 연결은 유지 (stream Lambda가 기존 방식으로 조회)
+    """
+    attributes = {'stagedAt': {'N': str(int(time.time()))}}
+    
+    try:
+        cards = load_active_cards()
+        packed = pack_context(cards)
+        if packed is not None:
+            attributes['cardBundleZ'] = {'B': packed}
+            attributes['activeCardIds'] = {'L': [{'S': card['promptId']} for card in cards]}
+        else:
+            print(f"활성 카드 묶음이 너무 커서 미리 준비하지 않습니다: {len(cards)}개")
+    except Exception as e:
+        print(f"활성 카드 준비 오류: {str(e)}")
+    
+    if conversation_id and user_sub and MESSAGES_TABLE and CONVERSATIONS_TABLE:
+        try:
+            history = query_owned_message_history(
+                dynamodb_resource.Table(CONVERSATIONS_TABLE), dynamodb_resource.Table(MESSAGES_TABLE),
+                conversation_id, user_sub, STAGED_HISTORY_LIMIT
+            )
+            packed = pack_context(history) if history is not None else None
+            if packed is not None:
+                attributes['historyConversationId'] = {'S': conversation_id}
+                attributes['historyZ'] = {'B': packed}
+        except Exception as e:
+            print(f"최근 대화 준비 오류: {conversation_id}, {str(e)}")
+    
+    return attributes
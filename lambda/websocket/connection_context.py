@@ -0,0 +1,150 @@
+"""
+연결별 컨텍스트
+- $connect 시 토큰을 검증하여 사용자 정보를 연결 항목에 기록
+- 활성 프롬프트 카드 묶음과 최근 대화를 미리 압축 저장하여 첫 stream 요청이 바로 Bedrock을 호출하도록 함
+- stream Lambda는 연결마다 한 번만 읽고 컨테이너 메모리에 캐시
+"""
+import json
+import os
+import time
+import zlib
+import boto3
+
+try:
+    import jwt
+    from jwt import PyJWKClient
+except ImportError:  # 패키징에 PyJWT가 없으면 익명 연결로 처리
+    jwt = None
+    PyJWKClient = None
+
+CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE')
+USER_POOL_ID = os.environ.get('USER_POOL_ID')
+USER_POOL_CLIENT_ID = os.environ.get('USER_POOL_CLIENT_ID')
+AWS_REGION = os.environ.get('REGION', 'us-east-1')
+
+COGNITO_ISSUER = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{USER_POOL_ID}"
+
+# 연결 항목에 함께 저장할 압축 컨텍스트의 최대 크기 (400KB 항목 제한 여유 포함)
+CONTEXT_MAX_BYTES = 300 * 1024
+
+# 연결 항목을 다시 읽지 않고 재사용하는 시간
+CONTEXT_CACHE_TTL_SECONDS = 300
+
+dynamodb_resource = boto3.resource('dynamodb')
+
+_jwks_client = None
+
+# connectionId -> {'context': {...}, 'loaded_at': float}
+_context_cache = {}
+
+
+class ConnectionAuthError(Exception):
+    """연결 토큰 검증 실패"""
+    pass
+
+
+def verify_connection_token(token):
+    """
+    Cognito JWT 검증 후 사용자 정보 반환 (authorizer와 동일한 검증 규칙)
+    토큰이 없거나 PyJWT를 사용할 수 없으면 None 반환
+    """
+    global _jwks_client
+
+    if not token:
+        return None
+    if jwt is None or not USER_POOL_ID:
+        print("토큰 검증을 사용할 수 없어 익명 연결로 처리합니다")
+        return None
+
+    if _jwks_client is None:
+        _jwks_client = PyJWKClient(f"{COGNITO_ISSUER}/.well-known/jwks.json")
+
+    try:
+        signing_key = _jwks_client.get_signing_key_from_jwt(token)
+        payload = jwt.decode(
+            token,
+            signing_key.key,
+            algorithms=["RS256"],
+            issuer=COGNITO_ISSUER,
+            options={"verify_aud": False}
+        )
+    except jwt.ExpiredSignatureError:
+        raise ConnectionAuthError("토큰이 만료되었습니다")
+    except jwt.InvalidTokenError as e:
+        raise ConnectionAuthError(f"유효하지 않은 토큰: {str(e)}")
+
+    # id 토큰은 aud, access 토큰은 client_id에 앱 클라이언트 ID가 들어있음
+    token_use = payload.get('token_use')
+    if token_use not in ('access', 'id'):
+        raise ConnectionAuthError(f"지원하지 않는 토큰 용도: {token_use}")
+    client_id = payload.get('aud') if token_use == 'id' else payload.get('client_id')
+    if USER_POOL_CLIENT_ID and client_id != USER_POOL_CLIENT_ID:
+        raise ConnectionAuthError("토큰의 클라이언트 ID가 일치하지 않습니다")
+
+    return {
+        'userSub': payload.get('sub'),
+        'email': payload.get('email', ''),
+        'username': payload.get('cognito:username') or payload.get('username', '')
+    }
+
+
+def pack_context(value):
+    """컨텍스트 값을 zlib 압축, 제한을 넘으면 None"""
+    packed = zlib.compress(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'), 6)
+    if len(packed) > CONTEXT_MAX_BYTES:
+        return None
+    return packed
+
+
+def _unpack_context(value):
+    if value is None:
+        return None
+    value = getattr(value, 'value', value)
+    return json.loads(zlib.decompress(value).decode('utf-8'))
+
+
+def load_connection_context(connection_id):
+    """
+    연결 항목에 기록된 사용자 정보와 미리 준비된 카드/히스토리 조회
+    같은 컨테이너에서는 연결마다 한 번만 DynamoDB를 읽음
+    """
+    now = time.time()
+    entry = _context_cache.get(connection_id)
+    if entry and now - entry['loaded_at'] < CONTEXT_CACHE_TTL_SECONDS:
+        return entry['context']
+
+    context = {}
+    if CONNECTIONS_TABLE:
+        try:
+            item = dynamodb_resource.Table(CONNECTIONS_TABLE).get_item(
+                Key={'connectionId': connection_id}
+            ).get('Item') or {}
+            context = {
+                'userSub': item.get('userSub'),
+                'email': item.get('email'),
+                'sourceIp': item.get('sourceIp'),
+                'stagedAt': float(item.get('stagedAt', 0)),
+                'cards': _unpack_context(item.get('cardBundleZ')),
+                'historyConversationId': item.get('historyConversationId'),
+                'history': _unpack_context(item.get('historyZ'))
+            }
+        except Exception as e:
+            print(f"연결 컨텍스트 조회 오류: {connection_id}, {str(e)}")
+
+    # 오래된 연결 항목이 쌓이지 않도록 정리
+    if len(_context_cache) > 1000:
+        _context_cache.clear()
+    _context_cache[connection_id] = {'context': context, 'loaded_at': now}
+    return context
+
+
+def take_staged_history(connection_id, conversation_id):
+    """
+    $connect 시 준비한 히스토리를 한 번만 사용 (이후 메시지는 저장소에서 최신 상태로 조회)
+    """
+    context = _context_cache.get(connection_id, {}).get('context') or {}
+    if not conversation_id or context.get('historyConversationId') != conversation_id:
+        return None
+    history = context.pop('history', None)
+    context.pop('historyConversationId', None)
+    return history
@@ -0,0 +1,159 @@
+"""
+대화 메시지 저장소
+- 작은 메시지는 그대로, 중간 크기는 zlib 압축, 큰 메시지는 S3로 오프로드
+- 모든 메시지에 미리보기(preview)를 함께 저장하여 히스토리 조회 시 본문 없이 프로젝션 가능
+- 키는 CDK 테이블 정의를 따름: Messages(conversation_id, timestamp), Conversations(conversation_id, 소유자 user_id)
+- 저장된 대화의 히스토리는 대화 소유자(user_id)가 검증된 사용자와 같을 때만 조회
+"""
+import os
+import zlib
+import boto3
+from boto3.dynamodb.conditions import Key
+
+MESSAGE_BUCKET = os.environ.get('MESSAGE_BUCKET')
+
+# 이 크기(UTF-8 바이트) 이하는 압축하지 않고 그대로 저장
+INLINE_MAX_BYTES = 16 * 1024
+# 압축 후 이 크기 이하면 DynamoDB에 저장 (400KB 항목 제한 여유 포함), 초과 시 S3 오프로드
+COMPRESSED_MAX_BYTES = 300 * 1024
+PREVIEW_LENGTH = 200
+
+s3_client = boto3.client('s3')
+
+
+def build_message_item(conversation_id, timestamp, role, content, token_count, ttl):
+    """메시지 크기에 따라 저장 방식을 결정하여 DynamoDB 항목 생성"""
+    content = content or ''
+    raw = content.encode('utf-8')
+
+    item = {
+        'conversation_id': conversation_id,
+        'timestamp': timestamp,
+        'role': role,
+        'preview': content[:PREVIEW_LENGTH],
+        'contentLength': len(content),
+        'tokenCount': token_count,
+        'ttl': ttl
+    }
+
+    if len(raw) <= INLINE_MAX_BYTES:
+        item['content'] = content
+        return item
+
+    compressed = zlib.compress(raw, 6)
+    if len(compressed) <= COMPRESSED_MAX_BYTES or not MESSAGE_BUCKET:
+        item['contentEncoding'] = 'zlib'
+        item['contentZ'] = compressed
+        return item
+
+    s3_key = f"messages/{conversation_id}/{timestamp}-{role}.zlib"
+    s3_client.put_object(
+        Bucket=MESSAGE_BUCKET,
+        Key=s3_key,
+        Body=compressed,
+        ContentType='application/octet-stream'
+    )
+    item['contentEncoding'] = 'zlib'
+    item['contentS3Key'] = s3_key
+    return item
+
+
+def load_message_content(item):
+    """저장 방식과 관계없이 메시지 본문 복원"""
+    if 'content' in item:
+        return item['content']
+
+    if 'contentZ' in item:
+        compressed = item['contentZ']
+        # boto3 resource는 Binary 타입을 Binary 래퍼로 반환
+        compressed = getattr(compressed, 'value', compressed)
+    elif 'contentS3Key' in item:
+        response = s3_client.get_object(Bucket=MESSAGE_BUCKET, Key=item['contentS3Key'])
+        compressed = response['Body'].read()
+    else:
+        return item.get('preview', '')
+
+    return zlib.decompress(compressed).decode('utf-8')
+
+
+def query_message_previews(messages_table, conversation_id, limit=20):
+    """
+    최근 메시지 미리보기 조회 (본문 제외 프로젝션)
+    오래된 순서로 반환
+    """
+    response = messages_table.query(
+        KeyConditionExpression=Key('conversation_id').eq(conversation_id),
+        ProjectionExpression='#timestamp, #role, preview, contentLength, tokenCount',
+        ExpressionAttributeNames={'#timestamp': 'timestamp', '#role': 'role'},
+        ScanIndexForward=False,
+        Limit=limit
+    )
+    items = response.get('Items', [])
+    items.reverse()
+    return items
+
+
+def query_message_history(messages_table, conversation_id, limit=20):
+    """
+    최근 메시지 본문 조회 (압축/오프로드된 본문 복원 포함)
+    오래된 순서로 반환
+    """
+    response = messages_table.query(
+        KeyConditionExpression=Key('conversation_id').eq(conversation_id),
+        ScanIndexForward=False,
+        Limit=limit
+    )
+    items = response.get('Items', [])
+    items.reverse()
+    return [
+        {'role': item.get('role'), 'content': load_message_content(item)}
+        for item in items
+    ]
+
+
+def get_conversation_owner(conversations_table, conversation_id):
+    """대화 항목의 소유자(user_id), 대화가 없으면 None"""
+    item = conversations_table.get_item(
+        Key={'conversation_id': conversation_id},
+        ProjectionExpression='user_id'
+    ).get('Item')
+    return item.get('user_id') if item else None
+
+
+def query_owned_message_history(conversations_table, messages_table, conversation_id, user_sub, limit=20):
+    """
+    검증된 사용자가 소유한 대화일 때만 최근 메시지 본문 조회
+    소유자가 다르거나 사용자를 확인할 수 없으면 None
+    """
+    if not conversation_id or not user_sub:
+        return None
+    owner = get_conversation_owner(conversations_table, conversation_id)
+    if owner != user_sub:
+        print(f"대화 소유자가 아니므로 히스토리를 불러오지 않습니다: {conversation_id}")
+        return None
+    return query_message_history(messages_table, conversation_id, limit)
+
+
+def record_conversation_activity(conversations_table, conversation_id, user_sub, token_count, now):
+    """
+    대화의 마지막 활동 시간과 토큰 합계 갱신 (대화 항목이 없으면 user_sub 소유로 생성)
+    다른 사용자의 대화면 갱신하지 않고 False 반환
+    """
+    try:
+        conversations_table.update_item(
+            Key={'conversation_id': conversation_id},
+            UpdateExpression=(
+                'SET user_id = if_not_exists(user_id, :user), created_at = if_not_exists(created_at, :now), '
+                'lastActivityAt = :now, tokenSum = if_not_exists(tokenSum, :zero) + :tokens'
+            ),
+            ConditionExpression='attribute_not_exists(conversation_id) OR user_id = :user',
+            ExpressionAttributeValues={
+                ':user': user_sub,
+                ':now': now,
+                ':zero': 0,
+                ':tokens': token_count
+            }
+        )
+        return True
+    except conversations_table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
@@ -0,0 +1,215 @@
+"""
+프롬프트 카드 ID 해석 캐시
+- 클라이언트는 카드 본문 대신 promptCardIds(필요 시 버전 포함)만 전송
+- 컨테이너가 살아있는 동안 카드 본문을 메모리에 캐시하고 사전 결합된 번들, 없으면 프롬프트 메타 테이블에서 보충
+- 활성 버전과 다른 버전으로 고정된 카드는 버전 이력 테이블에서 해석 (불변 버전 캐시 사용)
+- 비활성(isActive=false) 카드는 버전을 고정해도 해석하지 않음
+"""
+import os
+import time
+import boto3
+
+from active_cards import query_active_cards
+from card_store import CardStore
+from card_versions import cached_version_cards, load_version_cards, normalize_card_refs
+from prompt_bundle import load_bundle, bundle_cards
+from card_relevance import RelevanceIndex, select_relevant_cards
+
+PROMPT_META_TABLE = os.environ.get('PROMPT_META_TABLE')
+PROMPT_BUCKET = os.environ.get('PROMPT_BUCKET')
+PROMPT_VERSIONS_TABLE = os.environ.get('PROMPT_VERSIONS_TABLE')
+
+# 카드(활성 여부 포함)를 다시 확인하기까지의 시간
+CARD_CACHE_TTL_SECONDS = int(os.environ.get('CARD_CACHE_TTL_SECONDS', '60'))
+
+# DynamoDB BatchGetItem 한 번에 조회 가능한 최대 키 수
+BATCH_GET_LIMIT = 100
+
+dynamodb_resource = boto3.resource('dynamodb')
+s3_client = boto3.client('s3')
+card_store = CardStore(s3_client, PROMPT_BUCKET)
+
+# promptId -> {'card': {...}, 'loaded_at': float}
+_card_cache = {}
+
+
+def _is_fresh(entry, version, now):
+    """
+    캐시 항목이 요청을 그대로 만족하는지 확인
+    버전이 고정된 요청도 활성 여부를 다시 확인하도록 TTL을 적용
+    """
+    if not entry:
+        return False
+    if version is not None and entry['card'].get('version') != version:
+        return False
+    return now - entry['loaded_at'] < CARD_CACHE_TTL_SECONDS
+
+
+def _meta_fresh(prompt_id, version, pinned, now):
+    """카드 메타(활성 여부)가 캐시로 충분한지 (이력에서 해석한 버전은 본문과 별개로 메타만 확인)"""
+    entry = _card_cache.get(prompt_id)
+    return _is_fresh(entry, None if (prompt_id, version) in pinned else version, now)
+
+
+def _load_cards(prompt_ids):
+    """프롬프트 메타 테이블에서 카드 일괄 조회"""
+    loaded = {}
+    keys = [{'promptId': prompt_id} for prompt_id in prompt_ids]
+
+    for i in range(0, len(keys), BATCH_GET_LIMIT):
+        request = {
+            PROMPT_META_TABLE: {
+                'Keys': keys[i:i + BATCH_GET_LIMIT],
+                'ProjectionExpression': 'promptId, title, content, threshold, isActive, s3Key, updatedAt, version'
+            }
+        }
+        # 처리되지 않은 키는 재시도
+        while request:
+            response = dynamodb_resource.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(PROMPT_META_TABLE, []):
+                loaded[item['promptId']] = item
+            request = response.get('UnprocessedKeys') or None
+
+    return loaded
+
+
+def _card_from_item(item, content=None):
+    """DynamoDB 항목을 프롬프트 구성에 사용하는 카드 형식으로 변환 (본문은 카드 저장소 경로로 읽음)"""
+    if content is None:
+        content = card_store.read_content(item) if PROMPT_BUCKET else item.get('content', '')
+
+    version = item.get('version')
+    return {
+        'promptId': item['promptId'],
+        'title': item.get('title', ''),
+        'prompt_text': content,
+        'content': content,
+        'threshold': float(item.get('threshold', 0.7)),
+        'isActive': item.get('isActive', True),
+        'updatedAt': item.get('updatedAt', ''),
+        'version': str(version) if version is not None else None
+    }
+
+
+def _load_bundle():
+    """활성 카드 번들 (번들이 없거나 읽기에 실패하면 None)"""
+    if not PROMPT_META_TABLE or not PROMPT_BUCKET:
+        return None
+    try:
+        return load_bundle(dynamodb_resource.Table(PROMPT_META_TABLE), s3_client, PROMPT_BUCKET)
+    except Exception as e:
+        print(f"프롬프트 번들 로드 실패: {str(e)}")
+        return None
+
+
+def _load_bundle_cards():
+    """활성 카드 번들의 카드 목록 (번들이 없으면 None)"""
+    bundle = _load_bundle()
+    return bundle_cards(bundle) if bundle else None
+
+
+def select_cards_for_input(cards, user_input):
+    """relevance 카드 중 입력과의 유사도가 카드 threshold 미만인 카드를 제외 (번들이 없으면 그대로)"""
+    bundle = _load_bundle()
+    if not bundle:
+        return cards
+    return select_relevant_cards(cards, user_input, RelevanceIndex.from_bundle(bundle))
+
+
+def load_active_cards():
+    """
+    활성화된 모든 카드를 조회하여 캐시에 채우고 생성일 순으로 반환
+    ($connect 시 연결별 컨텍스트를 미리 준비할 때 사용)
+    """
+    if not PROMPT_META_TABLE:
+        return []
+
+    # 번들이 있으면 포인터 조회 1회로 끝남 (번들 본문은 해시별로 캐시)
+    cards = _load_bundle_cards()
+    if cards is not None:
+        prime_card_cache(cards)
+        return cards
+
+    # 활성 카드 sparse 인덱스 조회 (활성 카드 수만큼만 읽음)
+    items = query_active_cards(
+        dynamodb_resource.Table(PROMPT_META_TABLE),
+        projection='promptId, title, content, threshold, isActive, s3Key, createdAt, updatedAt, version'
+    )
+    items.sort(key=lambda item: item.get('createdAt', ''))
+    contents = card_store.load_contents(items) if PROMPT_BUCKET else {}
+    now = time.time()
+    cards = []
+    for item in items:
+        card = _card_from_item(item, contents.get(item['promptId'], item.get('content', '')))
+        _card_cache[card['promptId']] = {'card': card, 'loaded_at': now}
+        cards.append(card)
+    return cards
+
+
+def prime_card_cache(cards, loaded_at=None):
+    """미리 준비된 카드 본문으로 캐시 채우기 (이미 더 최신 항목이 있으면 유지)"""
+    loaded_at = loaded_at or time.time()
+    for card in cards or []:
+        entry = _card_cache.get(card.get('promptId'))
+        if entry and entry['loaded_at'] >= loaded_at:
+            continue
+        _card_cache[card['promptId']] = {'card': card, 'loaded_at': loaded_at}
+
+
+def resolve_prompt_cards(card_refs):
+    """
+    카드 ID 목록을 요청 순서대로 카드 본문으로 해석
+    캐시에 없거나 만료된 카드만 한 번의 BatchGetItem으로 보충
+    """
+    refs = normalize_card_refs(card_refs)
+    if not refs:
+        return []
+
+    now = time.time()
+    # 이전에 이력에서 해석한 고정 버전은 불변이므로 캐시만으로 처리
+    pinned = cached_version_cards([(prompt_id, version) for prompt_id, version in refs
+                                   if version is not None and not _is_fresh(_card_cache.get(prompt_id), version, now)])
+    missing = [prompt_id for prompt_id, version in refs if not _meta_fresh(prompt_id, version, pinned, now)]
+
+    if missing and PROMPT_META_TABLE and PROMPT_BUCKET:
+        # 번들에 있는 카드로 먼저 보충 (버전이 다른 카드는 아래에서 테이블 조회)
+        prime_card_cache(_load_bundle_cards(), now)
+        missing = [prompt_id for prompt_id, version in refs if not _meta_fresh(prompt_id, version, pinned, now)]
+
+    if missing:
+        if not PROMPT_META_TABLE:
+            print("PROMPT_META_TABLE이 설정되지 않아 카드 ID를 해석할 수 없습니다")
+        else:
+            loaded = _load_cards(list(dict.fromkeys(missing)))
+            for prompt_id, item in loaded.items():
+                _card_cache[prompt_id] = {'card': _card_from_item(item), 'loaded_at': now}
+
+    # 활성 버전과 다른 버전으로 고정된 카드는 버전 이력에서 해석
+    pinned_refs = [(prompt_id, version) for prompt_id, version in refs
+                   if version is not None and (prompt_id, version) not in pinned
+                   and (_card_cache.get(prompt_id) or {}).get('card', {}).get('version') != version]
+    if pinned_refs:
+        if PROMPT_VERSIONS_TABLE:
+            pinned.update(load_version_cards(dynamodb_resource.Table(PROMPT_VERSIONS_TABLE), card_store, pinned_refs))
+        else:
+            print("PROMPT_VERSIONS_TABLE이 설정되지 않아 고정된 카드 버전을 해석할 수 없습니다")
+
+    cards = []
+    for prompt_id, version in refs:
+        entry = _card_cache.get(prompt_id)
+        if not entry:
+            print(f"프롬프트 카드를 찾을 수 없습니다: {prompt_id}")
+            continue
+        card = entry['card']
+        if not card.get('isActive', True):
+            print(f"비활성 프롬프트 카드는 사용할 수 없습니다: {prompt_id}")
+            continue
+        if (prompt_id, version) in pinned:
+            cards.append(pinned[(prompt_id, version)])
+            continue
+        if version is not None and card.get('version') != version:
+            print(f"프롬프트 카드 버전 불일치: {prompt_id} 요청={version}, 현재={card.get('version')}")
+        cards.append(card)
+
+    print(f"프롬프트 카드 ID 해석: 요청 {len(refs)}개, 테이블 조회 {len(missing)}개, 해석 {len(cards)}개")
+    return cards
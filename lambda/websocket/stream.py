@@ -5,7 +5,17 @@ import json
 import os
 import boto3
 import traceback
-from datetime import datetime, timezone
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from message_store import build_message_item, query_owned_message_history, record_conversation_activity
+from prompt_card_cache import resolve_prompt_cards, prime_card_cache, select_cards_for_input
+from connection_context import load_connection_context, take_staged_history
+from upload_frames import UploadError, start_upload, add_frame, assemble_upload
+from token_budget import TokenBudget, estimate_tokens
+from stream_limiter import StreamLimiter, StreamLimitExceeded
+from stream_buffer import StreamBuffer, get_stream_meta, load_deltas, attach_connection
+from prompt_template import TemplateRenderError, render_cards, resolve_placeholder_values
 
 # AWS 클라이언트
 bedrock_client = boto3.client("bedrock-runtime")
@@ -17,17 +27,41 @@ apigateway_client = boto3.client("apigatewaymanagementapi")
 CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE')
 PROMPT_META_TABLE = os.environ.get('PROMPT_META_TABLE')
 PROMPT_BUCKET = os.environ.get('PROMPT_BUCKET')
+# 사용자 placeholder 값 (promptInstanceId로 조회)
+PROMPT_INSTANCE_TABLE = os.environ.get('PROMPT_INSTANCE_TABLE')
 CONVERSATIONS_TABLE = os.environ.get('CONVERSATIONS_TABLE', 'Conversations')
 MESSAGES_TABLE = os.environ.get('MESSAGES_TABLE', 'Messages')
 MODEL_ID = "apac.anthropic.claude-sonnet-4-20250514-v1:0"
 
+# 계정 TPM 예산 (대화형 우선순위, RATE_CONTROL_TABLE이 없으면 제한 없음)
+token_budget = TokenBudget()
+# 예산 차감 시 가정하는 출력 토큰 수
+EXPECTED_OUTPUT_TOKENS = 2048
+
+# 사용자별 동시 스트림 제한 (RATE_CONTROL_TABLE이 없으면 제한 없음)
+stream_limiter = StreamLimiter()
+
 # DynamoDB tables
 conversations_table = dynamodb_resource.Table(CONVERSATIONS_TABLE)
 messages_table = dynamodb_resource.Table(MESSAGES_TABLE)
+prompt_instance_table = dynamodb_resource.Table(PROMPT_INSTANCE_TABLE) if PROMPT_INSTANCE_TABLE else None
 
 # 청크 데이터 임시 저장소 (Lambda 메모리에 저장)
 chunk_storage = {}
 
+# 프레임 업로드 시 첫 프레임에서 보관할 요청 필드
+UPLOAD_METADATA_FIELDS = (
+    'chat_history', 'prompt_cards', 'promptCardIds', 'modelId',
+    'conversationId', 'userSub', 'enableStepwise',
+    'promptInstanceId', 'placeholderValues'
+)
+
+# 클라이언트가 chat_history를 보내지 않을 때 서버에서 불러올 최근 메시지 수
+SERVER_HISTORY_LIMIT = 10
+
+# 스트림 재개 시 한 메시지에 묶어 보낼 최대 문자 수 (WebSocket 128KB 프레임 제한 고려)
+RESUME_BATCH_CHARS = 30000
+
 def handler(event, context):
     """
     WebSocket 스트리밍 메시지 처리
@@ -51,8 +85,12 @@ def handler(event, context):
         
         if action == 'stream':
             return handle_stream_request(connection_id, body)
+        elif action == 'stream_chunk' and body.get('uploadId'):
+            return handle_upload_frame(connection_id, body)
         elif action == 'stream_chunk':
             return handle_chunk_request(connection_id, body)
+        elif action == 'resume':
+            return handle_resume_request(connection_id, body)
         else:
             return send_error(connection_id, "지원하지 않는 액션입니다")
             
@@ -101,11 +139,14 @@ def handle_chunk_request(connection_id, data):
             # 재조합된 데이터로 스트림 처리
             reconstructed_data = {
                 'userInput': full_text,
-                'chat_history': metadata.get('chat_history', []),
+                'chat_history': metadata.get('chat_history'),
                 'prompt_cards': metadata.get('prompt_cards', []),
+                'promptCardIds': metadata.get('promptCardIds'),
                 'conversationId': metadata.get('conversationId'),
                 'userSub': metadata.get('userSub'),
-                'enableStepwise': metadata.get('enableStepwise', False)
+                'enableStepwise': metadata.get('enableStepwise', False),
+                'promptInstanceId': metadata.get('promptInstanceId'),
+                'placeholderValues': metadata.get('placeholderValues')
             }
             
             # 청크 저장소 정리
@@ -123,12 +164,82 @@ def handle_chunk_request(connection_id, data):
         print(f"청크 처리 오류: {traceback.format_exc()}")
         return send_error(connection_id, f"청크 처리 오류: {str(e)}")
 
+def handle_upload_start(connection_id, data):
+    """
+    바이트 기준 프레임 업로드의 첫 프레임 처리 (업로드 선언 + 요청 메타데이터 + 프레임 0)
+    """
+    try:
+        upload = data['upload']
+        upload_id = upload['uploadId']
+        total_frames = int(upload['totalFrames'])
+        metadata = {field: data[field] for field in UPLOAD_METADATA_FIELDS if field in data}
+        
+        print(f"🔍 [DEBUG] 프레임 업로드 시작: ID={upload_id}, 프레임={total_frames}, "
+              f"인코딩={upload.get('encoding')}, 바이트={upload.get('byteLength')}, 원본={upload.get('originalLength')}")
+        
+        ready = start_upload(upload_id, upload, metadata)
+        ready = add_frame(upload_id, 0, data.get('frameData'), data.get('frameLength')) or ready
+        if ready:
+            return _finish_upload(connection_id, upload_id)
+        
+        send_message(connection_id, {
+            "type": "progress",
+            "step": f"📦 대용량 텍스트 수신 중... (1/{total_frames})",
+            "progress": int((1 / total_frames) * 100)
+        })
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'message': '첫 번째 프레임 수신 완료'})
+        }
+        
+    except UploadError as e:
+        return send_error(connection_id, f"업로드 오류: {str(e)}")
+    except Exception as e:
+        print(f"프레임 업로드 오류: {traceback.format_exc()}")
+        return send_error(connection_id, f"업로드 오류: {str(e)}")
+
+def handle_upload_frame(connection_id, data):
+    """
+    바이트 기준 프레임 업로드의 후속 프레임 처리
+    """
+    try:
+        upload_id = data['uploadId']
+        frame_index = int(data['frameIndex'])
+        
+        print(f"🔍 [DEBUG] 프레임 수신: ID={upload_id}, Index={frame_index}")
+        
+        if add_frame(upload_id, frame_index, data.get('frameData'), data.get('frameLength')):
+            return _finish_upload(connection_id, upload_id)
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'message': f'프레임 {frame_index + 1} 수신 완료'})
+        }
+        
+    except UploadError as e:
+        return send_error(connection_id, f"업로드 오류: {str(e)}")
+    except Exception as e:
+        print(f"프레임 처리 오류: {traceback.format_exc()}")
+        return send_error(connection_id, f"업로드 오류: {str(e)}")
+
+def _finish_upload(connection_id, upload_id):
+    """모든 프레임 수신 후 검증/압축 해제하고 일반 스트림 처리로 전달"""
+    user_input, metadata = assemble_upload(upload_id)
+    print(f"🔍 [DEBUG] 프레임 재조합 완료: ID={upload_id}, {len(user_input)}자")
+    
+    metadata['userInput'] = user_input
+    return handle_stream_request(connection_id, metadata)
+
 def handle_stream_request(connection_id, data):
     """
     실시간 스트리밍 요청 처리 - 단계별 실행 및 사고과정 포함
     """
     try:
-        # 청크 분할된 메시지인지 확인
+        # 바이트 기준 프레임 업로드 (압축 + base64)
+        if data.get('upload'):
+            return handle_upload_start(connection_id, data)
+        
+        # 청크 분할된 메시지인지 확인 (문자 기준 레거시 방식)
         if data.get('chunked', False):
             chunk_id = data.get('chunkId')
             chunk_index = data.get('chunkIndex')
@@ -149,11 +260,14 @@ def handle_stream_request(connection_id, data):
                 
                 # 메타데이터 저장
                 chunk_storage[chunk_id]['metadata'] = {
-                    'chat_history': data.get('chat_history', []),
+                    'chat_history': data.get('chat_history'),
                     'prompt_cards': data.get('prompt_cards', []),
+                    'promptCardIds': data.get('promptCardIds'),
                     'conversationId': data.get('conversationId'),
                     'userSub': data.get('userSub'),
-                    'enableStepwise': data.get('enableStepwise', False)
+                    'enableStepwise': data.get('enableStepwise', False),
+                    'promptInstanceId': data.get('promptInstanceId'),
+                    'placeholderValues': data.get('placeholderValues')
                 }
                 
                 # 첫 번째 청크 저장
@@ -177,12 +291,33 @@ def handle_stream_request(connection_id, data):
         
         # 일반 메시지 처리
         user_input = data.get('userInput')
-        chat_history = data.get('chat_history', [])
-        prompt_cards = data.get('prompt_cards', [])
+        chat_history = data.get('chat_history')
+        prompt_cards = data.get('prompt_cards') or []
+        prompt_card_ids = data.get('promptCardIds') or []
         conversation_id = data.get('conversationId')
-        user_sub = data.get('userSub')
         enable_stepwise = data.get('enableStepwise', False)  # 단계별 실행 옵션
         
+        # $connect 시 준비된 연결 컨텍스트 (검증된 사용자, 활성 카드 묶음, 최근 대화)
+        # 대화 저장과 히스토리 조회는 검증된 사용자만 (메시지의 userSub는 클라이언트가 임의로 보낼 수 있음)
+        connection_context = load_connection_context(connection_id)
+        user_sub = connection_context.get('userSub')
+        if connection_context.get('cards'):
+            prime_card_cache(connection_context['cards'], connection_context.get('stagedAt'))
+        
+        # 카드 본문 대신 ID만 전송된 경우 서버 캐시에서 해석
+        if prompt_card_ids and not prompt_cards:
+            prompt_cards = resolve_prompt_cards(prompt_card_ids)
+        
+        # relevance 카드는 입력과의 유사도가 카드 threshold 이상일 때만 사용
+        if prompt_cards and user_input:
+            prompt_cards = select_cards_for_input(prompt_cards, user_input)
+        
+        # 히스토리를 보내지 않은 경우 연결 시 준비된 히스토리, 없으면 저장된 대화에서 로드
+        if chat_history is None:
+            chat_history = take_staged_history(connection_id, conversation_id)
+        if chat_history is None:
+            chat_history = load_recent_history(conversation_id, user_sub) if conversation_id else []
+        
         print(f"🔍 [DEBUG] WebSocket 스트림 요청 받음:")
         print(f"  - user_input: {user_input[:50]}..." if user_input else "  - user_input: None")
         print(f"  - user_input length: {len(user_input) if user_input else 0}")
@@ -192,135 +327,352 @@ def handle_stream_request(connection_id, data):
         if not user_input:
             return send_error(connection_id, "사용자 입력이 필요합니다")
         
-        # 단계별 실행 모드
-        if enable_stepwise and prompt_cards and len(prompt_cards) > 0:
-            return handle_stepwise_execution(connection_id, user_input, prompt_cards, chat_history, conversation_id, user_sub)
-        
-        # 1단계: 프롬프트 구성 시작
-        send_message(connection_id, {
-            "type": "progress",
-            "step": "🔧 프롬프트 카드를 분석하고 있습니다...",
-            "progress": 10
-        })
-        
-        # 프롬프트 구성
-        final_prompt = build_final_prompt(user_input, chat_history, prompt_cards)
-        
-        # 프롬프트 크기 확인
-        print(f"🔍 [DEBUG] 최종 프롬프트 크기: {len(final_prompt)}자 ({len(final_prompt) / 1024:.2f}KB)")
+        # 카드 템플릿 placeholder 렌더링 (컴파일 결과는 카드 버전별 캐시)
+        try:
+            placeholder_values = resolve_placeholder_values(
+                prompt_instance_table, data.get('promptInstanceId'), data.get('placeholderValues')
+            )
+            if placeholder_values is not None:
+                prompt_cards = render_cards(prompt_cards, placeholder_values)
+        except TemplateRenderError as e:
+            return send_error(connection_id, str(e))
         
-        # 프롬프트가 너무 큰 경우 처리 - 제거 (build_final_prompt에서 처리함)
-        # MAX_PROMPT_SIZE = 200000  # 200KB 제한 (안전한 범위)
-        # if len(final_prompt) > MAX_PROMPT_SIZE:
-        #     print(f"⚠️ [WARNING] 프롬프트가 너무 큽니다. 잘라서 처리합니다.")
-        #     # 채팅 히스토리를 줄이거나 user_input만 사용
-        #     final_prompt = build_final_prompt(user_input[:MAX_PROMPT_SIZE], [], prompt_cards)
+        # 사용자별 동시 스트림 제한 (한도에 도달하면 잠시 대기 후 거절)
+        limit_key = _stream_limit_key(connection_context)
+        try:
+            lease_id = stream_limiter.acquire(
+                limit_key,
+                on_queued=lambda active, limit: send_message(connection_id, {
+                    "type": "progress",
+                    "step": f"⏳ 진행 중인 응답이 많아 대기하고 있습니다... ({active}/{limit})",
+                    "progress": 5
+                })
+            )
+        except StreamLimitExceeded as e:
+            print(f"동시 스트림 한도 초과로 거절: {limit_key} ({e.active}/{e.limit})")
+            return _reject_stream(connection_id, e)
         
-        # 2단계: AI 모델 준비
-        send_message(connection_id, {
-            "type": "progress", 
-            "step": "🤖 AI 모델을 준비하고 있습니다...",
-            "progress": 25
-        })
+        try:
+            # 단계별 실행 모드
+            if enable_stepwise and prompt_cards and len(prompt_cards) > 0:
+                return handle_stepwise_execution(connection_id, user_input, prompt_cards, chat_history, conversation_id, user_sub)
+            
+            return _stream_response(connection_id, data, user_input, chat_history, prompt_cards, conversation_id, user_sub)
+        finally:
+            stream_limiter.release(limit_key, lease_id)
         
-        # Bedrock 스트리밍 요청
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "messages": [{"role": "user", "content": final_prompt}],
-            "temperature": 0.3,
-            "top_p": 0.9,
+    except Exception as e:
+        print(f"스트리밍 처리 오류: {traceback.format_exc()}")
+        send_error(connection_id, f"스트리밍 오류: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
         }
+
+def _stream_response(connection_id, data, user_input, chat_history, prompt_cards, conversation_id, user_sub):
+    """
+    단일 Bedrock 스트리밍 응답 생성 (동시 스트림 lease를 보유한 상태에서 호출)
+    """
+    # 1단계: 프롬프트 구성 시작
+    send_message(connection_id, {
+        "type": "progress",
+        "step": "🔧 프롬프트 카드를 분석하고 있습니다...",
+        "progress": 10
+    })
+    
+    # 프롬프트 구성
+    final_prompt = build_final_prompt(user_input, chat_history, prompt_cards)
+    
+    # 프롬프트 크기 확인
+    print(f"🔍 [DEBUG] 최종 프롬프트 크기: {len(final_prompt)}자 ({len(final_prompt) / 1024:.2f}KB)")
+    
+    # 프롬프트가 너무 큰 경우 처리 - 제거 (build_final_prompt에서 처리함)
+    # MAX_PROMPT_SIZE = 200000  # 200KB 제한 (안전한 범위)
+    # if len(final_prompt) > MAX_PROMPT_SIZE:
+    #     print(f"⚠️ [WARNING] 프롬프트가 너무 큽니다. 잘라서 처리합니다.")
+    #     # 채팅 히스토리를 줄이거나 user_input만 사용
+    #     final_prompt = build_final_prompt(user_input[:MAX_PROMPT_SIZE], [], prompt_cards)
+    
+    # 2단계: AI 모델 준비
+    send_message(connection_id, {
+        "type": "progress", 
+        "step": "🤖 AI 모델을 준비하고 있습니다...",
+        "progress": 25
+    })
+    
+    # Bedrock 스트리밍 요청
+    request_body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 4096,
+        "messages": [{"role": "user", "content": final_prompt}],
+        "temperature": 0.3,
+        "top_p": 0.9,
+    }
+    
+    # 3단계: 스트리밍 시작
+    send_message(connection_id, {
+        "type": "progress",
+        "step": "✍️ AI가 응답을 실시간으로 생성하고 있습니다...",
+        "progress": 40
+    })
+    
+    # TPM 예산 차감 (배치 작업보다 우선, 부족해도 잠시 대기 후 진행)
+    reserved_tokens = estimate_tokens(final_prompt, EXPECTED_OUTPUT_TOKENS)
+    token_budget.take(reserved_tokens)
+    
+    try:
+        # Bedrock 스트리밍 응답 처리
+        response_stream = bedrock_client.invoke_model_with_response_stream(
+            modelId=MODEL_ID,
+            body=json.dumps(request_body)
+        )
+    except Exception as bedrock_error:
+        print(f"❌ [ERROR] Bedrock API 호출 실패: {str(bedrock_error)}")
+        print(f"Request body size: {len(json.dumps(request_body))} bytes")
         
-        # 3단계: 스트리밍 시작
-        send_message(connection_id, {
-            "type": "progress",
-            "step": "✍️ AI가 응답을 실시간으로 생성하고 있습니다...",
-            "progress": 40
-        })
-        
-        try:
-            # Bedrock 스트리밍 응답 처리
-            response_stream = bedrock_client.invoke_model_with_response_stream(
-                modelId=MODEL_ID,
-                body=json.dumps(request_body)
-            )
-        except Exception as bedrock_error:
-            print(f"❌ [ERROR] Bedrock API 호출 실패: {str(bedrock_error)}")
-            print(f"Request body size: {len(json.dumps(request_body))} bytes")
-            
-            # 에러 타입에 따른 처리
-            error_message = str(bedrock_error)
-            if "ValidationException" in error_message:
-                if "maximum" in error_message.lower() or "token" in error_message.lower():
-                    send_error(connection_id, "입력 텍스트가 너무 깁니다. 텍스트를 줄여서 다시 시도해주세요.")
-                else:
-                    send_error(connection_id, "입력 형식이 올바르지 않습니다.")
-            elif "ThrottlingException" in error_message:
-                send_error(connection_id, "요청이 너무 많습니다. 잠시 후 다시 시도해주세요.")
+        # 에러 타입에 따른 처리
+        error_message = str(bedrock_error)
+        if "ValidationException" in error_message:
+            if "maximum" in error_message.lower() or "token" in error_message.lower():
+                send_error(connection_id, "입력 텍스트가 너무 깁니다. 텍스트를 줄여서 다시 시도해주세요.")
             else:
-                send_error(connection_id, f"AI 모델 호출 중 오류가 발생했습니다: {error_message}")
-            
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': str(bedrock_error)})
-            }
-        
-        full_response = ""
+                send_error(connection_id, "입력 형식이 올바르지 않습니다.")
+        elif "ThrottlingException" in error_message:
+            send_error(connection_id, "요청이 너무 많습니다. 잠시 후 다시 시도해주세요.")
+        else:
+            send_error(connection_id, f"AI 모델 호출 중 오류가 발생했습니다: {error_message}")
         
-        # 실시간 청크 전송
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': str(bedrock_error)})
+        }
+    
+    # 스트림 ID 부여 및 델타 버퍼 시작 (재연결 시 누락 구간 재전송용)
+    # ID는 항상 서버에서 생성 (클라이언트가 지정하면 다른 스트림의 메타데이터를 덮어쓸 수 있음)
+    stream_id = str(uuid.uuid4())
+    stream_buffer = StreamBuffer(stream_id, connection_id, conversation_id, user_sub)
+    stream_buffer.start()
+    
+    send_message(connection_id, {
+        "type": "stream_start",
+        "streamId": stream_id
+    })
+    
+    full_response = ""
+    used_tokens = 0
+    
+    # 실시간 청크 전송
+    try:
         for event in response_stream.get("body"):
             chunk = json.loads(event["chunk"]["bytes"].decode())
             
+            # 토큰 사용량 집계 (예산 정산용)
+            if chunk['type'] == 'message_start':
+                used_tokens += chunk.get('message', {}).get('usage', {}).get('input_tokens', 0)
+            elif chunk['type'] == 'message_delta':
+                used_tokens += chunk.get('usage', {}).get('output_tokens', 0)
+            
             if chunk['type'] == 'content_block_delta':
                 text = chunk['delta']['text']
                 full_response += text
                 
-                # 즉시 클라이언트로 전송
-                send_message(connection_id, {
-                    "type": "stream_chunk",
-                    "content": text
-                })
-        
-        # 4단계: 스트리밍 완료
+                seq = stream_buffer.append(text)
+                
+                # 즉시 클라이언트로 전송 (연결이 끊긴 경우 버퍼에만 기록)
+                if not stream_buffer.detached:
+                    _send_delta(stream_buffer, seq, text)
+                elif not stream_buffer.pending:
+                    # 버퍼 기록 직후 클라이언트가 다른 연결로 resume 했는지 확인
+                    _reattach_stream(stream_buffer)
+    except Exception:
+        stream_buffer.complete(status='error')
+        raise
+    
+    stream_buffer.complete()
+    if used_tokens:
+        token_budget.settle(reserved_tokens, used_tokens)
+    if stream_buffer.detached:
+        _reattach_stream(stream_buffer)
+    connection_id = stream_buffer.connection_id
+    
+    # 4단계: 스트리밍 완료
+    send_message(connection_id, {
+        "type": "progress",
+        "step": "✅ 응답 생성이 완료되었습니다!",
+        "progress": 100
+    })
+    
+    # 최종 완료 알림
+    send_message(connection_id, {
+        "type": "stream_complete", 
+        "streamId": stream_id,
+        "lastSeq": stream_buffer.seq,
+        "fullContent": full_response
+    })
+    
+    # 메시지 저장 (conversation_id와 user_sub가 있는 경우)
+    if conversation_id and user_sub:
+        print(f"🔍 [DEBUG] 메시지 저장 시작:")
+        print(f"  - conversation_id: {conversation_id}")
+        print(f"  - user_sub: {user_sub}")
+        print(f"  - user_input length: {len(user_input)}")
+        print(f"  - assistant_response length: {len(full_response)}")
+        save_conversation_messages(conversation_id, user_sub, user_input, full_response)
+    else:
+        print(f"🔍 [DEBUG] 메시지 저장 건너뜀:")
+        print(f"  - conversation_id: {conversation_id} (is None: {conversation_id is None})")
+        print(f"  - user_sub: {user_sub} (is None: {user_sub is None})")
+        print(f"  - 메시지가 저장되지 않습니다!")
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'message': '스트리밍 완료'})
+    }
+
+
+def _stream_limit_key(connection_context):
+    """
+    동시 스트림 제한 키 ($connect에서 검증해 연결에 저장한 userSub → 접속 IP)
+    메시지의 userSub는 클라이언트가 임의로 보낼 수 있으므로 사용하지 않음
+    """
+    if connection_context.get('userSub'):
+        return connection_context['userSub']
+    if connection_context.get('sourceIp'):
+        return f"ip:{connection_context['sourceIp']}"
+    return None
+
+
+def _reject_stream(connection_id, error):
+    """동시 스트림 한도 초과 응답 (클라이언트는 retryAfter초 후 재시도)"""
+    send_message(connection_id, {
+        "type": "error",
+        "reason": "stream_limit",
+        "message": f"동시에 진행할 수 있는 응답은 {error.limit}개입니다. 진행 중인 응답이 끝난 뒤 다시 시도해주세요.",
+        "retryAfter": error.retry_after,
+        "timestamp": datetime.utcnow().isoformat()
+    })
+    return {
+        'statusCode': 429,
+        'body': json.dumps({'error': str(error), 'retryAfter': error.retry_after})
+    }
+
+
+def _send_delta(stream_buffer, seq, text):
+    """순번이 매겨진 델타 전송, 연결이 끊긴 경우 버퍼를 분리 상태로 전환"""
+    delivered = send_message(stream_buffer.connection_id, {
+        "type": "stream_chunk",
+        "content": text,
+        "streamId": stream_buffer.stream_id,
+        "seq": seq
+    })
+    if not delivered:
+        print(f"🔍 [DEBUG] 연결 끊김 - 버퍼 기록만 계속: stream_id={stream_buffer.stream_id}, seq={seq}")
+        stream_buffer.detached = True
+
+def _reattach_stream(stream_buffer):
+    """resume으로 연결된 새 connection에 재전송 이후 구간을 보내고 실시간 전송 재개"""
+    reattached = stream_buffer.check_reattach()
+    if not reattached:
+        return
+    
+    new_connection_id, replayed_through = reattached
+    print(f"🔍 [DEBUG] 스트림 재연결: stream_id={stream_buffer.stream_id}, connection={new_connection_id}, from_seq={replayed_through}")
+    for seq, text in stream_buffer.deltas_after(replayed_through):
+        _send_delta(stream_buffer, seq, text)
+        if stream_buffer.detached:
+            break
+
+def _replay_deltas(connection_id, stream_id, deltas, from_seq):
+    """from_seq 이후 델타를 프레임 제한 내에서 묶어서 전송하고 마지막 seq 반환"""
+    replayed_through = from_seq
+    batch_text = ""
+    batch_start = None
+    for seq, text in deltas:
+        if seq <= from_seq:
+            continue
+        if batch_start is None:
+            batch_start = seq
+        batch_text += text
+        replayed_through = seq
+        if len(batch_text) >= RESUME_BATCH_CHARS:
+            send_message(connection_id, {
+                "type": "stream_chunk",
+                "content": batch_text,
+                "streamId": stream_id,
+                "seqStart": batch_start,
+                "seq": seq,
+                "replay": True
+            })
+            batch_text = ""
+            batch_start = None
+    if batch_text:
         send_message(connection_id, {
-            "type": "progress",
-            "step": "✅ 응답 생성이 완료되었습니다!",
-            "progress": 100
+            "type": "stream_chunk",
+            "content": batch_text,
+            "streamId": stream_id,
+            "seqStart": batch_start,
+            "seq": replayed_through,
+            "replay": True
         })
+    return replayed_through
+
+def handle_resume_request(connection_id, data):
+    """
+    끊긴 스트림 재개 - streamId의 fromSeq 이후 델타를 Bedrock 재호출 없이 재전송
+    스트림을 시작한 사용자와 같은 검증된 사용자의 연결만 재개 가능 (익명 스트림은 익명 연결만)
+    """
+    try:
+        stream_id = data.get('streamId')
+        from_seq = int(data.get('fromSeq', 0))
+        
+        if not stream_id:
+            return send_error(connection_id, "streamId가 필요합니다")
         
-        # 최종 완료 알림
+        meta = get_stream_meta(stream_id)
+        if not meta:
+            return send_error(connection_id, "재개할 스트림을 찾을 수 없습니다 (만료되었을 수 있습니다)")
+        
+        if meta.get('userSub') != load_connection_context(connection_id).get('userSub'):
+            print(f"스트림 소유자가 아니므로 재개 거절: stream_id={stream_id}, connection={connection_id}")
+            return send_error(connection_id, "재개할 스트림을 찾을 수 없습니다 (만료되었을 수 있습니다)")
+        
+        if meta.get('status') == 'error':
+            return send_error(connection_id, "스트림 생성 중 오류가 발생하여 재개할 수 없습니다")
+        
+        # 아직 생성 중인 스트림은 먼저 기록된 구간을 재전송하고 새 연결로 이어서 받도록 등록
+        replayed_through = from_seq
+        if meta.get('status') == 'streaming':
+            replayed_through = _replay_deltas(connection_id, stream_id, load_deltas(stream_id, from_seq), from_seq)
+            if attach_connection(stream_id, connection_id, replayed_through):
+                print(f"🔍 [DEBUG] 스트림 재개 등록: stream_id={stream_id}, replayed_through={replayed_through}")
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps({'message': '스트림 재개 완료'})
+                }
+            # 재전송 중에 스트림이 종료된 경우
+            meta = get_stream_meta(stream_id) or {}
+            if meta.get('status') == 'error':
+                return send_error(connection_id, "스트림 생성 중 오류가 발생하여 재개할 수 없습니다")
+        
+        # 완료된 스트림은 전체 내용이 필요하므로 처음부터 조회
+        deltas = load_deltas(stream_id, 0)
+        last_seq = _replay_deltas(connection_id, stream_id, deltas, replayed_through)
         send_message(connection_id, {
-            "type": "stream_complete", 
-            "fullContent": full_response
+            "type": "stream_complete",
+            "streamId": stream_id,
+            "lastSeq": last_seq,
+            "fullContent": "".join(text for _, text in deltas)
         })
-        
-        # 메시지 저장 (conversation_id와 user_sub가 있는 경우)
-        if conversation_id and user_sub:
-            print(f"🔍 [DEBUG] 메시지 저장 시작:")
-            print(f"  - conversation_id: {conversation_id}")
-            print(f"  - user_sub: {user_sub}")
-            print(f"  - user_input length: {len(user_input)}")
-            print(f"  - assistant_response length: {len(full_response)}")
-            save_conversation_messages(conversation_id, user_sub, user_input, full_response)
-        else:
-            print(f"🔍 [DEBUG] 메시지 저장 건너뜀:")
-            print(f"  - conversation_id: {conversation_id} (is None: {conversation_id is None})")
-            print(f"  - user_sub: {user_sub} (is None: {user_sub is None})")
-            print(f"  - 메시지가 저장되지 않습니다!")
+        print(f"🔍 [DEBUG] 완료된 스트림 재개: stream_id={stream_id}, from_seq={from_seq}, last_seq={last_seq}")
         
         return {
             'statusCode': 200,
-            'body': json.dumps({'message': '스트리밍 완료'})
+            'body': json.dumps({'message': '스트림 재개 완료'})
         }
         
     except Exception as e:
-        print(f"스트리밍 처리 오류: {traceback.format_exc()}")
-        send_error(connection_id, f"스트리밍 오류: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps({'error': str(e)})
-        }
+        print(f"스트림 재개 오류: {traceback.format_exc()}")
+        return send_error(connection_id, f"스트림 재개 오류: {str(e)}")
 
 def handle_stepwise_execution(connection_id, user_input, prompt_cards, chat_history, conversation_id, user_sub):
     """
@@ -341,6 +693,7 @@ def handle_stepwise_execution(connection_id, user_input, prompt_cards, chat_hist
         # 각 프롬프트 카드를 단계별로 실행
         for idx, card in enumerate(prompt_cards):
             step_name = card.get('title', f'Step {idx + 1}')
+            # 응답 신뢰도 임계값 (relevance 카드 선택 기준은 별도 속성 relevanceThreshold)
             threshold = float(card.get('threshold', 0.7))
             
             # 사고과정 시작
@@ -587,12 +940,14 @@ def build_final_prompt(user_input, chat_history, prompt_cards):
 def send_message(connection_id, message):
     """
     WebSocket 클라이언트로 메시지 전송
+    연결이 끊어진 경우(GoneException) False 반환
     """
     try:
         apigateway_client.post_to_connection(
             ConnectionId=connection_id,
             Data=json.dumps(message)
         )
+        return True
     except Exception as e:
         print(f"메시지 전송 실패: {connection_id}, 오류: {str(e)}")
         # 연결이 끊어진 경우 DynamoDB에서 제거
@@ -604,6 +959,8 @@ def send_message(connection_id, message):
                 )
             except:
                 pass
+            return False
+        return True
 
 def send_error(connection_id, error_message):
     """
@@ -631,74 +988,77 @@ def save_conversation_messages(conversation_id, user_sub, user_input, assistant_
         
         now = datetime.now(timezone.utc)
         user_timestamp = now.isoformat()
-        assistant_timestamp = (now.replace(microsecond=now.microsecond + 1000)).isoformat()
+        assistant_timestamp = (now + timedelta(milliseconds=1)).isoformat()
         
         # Calculate TTL (180 days from now)
         ttl = int(now.timestamp() + (180 * 24 * 60 * 60))
         
-        # 사용자 메시지 저장
-        user_message = {
-            'PK': f'CONV#{conversation_id}',
-            'SK': f'TS#{user_timestamp}',
-            'role': 'user',
-            'content': user_input,
-            'tokenCount': estimate_token_count(user_input),
-            'ttl': ttl
-        }
+        # 대화 소유권 확인 겸 활동 시간/토큰 합계 갱신 (다른 사용자의 대화에는 저장하지 않음)
+        total_tokens = estimate_token_count(user_input) + estimate_token_count(assistant_response)
+        if not update_conversation_activity(conversation_id, user_sub, total_tokens):
+            print(f"대화 소유자가 아니므로 메시지를 저장하지 않습니다: {conversation_id}")
+            return
         
-        # 어시스턴트 메시지 저장
-        assistant_message = {
-            'PK': f'CONV#{conversation_id}',
-            'SK': f'TS#{assistant_timestamp}',
-            'role': 'assistant', 
-            'content': assistant_response,
-            'tokenCount': estimate_token_count(assistant_response),
-            'ttl': ttl
-        }
+        # 메시지 크기에 따라 인라인 / zlib 압축 / S3 오프로드로 저장
+        user_message = build_message_item(
+            conversation_id, user_timestamp, 'user', user_input,
+            estimate_token_count(user_input), ttl
+        )
+        assistant_message = build_message_item(
+            conversation_id, assistant_timestamp, 'assistant', assistant_response,
+            estimate_token_count(assistant_response), ttl
+        )
         
         print(f"🔍 [DEBUG] DynamoDB에 저장할 메시지들:")
-        print(f"  - User message PK: {user_message['PK']}")
-        print(f"  - User message SK: {user_message['SK']}")
-        print(f"  - Assistant message PK: {assistant_message['PK']}")
-        print(f"  - Assistant message SK: {assistant_message['SK']}")
+        print(f"  - User message timestamp: {user_message['timestamp']}")
+        print(f"  - Assistant message timestamp: {assistant_message['timestamp']}")
+        print(f"  - User content 저장 방식: {_storage_mode(user_message)}")
+        print(f"  - Assistant content 저장 방식: {_storage_mode(assistant_message)}")
         
         # 배치로 메시지 저장
         with messages_table.batch_writer() as batch:
             batch.put_item(Item=user_message)
             batch.put_item(Item=assistant_message)
         
-        # 대화 활동 시간 및 토큰 카운트 업데이트
-        total_tokens = user_message['tokenCount'] + assistant_message['tokenCount']
-        update_conversation_activity(conversation_id, user_sub, total_tokens)
-        
         print(f"🔍 [DEBUG] 메시지 저장 완료: {conversation_id}, 토큰: {total_tokens}")
         
     except Exception as e:
         print(f"메시지 저장 오류: {str(e)}")
         print(traceback.format_exc())
 
+def _storage_mode(item):
+    """메시지 항목의 본문 저장 방식 (로그용)"""
+    if 'contentS3Key' in item:
+        return 's3'
+    if 'contentZ' in item:
+        return 'zlib'
+    return 'inline'
+
 def update_conversation_activity(conversation_id, user_sub, token_count):
     """
-    대화의 마지막 활동 시간과 토큰 합계 업데이트
+    대화의 마지막 활동 시간과 토큰 합계 업데이트 (처음 저장하는 대화는 user_sub 소유로 생성)
+    다른 사용자의 대화이거나 갱신에 실패하면 False
     """
     try:
         now = datetime.now(timezone.utc).isoformat()
-        
-        conversations_table.update_item(
-            Key={
-                'PK': f'USER#{user_sub}',
-                'SK': f'CONV#{conversation_id}'
-            },
-            UpdateExpression='SET lastActivityAt = :activity, tokenSum = tokenSum + :tokens',
-            ExpressionAttributeValues={
-                ':activity': now,
-                
-                ':tokens': token_count
-            }
-        )
-        
+        return record_conversation_activity(conversations_table, conversation_id, user_sub, token_count, now)
     except Exception as e:
         print(f"대화 활동 업데이트 오류: {str(e)}")
+        return False
+
+def load_recent_history(conversation_id, user_sub):
+    """
+    저장된 대화에서 최근 메시지를 chat_history 형식으로 로드 (검증된 사용자가 소유한 대화만)
+    """
+    try:
+        history = query_owned_message_history(
+            conversations_table, messages_table, conversation_id, user_sub, SERVER_HISTORY_LIMIT
+        ) or []
+        print(f"🔍 [DEBUG] 서버 측 히스토리 로드: {conversation_id}, {len(history)}개")
+        return history
+    except Exception as e:
+        print(f"히스토리 로드 오류: {str(e)}")
+        return []
 
 def estimate_token_count(text):
     """
@@ -0,0 +1,195 @@
+"""
+스트림 델타 버퍼
+- 스트림마다 streamId를 부여하고 델타를 순번(seq)과 함께 단기 저장
+- 재연결한 클라이언트가 "streamId의 seq N 이후"를 요청하면 Bedrock 재호출 없이 재전송
+"""
+import os
+import time
+import boto3
+from boto3.dynamodb.conditions import Key
+
+STREAM_BUFFER_TABLE = os.environ.get('STREAM_BUFFER_TABLE')
+STREAM_BUFFER_TTL_SECONDS = int(os.environ.get('STREAM_BUFFER_TTL_SECONDS', '3600'))
+
+# 몇 개의 델타마다 DynamoDB에 기록할지 (batch_writer는 25개 단위로 전송)
+FLUSH_EVERY = 25
+
+# seq 0은 스트림 메타데이터, 델타는 seq 1부터 시작
+META_SEQ = 0
+
+dynamodb_resource = boto3.resource('dynamodb')
+
+
+def _buffer_table():
+    if not STREAM_BUFFER_TABLE:
+        return None
+    return dynamodb_resource.Table(STREAM_BUFFER_TABLE)
+
+
+class StreamBuffer:
+    """하나의 스트림 응답을 순번이 매겨진 델타로 버퍼링"""
+
+    def __init__(self, stream_id, connection_id, conversation_id=None, user_sub=None):
+        self.stream_id = stream_id
+        self.connection_id = connection_id
+        self.conversation_id = conversation_id
+        self.user_sub = user_sub
+        self.seq = 0
+        self.deltas = []  # (seq, text) - 재연결 시 미기록 구간까지 재전송하기 위해 보관
+        self.pending = []
+        self.detached = False
+        self.ttl = int(time.time()) + STREAM_BUFFER_TTL_SECONDS
+        self.table = _buffer_table()
+
+    def start(self):
+        """스트림 메타데이터 기록 (같은 streamId가 이미 있으면 덮어쓰지 않음)"""
+        if not self.table:
+            return
+        try:
+            item = {
+                'streamId': self.stream_id,
+                'seq': META_SEQ,
+                'status': 'streaming',
+                'connectionId': self.connection_id,
+                'lastSeq': 0,
+                'replayedThrough': 0,
+                'ttl': self.ttl
+            }
+            if self.conversation_id:
+                item['conversationId'] = self.conversation_id
+            if self.user_sub:
+                item['userSub'] = self.user_sub
+            self.table.put_item(Item=item, ConditionExpression='attribute_not_exists(streamId)')
+        except Exception as e:
+            print(f"스트림 버퍼 시작 오류: {self.stream_id}, {str(e)}")
+
+    def append(self, text):
+        """델타 추가 후 부여된 seq 반환"""
+        self.seq += 1
+        self.deltas.append((self.seq, text))
+        self.pending.append(self.seq)
+        if len(self.pending) >= FLUSH_EVERY:
+            self.flush()
+        return self.seq
+
+    def flush(self, status=None):
+        """미기록 델타를 DynamoDB에 기록하고 메타데이터의 lastSeq 갱신"""
+        if not self.table:
+            self.pending = []
+            return
+        try:
+            if self.pending:
+                first = self.pending[0]
+                with self.table.batch_writer() as batch:
+                    for seq, text in self.deltas[first - 1:]:
+                        batch.put_item(Item={
+                            'streamId': self.stream_id,
+                            'seq': seq,
+                            'text': text,
+                            'ttl': self.ttl
+                        })
+                self.pending = []
+
+            update_kwargs = {
+                'Key': {'streamId': self.stream_id, 'seq': META_SEQ},
+                'UpdateExpression': 'SET lastSeq = :last',
+                'ExpressionAttributeValues': {':last': self.seq}
+            }
+            if status:
+                update_kwargs['UpdateExpression'] += ', #status = :status'
+                update_kwargs['ExpressionAttributeNames'] = {'#status': 'status'}
+                update_kwargs['ExpressionAttributeValues'][':status'] = status
+            self.table.update_item(**update_kwargs)
+        except Exception as e:
+            print(f"스트림 버퍼 기록 오류: {self.stream_id}, {str(e)}")
+
+    def complete(self, status='complete'):
+        """남은 델타 기록 후 스트림 종료 상태 기록"""
+        self.flush(status=status)
+
+    def check_reattach(self):
+        """
+        연결이 끊긴 상태에서 클라이언트가 다른 연결로 resume 했는지 확인
+        재연결된 경우 (새 connectionId, 이미 재전송된 마지막 seq) 반환
+        """
+        if not self.table or not self.detached:
+            return None
+        try:
+            meta = self.table.get_item(
+                Key={'streamId': self.stream_id, 'seq': META_SEQ},
+                ConsistentRead=True
+            ).get('Item')
+        except Exception as e:
+            print(f"스트림 재연결 확인 오류: {self.stream_id}, {str(e)}")
+            return None
+
+        if not meta or meta.get('connectionId') == self.connection_id:
+            return None
+
+        self.connection_id = meta['connectionId']
+        self.detached = False
+        return self.connection_id, int(meta.get('replayedThrough', 0))
+
+    def deltas_after(self, seq):
+        """메모리에 보관된 델타 중 seq 이후 구간"""
+        return [(s, text) for s, text in self.deltas if s > seq]
+
+
+def get_stream_meta(stream_id):
+    """스트림 메타데이터 조회"""
+    table = _buffer_table()
+    if not table:
+        return None
+    return table.get_item(
+        Key={'streamId': stream_id, 'seq': META_SEQ},
+        ConsistentRead=True
+    ).get('Item')
+
+
+def load_deltas(stream_id, from_seq=0):
+    """from_seq 이후의 기록된 델타를 순서대로 조회 (페이지네이션 포함)"""
+    table = _buffer_table()
+    if not table:
+        return []
+
+    deltas = []
+    query_kwargs = {
+        'KeyConditionExpression': Key('streamId').eq(stream_id) & Key('seq').gt(max(from_seq, META_SEQ)),
+        'ProjectionExpression': 'seq, #text',
+        'ExpressionAttributeNames': {'#text': 'text'},
+        'ConsistentRead': True
+    }
+    while True:
+        response = table.query(**query_kwargs)
+        for item in response.get('Items', []):
+            deltas.append((int(item['seq']), item.get('text', '')))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+    return deltas
+
+
+def attach_connection(stream_id, connection_id, replayed_through):
+    """
+    생성 중인 스트림을 새 연결에 연결하고 재전송한 마지막 seq 기록
+    그 사이 스트림이 종료된 경우 False 반환
+    """
+    table = _buffer_table()
+    if not table:
+        return False
+    try:
+        table.update_item(
+            Key={'streamId': stream_id, 'seq': META_SEQ},
+            UpdateExpression='SET connectionId = :conn, replayedThrough = :replayed',
+            ConditionExpression='#status = :streaming',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':conn': connection_id,
+                ':replayed': replayed_through,
+                ':streaming': 'streaming'
+            }
+        )
+        return True
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
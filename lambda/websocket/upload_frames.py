@@ -0,0 +1,201 @@
+"""
+대용량 입력 프레임 업로드
+- 클라이언트는 UTF-8 바이트를 gzip/deflate로 압축 후 base64로 인코딩하여 바이트 기준 프레임으로 분할
+- 업로드 전체의 바이트 길이와 SHA-256 체크섬을 선언하고 서버에서 재조합 후 검증
+- 프레임은 스트림 버퍼 테이블에 기록하여 어느 컨테이너에서 마지막 프레임을 받아도 재조합 가능
+"""
+import base64
+import hashlib
+import json
+import os
+import time
+import zlib
+import boto3
+from boto3.dynamodb.conditions import Key
+
+STREAM_BUFFER_TABLE = os.environ.get('STREAM_BUFFER_TABLE')
+UPLOAD_TTL_SECONDS = 15 * 60
+
+# 디코딩 후 허용하는 최대 입력 크기 (450K자 한글 ≈ 1.35MB)
+MAX_DECODED_BYTES = 2 * 1024 * 1024
+
+SUPPORTED_ENCODINGS = ('gzip', 'deflate', 'identity')
+
+dynamodb_resource = boto3.resource('dynamodb')
+
+
+class UploadError(Exception):
+    """프레임 업로드 검증 실패"""
+    pass
+
+
+def _upload_key(upload_id):
+    return f"upload#{upload_id}"
+
+
+def _upload_table():
+    if not STREAM_BUFFER_TABLE:
+        raise UploadError("업로드 버퍼 테이블이 설정되지 않았습니다")
+    return dynamodb_resource.Table(STREAM_BUFFER_TABLE)
+
+
+def start_upload(upload_id, upload, metadata):
+    """
+    첫 프레임 수신 시 업로드 선언(인코딩, 바이트 길이, 체크섬)과 요청 메타데이터 기록
+    선언보다 먼저 도착한 프레임이 있어도 집계되도록 항목을 덮어쓰지 않고 갱신
+    """
+    encoding = upload.get('encoding', 'identity')
+    if encoding not in SUPPORTED_ENCODINGS:
+        raise UploadError(f"지원하지 않는 인코딩입니다: {encoding}")
+
+    total_frames = int(upload['totalFrames'])
+    byte_length = int(upload['byteLength'])
+    if total_frames < 1 or byte_length < 0:
+        raise UploadError("잘못된 업로드 선언입니다")
+
+    response = _upload_table().update_item(
+        Key={'streamId': _upload_key(upload_id), 'seq': 0},
+        UpdateExpression=(
+            'SET #encoding = :encoding, totalFrames = :total, byteLength = :bytes, '
+            'originalLength = :original, #checksum = :checksum, #metadata = :metadata, #ttl = :ttl'
+        ),
+        ExpressionAttributeNames={
+            '#encoding': 'encoding',
+            '#checksum': 'checksum',
+            '#metadata': 'metadata',
+            '#ttl': 'ttl'
+        },
+        ExpressionAttributeValues={
+            ':encoding': encoding,
+            ':total': total_frames,
+            ':bytes': byte_length,
+            ':original': int(upload.get('originalLength', 0)),
+            ':checksum': upload.get('checksum', ''),
+            ':metadata': json.dumps(metadata, ensure_ascii=False),
+            ':ttl': int(time.time()) + UPLOAD_TTL_SECONDS
+        },
+        ReturnValues='ALL_NEW'
+    )
+    return _claim_if_complete(upload_id, response['Attributes'])
+
+
+def add_frame(upload_id, frame_index, frame_data, frame_length=None):
+    """
+    프레임 기록 후 모든 프레임과 선언이 도착했으면 True 반환
+    프레임 번호를 집합으로 기록하므로 중복 수신이나 순서 뒤바뀜에도 한 번만 재조합
+    """
+    table = _upload_table()
+    frame_bytes = base64.b64decode(frame_data or '')
+    if frame_length is not None and len(frame_bytes) != int(frame_length):
+        raise UploadError(f"프레임 {frame_index} 길이 불일치: 선언 {frame_length}, 수신 {len(frame_bytes)}")
+
+    ttl = int(time.time()) + UPLOAD_TTL_SECONDS
+    table.put_item(
+        Item={
+            'streamId': _upload_key(upload_id),
+            'seq': int(frame_index) + 1,
+            'data': frame_bytes,
+            'ttl': ttl
+        }
+    )
+
+    response = table.update_item(
+        Key={'streamId': _upload_key(upload_id), 'seq': 0},
+        UpdateExpression='ADD frameIndexes :index SET #ttl = if_not_exists(#ttl, :ttl)',
+        ExpressionAttributeNames={'#ttl': 'ttl'},
+        ExpressionAttributeValues={
+            ':index': {int(frame_index)},
+            ':ttl': ttl
+        },
+        ReturnValues='ALL_NEW'
+    )
+    return _claim_if_complete(upload_id, response['Attributes'])
+
+
+def _claim_if_complete(upload_id, attributes):
+    """선언과 모든 프레임이 도착했으면 재조합 권한을 한 번만 획득"""
+    if 'totalFrames' not in attributes:
+        return False
+    if len(attributes.get('frameIndexes', [])) != int(attributes['totalFrames']):
+        return False
+
+    table = _upload_table()
+    try:
+        table.update_item(
+            Key={'streamId': _upload_key(upload_id), 'seq': 0},
+            UpdateExpression='SET assembling = :true',
+            ConditionExpression='attribute_not_exists(assembling)',
+            ExpressionAttributeValues={':true': True}
+        )
+        return True
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def assemble_upload(upload_id):
+    """
+    모든 프레임을 순서대로 이어붙이고 길이/체크섬 검증 후 압축 해제
+    (원본 텍스트, 첫 프레임의 요청 메타데이터) 반환
+    """
+    table = _upload_table()
+    key = _upload_key(upload_id)
+
+    items = []
+    query_kwargs = {
+        'KeyConditionExpression': Key('streamId').eq(key),
+        'ConsistentRead': True
+    }
+    while True:
+        response = table.query(**query_kwargs)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+    if not items or int(items[0]['seq']) != 0:
+        raise UploadError("업로드 선언을 찾을 수 없습니다")
+
+    declaration = items[0]
+    frames = items[1:]
+    total_frames = int(declaration['totalFrames'])
+    if len(frames) != total_frames:
+        raise UploadError(f"프레임 누락: {len(frames)}/{total_frames}")
+
+    payload = b''.join(bytes(getattr(frame['data'], 'value', frame['data'])) for frame in frames)
+
+    if len(payload) != int(declaration['byteLength']):
+        raise UploadError(f"바이트 길이 불일치: 선언 {declaration['byteLength']}, 수신 {len(payload)}")
+
+    checksum = declaration.get('checksum')
+    if checksum and hashlib.sha256(payload).hexdigest() != checksum:
+        raise UploadError("체크섬이 일치하지 않습니다")
+
+    encoding = declaration.get('encoding', 'identity')
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        decompressor = zlib.decompressobj()
+    else:
+        decompressor = None
+
+    if decompressor:
+        raw = decompressor.decompress(payload, MAX_DECODED_BYTES)
+        if decompressor.unconsumed_tail:
+            raise UploadError("압축 해제 후 입력이 너무 큽니다")
+    else:
+        raw = payload
+
+    original_length = int(declaration.get('originalLength', 0))
+    if original_length and len(raw) != original_length:
+        raise UploadError(f"원본 길이 불일치: 선언 {original_length}, 복원 {len(raw)}")
+
+    # 재조합이 끝난 프레임 정리 (실패해도 TTL로 삭제됨)
+    try:
+        with table.batch_writer() as batch:
+            for item in items:
+                batch.delete_item(Key={'streamId': key, 'seq': item['seq']})
+    except Exception as e:
+        print(f"업로드 프레임 정리 오류: {upload_id}, {str(e)}")
+
+    return raw.decode('utf-8'), json.loads(declaration.get('metadata', '{}'))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+프롬프트 메타 테이블 active-index 백필 스크립트
+- 인덱스 도입 전에 만들어진 카드에 activeSortKey를 채우고, 활성 카드에만 activeFlag를 기록
+- 배포 후 한 번 실행 (여러 번 실행해도 결과가 같음)
+
+사용법: python scripts/backfill_active_index.py <prompt-meta-table-name> [--dry-run]
+"""
+import sys
+import boto3
+
+ACTIVE_FLAG = "ACTIVE"
+GLOBAL_PROJECT = "GLOBAL"
+
+
+def backfill_active_index(table_name, dry_run=False):
+    table = boto3.resource("dynamodb").Table(table_name)
+    print(f"\n🔧 active-index 백필 시작: {table_name}{' (dry-run)' if dry_run else ''}")
+
+    scan_kwargs = {
+        "ProjectionExpression": "promptId, isActive, projectId, createdAt, updatedAt, activeFlag, activeSortKey"
+    }
+    scanned = activated = deactivated = 0
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get("Items", []):
+            # 번들 포인터(bundle#active) 등 카드가 아닌 항목은 제외
+            if item["promptId"].startswith("bundle#"):
+                continue
+            scanned += 1
+            is_active = item.get("isActive", True) is True
+            created_at = item.get("createdAt") or item.get("updatedAt") or ""
+            sort_key = item.get("activeSortKey") or f"{item.get('projectId') or GLOBAL_PROJECT}#{created_at}"
+
+            if is_active and (item.get("activeFlag") != ACTIVE_FLAG or not item.get("activeSortKey")):
+                activated += 1
+                if not dry_run:
+                    table.update_item(
+                        Key={"promptId": item["promptId"]},
+                        UpdateExpression="SET activeFlag = :flag, activeSortKey = :sort_key",
+                        ExpressionAttributeValues={":flag": ACTIVE_FLAG, ":sort_key": sort_key}
+                    )
+            elif not is_active and (item.get("activeFlag") or not item.get("activeSortKey")):
+                deactivated += 1
+                if not dry_run:
+                    table.update_item(
+                        Key={"promptId": item["promptId"]},
+                        UpdateExpression="SET activeSortKey = :sort_key REMOVE activeFlag",
+                        ExpressionAttributeValues={":sort_key": sort_key}
+                    )
+
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last_key
+
+    print(f"✅ 완료: 전체 {scanned}개, 활성 인덱스 추가 {activated}개, 인덱스 제외 {deactivated}개")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    backfill_active_index(sys.argv[1], dry_run="--dry-run" in sys.argv[2:])
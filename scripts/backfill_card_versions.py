@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+프롬프트 카드 버전 이력 백필 스크립트
+- 버전 이력 도입 전에 만들어진 카드(version이 없는 카드)의 현재 내용을 버전 1로 기록하고 메타 항목의 version을 1로 설정
+- 배포 후 한 번 실행 (이미 버전이 있는 카드는 건너뛰므로 여러 번 실행해도 결과가 같음)
+
+사용법: python scripts/backfill_card_versions.py <prompt-meta-table-name> <prompt-versions-table-name> [--dry-run]
+"""
+import sys
+from datetime import datetime, timezone
+
+import boto3
+from botocore.exceptions import ClientError
+
+# 버전 항목에 복사하는 카드 속성 (lambda/shared/python/card_versions.py와 동일)
+VERSION_ATTRIBUTES = ("title", "content", "s3Key", "contentBytes", "threshold", "relevanceThreshold", "selectionMode", "tags")
+
+
+def backfill_card_versions(meta_table_name, versions_table_name, dry_run=False):
+    dynamodb = boto3.resource("dynamodb")
+    meta_table = dynamodb.Table(meta_table_name)
+    versions_table = dynamodb.Table(versions_table_name)
+    print(f"\n🔧 카드 버전 이력 백필 시작: {meta_table_name} → {versions_table_name}{' (dry-run)' if dry_run else ''}")
+
+    scan_kwargs = {}
+    scanned = created = skipped = 0
+    while True:
+        response = meta_table.scan(**scan_kwargs)
+        for item in response.get("Items", []):
+            # 번들 포인터(bundle#active) 등 카드가 아닌 항목은 제외
+            if item["promptId"].startswith("bundle#"):
+                continue
+            scanned += 1
+            if item.get("version") is not None:
+                skipped += 1
+                continue
+
+            created += 1
+            if dry_run:
+                continue
+            version_item = {
+                "promptId": item["promptId"],
+                "version": 1,
+                **{name: item[name] for name in VERSION_ATTRIBUTES if item.get(name) is not None},
+                "createdAt": item.get("updatedAt") or datetime.now(timezone.utc).isoformat()
+            }
+            if item.get("adminId"):
+                version_item["adminId"] = item["adminId"]
+            # 백필 도중 카드가 수정되어 이미 버전 1이 생겼으면 그 버전을 그대로 둠
+            try:
+                versions_table.put_item(Item=version_item, ConditionExpression="attribute_not_exists(promptId)")
+                meta_table.update_item(
+                    Key={"promptId": item["promptId"]},
+                    UpdateExpression="SET version = :version",
+                    ConditionExpression="attribute_not_exists(version)",
+                    ExpressionAttributeValues={":version": 1}
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last_key
+
+    print(f"✅ 완료: 전체 {scanned}개, 버전 1 기록 {created}개, 이미 버전 있음 {skipped}개")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    backfill_card_versions(sys.argv[1], sys.argv[2], dry_run="--dry-run" in sys.argv[3:])
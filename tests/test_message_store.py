@@ -0,0 +1,106 @@
+"""
+대화 메시지 저장소 테스트
+- cdk/bedrock_stack.py의 Messages/Conversations 테이블 키 정의를 그대로 읽어 moto 테이블을 만들고 실제 Query/UpdateItem을 실행
+- 실행: pip install boto3 "moto[dynamodb]" pytest && python -m pytest -q tests
+"""
+import ast
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+moto = pytest.importorskip("moto")
+boto3 = pytest.importorskip("boto3")
+
+ROOT = Path(__file__).resolve().parents[1]
+STACK_PATH = ROOT / "cdk" / "bedrock_stack.py"
+sys.path.insert(0, str(ROOT / "lambda" / "websocket"))
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+ATTRIBUTE_TYPES = {"STRING": "S", "NUMBER": "N", "BINARY": "B"}
+
+
+def cdk_key_schema(construct_id):
+    """CDK 스택 소스에서 dynamodb.Table(self, construct_id, ...)의 키 정의 추출"""
+    tree = ast.parse(STACK_PATH.read_text(encoding="utf-8"))
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "Table"):
+            continue
+        if len(node.args) < 2 or getattr(node.args[1], "value", None) != construct_id:
+            continue
+        keywords = {keyword.arg: keyword.value for keyword in node.keywords}
+        key_schema, definitions = [], []
+        for argument, key_type in (("partition_key", "HASH"), ("sort_key", "RANGE")):
+            if argument not in keywords:
+                continue
+            attribute = {keyword.arg: keyword.value for keyword in keywords[argument].keywords}
+            name = attribute["name"].value
+            key_schema.append({"AttributeName": name, "KeyType": key_type})
+            definitions.append({"AttributeName": name, "AttributeType": ATTRIBUTE_TYPES[attribute["type"].attr]})
+        return key_schema, definitions
+    raise AssertionError(f"CDK 스택에 {construct_id} 테이블이 없습니다")
+
+
+def create_table(dynamodb, construct_id, name):
+    key_schema, definitions = cdk_key_schema(construct_id)
+    return dynamodb.create_table(
+        TableName=name,
+        KeySchema=key_schema,
+        AttributeDefinitions=definitions,
+        BillingMode="PAY_PER_REQUEST"
+    )
+
+
+@pytest.fixture
+def tables():
+    with moto.mock_aws():
+        import message_store
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        yield (
+            message_store,
+            create_table(dynamodb, "ConversationsTable", "conversations"),
+            create_table(dynamodb, "MessagesTable", "messages")
+        )
+
+
+def test_history_round_trip_against_cdk_schema(tables):
+    message_store, _, messages_table = tables
+    long_text = "긴 메시지 " * 5000
+    for index, (role, content) in enumerate([("user", "안녕하세요"), ("assistant", long_text), ("user", "다음 질문")]):
+        messages_table.put_item(Item=message_store.build_message_item(
+            "conv-1", f"2026-01-01T00:00:0{index}+00:00", role, content, 1, 0
+        ))
+
+    history = message_store.query_message_history(messages_table, "conv-1", limit=2)
+    assert history == [
+        {"role": "assistant", "content": long_text},
+        {"role": "user", "content": "다음 질문"}
+    ]
+    previews = message_store.query_message_previews(messages_table, "conv-1")
+    assert [item["role"] for item in previews] == ["user", "assistant", "user"]
+
+
+def test_history_only_for_conversation_owner(tables):
+    message_store, conversations_table, messages_table = tables
+    messages_table.put_item(Item=message_store.build_message_item(
+        "conv-1", "2026-01-01T00:00:00+00:00", "user", "비밀", 1, 0
+    ))
+
+    assert message_store.record_conversation_activity(conversations_table, "conv-1", "alice", 5, "2026-01-01")
+    assert message_store.record_conversation_activity(conversations_table, "conv-1", "alice", 5, "2026-01-02")
+    assert not message_store.record_conversation_activity(conversations_table, "conv-1", "mallory", 5, "2026-01-03")
+
+    owner_item = conversations_table.get_item(Key={"conversation_id": "conv-1"})["Item"]
+    assert owner_item["user_id"] == "alice"
+    assert owner_item["tokenSum"] == 10
+
+    assert message_store.query_owned_message_history(conversations_table, messages_table, "conv-1", "alice") == [
+        {"role": "user", "content": "비밀"}
+    ]
+    assert message_store.query_owned_message_history(conversations_table, messages_table, "conv-1", "mallory") is None
+    assert message_store.query_owned_message_history(conversations_table, messages_table, "conv-2", "alice") is None
+    assert message_store.query_owned_message_history(conversations_table, messages_table, "conv-1", None) is None